@@ -1,112 +1,309 @@
-from flask import Flask, render_template, request, redirect, flash, jsonify
-import psycopg2
-import pandas as pd
-from datetime import datetime
-from fuzzywuzzy import fuzz, process
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_groq import ChatGroq
+import time
+_process_started = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, redirect, flash, jsonify, session, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import uuid
 from functions import (
-    fetch_store_priceline,
-    fetch_store_skyscanner,
-    fetch_store_train,
-    fetch_store_tripadvisor,
-    fetch_store_buses
+    chat_cache,
+    chat_llm,
+    chat_memory,
+    configfile,
+    consolidation,
+    db_pool,
+    fanout,
+    freshness,
+    intent_router,
+    llm_gateway,
+    migrationpipeline,
+    prefetch,
+    providers,
+    scheduler,
+    schema,
+    search,
+    singleflight
 )
+from functions.city_index import get_city_index
+from functions.result_cache import result_cache
+from functions.scheduler import provider_scheduler
+from functions.startup import StartupTimer
+
+startup_timer = StartupTimer(started=_process_started)
+startup_timer.record("imports", _process_started)
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
 
-# Database connection details
-DB_NAME = "TransitGlobal"
-DB_USER = "postgres"
-DB_PASS = "0000"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-
-REMOTE_DB_NAME = "TrainDB"
-REMOTE_DB_USER = "postgres"
-REMOTE_DB_PASS = "root"
-REMOTE_DB_HOST = "192.168.42.185"
-REMOTE_DB_PORT = "5432"
-
-BUS_DB_NAME = "BUS_DATA"
-BUS_DB_USER = "postgres"
-BUS_DB_PASS = "2301"
-BUS_DB_HOST = "192.168.42.113"
-BUS_DB_PORT = "5432"
+# Logical database names (connection settings live in functions/configfile.py)
+FLIGHT_DB = search.FLIGHT_DB
+TRAIN_DB = search.TRAIN_DB
+BUS_DB = search.BUS_DB
 
 # Database connection functions
-def get_db_connection(db_name, db_user, db_pass, db_host, db_port):
-    try:
-        return psycopg2.connect(
-            dbname=db_name,
-            user=db_user,
-            password=db_pass,
-            host=db_host,
-            port=db_port
-        )
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
-        raise
-
 def get_flight_db_connection():
-    return get_db_connection(DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT)
+    return db_pool.connection(FLIGHT_DB)
 
 def get_train_db_connection():
-    return get_db_connection(REMOTE_DB_NAME, REMOTE_DB_USER, REMOTE_DB_PASS, REMOTE_DB_HOST, REMOTE_DB_PORT)
+    return db_pool.connection(TRAIN_DB)
 
 def get_bus_db_connection():
-    return get_db_connection(BUS_DB_NAME, BUS_DB_USER, BUS_DB_PASS, BUS_DB_HOST, BUS_DB_PORT)
+    return db_pool.connection(BUS_DB)
+
+@app.route('/api/dbPoolStats', methods=['GET'])
+def fetch_db_pool_stats():
+    return jsonify(db_pool.pool_stats()), 200
+
+@app.route('/api/trainMigrationStatus', methods=['GET'])
+def fetch_train_migration_status():
+    return jsonify(migrationpipeline.migration_status()), 200
+
+@app.route('/api/consolidationStatus', methods=['GET'])
+def fetch_consolidation_status():
+    return jsonify(consolidation.consolidation_status()), 200
+
+@app.route('/api/singleFlightStats', methods=['GET'])
+def fetch_single_flight_stats():
+    return jsonify(provider_calls.stats()), 200
+
+@app.route('/api/schedulerStats', methods=['GET'])
+def fetch_scheduler_stats():
+    return jsonify(provider_scheduler.stats()), 200
+
+@app.route('/api/revalidationStats', methods=['GET'])
+def fetch_revalidation_stats():
+    return jsonify(freshness.revalidator.stats()), 200
+
+@app.route('/api/prefetchStatus', methods=['GET'])
+def fetch_prefetch_status():
+    return jsonify(prefetch.prefetch_status()), 200
+
+@app.route('/api/startupReport', methods=['GET'])
+def fetch_startup_report():
+    report = startup_timer.report()
+    report["deferred_ms"].update({f"provider:{name}": ms for name, ms in providers.load_times().items()})
+    return jsonify(report), 200
+
+# The LLM client is built on the first chatbot request, not at import
+_chat_llm = None
+_chat_llm_lock = threading.Lock()
+
+def get_chat_llm():
+    global _chat_llm
+    if _chat_llm is None:
+        with _chat_llm_lock:
+            if _chat_llm is None:
+                started = time.perf_counter()
+                _chat_llm = chat_llm.make_chat_llm()
+                startup_timer.record_deferred("llm", started)
+    return _chat_llm
+
+# Chatbot model calls run on their own bounded pool so a burst of chat
+# traffic queues (or is turned away) there instead of holding up searches
+chat_gateway = llm_gateway.LLMGateway(get_chat_llm)
+
+@app.route('/api/llmGatewayStats', methods=['GET'])
+def fetch_llm_gateway_stats():
+    return jsonify(chat_gateway.stats()), 200
+
+# Each visitor gets their own bounded conversation memory
+chat_sessions = chat_memory.ChatMemoryStore(summarizer=chat_memory.llm_summarizer(lambda: chat_gateway))
+
+def get_chat_session_id():
+    """
+    Identify the visitor's conversation through the signed session cookie.
+    """
+    if "chat_id" not in session:
+        session["chat_id"] = uuid.uuid4().hex
+    return session["chat_id"]
 
-# Initialize LLM
-llm = ChatGroq(
-    temperature=0,
-    groq_api_key='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',
-    model_name="llama-3.1-70b-versatile"
-)
+# Time to first token and total time of chatbot turns
+chat_latency = chat_llm.ChatLatency()
+
+# Answers to context-free questions, reused for exact and near-duplicate repeats
+chat_responses = chat_cache.ChatResponseCache()
+
+@app.route('/api/chatCacheStats', methods=['GET'])
+def fetch_chat_cache_stats():
+    return jsonify(chat_responses.stats()), 200
+
+@app.route('/api/chatMemoryStats', methods=['GET'])
+def fetch_chat_memory_stats():
+    return jsonify(chat_sessions.stats()), 200
+
+@app.route('/api/chatLatencyStats', methods=['GET'])
+def fetch_chat_latency_stats():
+    return jsonify(chat_latency.stats()), 200
+
+# Per-intent request counts and latency of the chatbot
+intent_metrics = intent_router.IntentMetrics()
+
+@app.route('/api/chatIntentStats', methods=['GET'])
+def fetch_chat_intent_stats():
+    return jsonify(intent_metrics.stats()), 200
+
+def wants_stream(payload):
+    return bool(payload.get("stream")) or request.accept_mimetypes.best == "text/event-stream"
+
+def cached_chat_response(chat, user_input):
+    """
+    Look up a cached answer unless the question is a follow-up that depends
+    on this session's conversation. Returns (response, match, cacheable),
+    where match is "exact", "semantic", "BYPASS" or None on a miss.
+
+    The cache is shared by every visitor, so a reply is only cacheable when
+    the session has no turns or summary yet: otherwise the prompt carried
+    this visitor's conversation and the reply may depend on it.
+    """
+    if not configfile.CHAT_CACHE_ENABLED:
+        return None, None, False
+    if chat_cache.is_follow_up(user_input, chat):
+        chat_responses.record_bypass()
+        return None, "BYPASS", False
+    response, match = chat_responses.lookup(user_input)
+    with chat.lock:
+        cacheable = not (chat.turns or chat.summary)
+    return response, match, cacheable
+
+def database_answer(intent):
+    """
+    Answer a fare or schedule question from the listing tables, or None to
+    let the LLM take it if the lookup fails.
+    """
+    if intent.name not in (intent_router.FARE, intent_router.SCHEDULE):
+        return None
+    try:
+        return intent_router.answer(intent, listing_rows)
+    except Exception as e:
+        print(f"Error answering {intent.name} question from the database: {e}")
+        return None
 
-# Initialize memory
-memory = ConversationBufferMemory()
+CHAT_BUSY_MESSAGE = "The travel assistant is busy right now. Please try again in a few seconds."
+CHAT_TIMEOUT_MESSAGE = "The travel assistant took too long to answer. Please try again."
 
-# Create Chatbot
-travel_chatbot = ConversationChain(llm=llm, memory=memory)
+def chat_busy_response():
+    response = jsonify({"response": CHAT_BUSY_MESSAGE})
+    response.headers["Retry-After"] = "2"
+    return response, 503
 
-# Define Travel-Related Filter
-def is_travel_related(query):
-    travel_keywords = [
-        "flight", "hotel", "train", "bus",
-        "accommodation", "trip", "destination",
-        "visa", "itinerary"
-    ]
-    return any(keyword in query.lower() for keyword in travel_keywords)
+def chat_stream_response(chat, user_input, intent, received, answer=None, kind="streamed",
+                         cache_match=None, cacheable=False):
+    """
+    Stream a chatbot reply as server-sent events: a `token` event per piece
+    of text as the model produces it (or one for an answer that is already
+    known), then `done` with the timings, or `error` if generation fails
+    part-way.
+    """
+    started = time.perf_counter()
+    # Admission happens here, so a full gateway answers 503 before any event
+    pieces = [answer] if answer is not None else chat_llm.stream_text(chat_gateway, chat.messages(user_input))
+
+    def generate():
+        first_token = None
+        parts = []
+        try:
+            for text in pieces:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                parts.append(text)
+                yield sse_event("token", app.json.dumps({"text": text}).encode("utf-8"))
+        except llm_gateway.GatewayTimeout:
+            chat_latency.record("failed", time.perf_counter() - started)
+            yield sse_event("error", app.json.dumps({"response": CHAT_TIMEOUT_MESSAGE}).encode("utf-8"))
+            return
+        except Exception as e:
+            print(f"Error streaming chatbot response: {e}")
+            chat_latency.record("failed", time.perf_counter() - started)
+            yield sse_event("error", app.json.dumps(
+                {"response": "An error occurred while processing your request."}).encode("utf-8"))
+            return
+        elapsed = time.perf_counter() - started
+        chat_latency.record(kind, elapsed, first_token)
+        intent_metrics.record(intent.name, time.perf_counter() - received)
+        yield sse_event("done", app.json.dumps({
+            "first_token_ms": round((first_token or elapsed) * 1000, 1),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "intent": intent.name,
+            "cache": cache_match or "MISS",
+        }).encode("utf-8"))
+        response = "".join(parts)
+        if cacheable and answer is None:
+            chat_responses.store(user_input, response)
+        chat_sessions.add_turn(chat, user_input, response)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 @app.route("/chatbot", methods=["GET", "POST"])
 def chatbot():
+    """
+    Chat with the travel assistant. POST {"message": ...} answers with the
+    whole reply as JSON; add "stream": true (or send Accept:
+    text/event-stream) to receive it token by token over SSE instead.
+
+    Fare and schedule questions naming a route ("cheapest flight from Delhi
+    to Goa on 24 Dec") are answered from the listing tables; only
+    open-ended travel questions reach the LLM, through the bounded chat
+    gateway. When its queue is full the reply is a 503 with Retry-After.
+    """
     if request.method == "POST":
-        user_input = request.json.get("message", "")
+        received = time.perf_counter()
+        payload = request.get_json(silent=True) or {}
+        user_input = payload.get("message", "").strip()
         if not user_input:
             return jsonify({"response": "Please provide a valid input."}), 400
 
-        if is_travel_related(user_input):
-            try:
-                response = travel_chatbot.invoke({"input": user_input})
-                return jsonify({"response": response.get("response", "No response available")}), 200
-            except Exception as e:
-                print(f"Error in chatbot route: {e}")
-                return jsonify({"response": "An error occurred while processing your request."}), 500
-        else:
+        intent = intent_router.classify(user_input)
+        if intent.name == intent_router.OFF_TOPIC:
+            intent_metrics.record(intent.name, time.perf_counter() - received)
             return jsonify({"response": "I can only assist with travel-related queries like flights, hotels, or itineraries."}), 400
 
-    return render_template("chatbot.html")
+        chat = chat_sessions.get(get_chat_session_id())
+        answer = database_answer(intent)
+        if answer is not None:
+            kind, cache_match, cacheable = "database", None, False
+        else:
+            answer, cache_match, cacheable = cached_chat_response(chat, user_input)
+            kind = "cached" if answer is not None else None
+        if wants_stream(payload):
+            try:
+                return chat_stream_response(chat, user_input, intent, received, answer,
+                                            kind or "streamed", cache_match, cacheable)
+            except llm_gateway.GatewayBusy:
+                chat_latency.record("failed", 0.0)
+                return chat_busy_response()
+        started = time.perf_counter()
+        try:
+            response = answer
+            if response is None:
+                response = chat_gateway.invoke(chat.messages(user_input)).content
+                if cacheable:
+                    chat_responses.store(user_input, response)
+            chat_sessions.add_turn(chat, user_input, response)
+            chat_latency.record(kind or "blocking", time.perf_counter() - started)
+            intent_metrics.record(intent.name, time.perf_counter() - received)
+            return jsonify({"response": response or "No response available",
+                            "intent": intent.name,
+                            "cache": cache_match or "MISS"}), 200
+        except llm_gateway.GatewayBusy:
+            chat_latency.record("failed", time.perf_counter() - started)
+            return chat_busy_response()
+        except llm_gateway.GatewayTimeout:
+            chat_latency.record("failed", time.perf_counter() - started)
+            return jsonify({"response": CHAT_TIMEOUT_MESSAGE}), 504
+        except Exception as e:
+            print(f"Error in chatbot route: {e}")
+            chat_latency.record("failed", time.perf_counter() - started)
+            return jsonify({"response": "An error occurred while processing your request."}), 500
 
-# Load airport data
-airport_df = pd.read_csv('assets/airport_data.csv', usecols=['city', 'airport_code', 'railway_station_code'])
+    return render_template("chatbot.html")
 
 def get_close_city(user_city):
-    city_list = airport_df['city'].tolist()
-    result = process.extractOne(user_city.strip().title(), city_list, scorer=fuzz.ratio)
-    return result[0] if result and result[1] >= 50 else None
+    return get_city_index().closest_city(user_city)
 
 @app.route('/api/getClosestCity', methods=['GET'])
 def get_closest_city():
@@ -119,31 +316,17 @@ def get_closest_city():
     if not user_city:
         return jsonify({"error": "user_city parameter is required"}), 400
 
-    # Get the list of cities from the dataframe
-    city_list = airport_df['city'].tolist()
-
-    # Perform fuzzy matching
-    result = process.extractOne(user_city, city_list, scorer=fuzz.ratio)
-
-    # Check if a result was found and the score is acceptable
-    if result and result[1] >= 50:
-        return jsonify({"closest_city": result[0]}), 200
+    closest_city = get_close_city(user_city)
+    if closest_city:
+        return jsonify({"closest_city": closest_city}), 200
     else:
         return jsonify({"error": "No closely matching city found"}), 404
     
 def get_airport_code(user_city):
-    closest_city = get_close_city(user_city)
-    if closest_city:
-        result = airport_df[airport_df['city'] == closest_city]['airport_code']
-        return result.iloc[0] if not result.empty else None
-    return None
+    return get_city_index().airport_code(user_city)
 
 def get_railway_station_code(user_city):
-    closest_city = get_close_city(user_city)
-    if closest_city:
-        result = airport_df[airport_df['city'] == closest_city]['railway_station_code']
-        return result.iloc[0] if not result.empty else None
-    return None
+    return get_city_index().railway_station_code(user_city)
 
 @app.route('/api/getAirportCode', methods=['GET'])
 def fetch_airport_code():
@@ -167,10 +350,53 @@ def fetch_railway_station_code():
         return jsonify({'city_name': user_city, 'railway_station_code': station_code}), 200
     return jsonify({'error': f'No matching railway station code found for "{user_city}"'}), 404
 
+# Maximum number of cities accepted by a single /api/resolve call
+MAX_RESOLVE_CITIES = 50
+
+def resolve_city(user_city):
+    """
+    Resolve a user-supplied city into its canonical name, airport codes and
+    railway station codes in a single lookup.
+    """
+    match = get_city_index().resolve(user_city)
+    if not match:
+        return {"query": user_city, "error": f'No closely matching city found for "{user_city}"'}
+    return {
+        "query": user_city,
+        "city": match.city,
+        "airport_code": match.airport_code,
+        "airport_codes": list(match.airport_codes),
+        "railway_station_code": match.railway_station_code,
+        "railway_station_codes": list(match.railway_station_codes),
+    }
+
+@app.route('/api/resolve', methods=['GET', 'POST'])
+def resolve_cities():
+    """
+    Resolve any number of city names in one round trip.
+
+    Accepts repeated `city` query parameters (GET) or a JSON body of the form
+    {"cities": [...]} (POST). Results are returned in request order.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        cities = payload.get("cities", [])
+        if not isinstance(cities, list):
+            return jsonify({"error": "cities must be a list of city names"}), 400
+    else:
+        cities = request.args.getlist('city')
+
+    cities = [str(city or "").strip() for city in cities]
+    if not any(cities):
+        return jsonify({"error": "At least one city is required"}), 400
+    if len(cities) > MAX_RESOLVE_CITIES:
+        return jsonify({"error": f"At most {MAX_RESOLVE_CITIES} cities can be resolved per request"}), 400
+
+    return jsonify({"results": [resolve_city(city) for city in cities]}), 200
+
 # Function to get the city name from the airport code
 def get_city_from_airport_code(airport_code):
-    result = airport_df[airport_df['airport_code'] == airport_code]['city']
-    return result.iloc[0] if not result.empty else None
+    return get_city_index().city_for_airport(airport_code)
 
 @app.route('/api/getCityFromAirportCode', methods=['GET'])
 def fetch_city_from_airport_code():
@@ -183,6 +409,96 @@ def fetch_city_from_airport_code():
         return jsonify({'airport_code': airport_code, 'city_name': city_name}), 200
     return jsonify({'error': f'No matching city found for airport code "{airport_code}"'}), 404
 
+def parse_code_list(param):
+    """
+    Read a list of codes given either as repeated query parameters or as a
+    single comma-separated value.
+    """
+    codes = []
+    for value in request.args.getlist(param):
+        codes.extend(code.strip().upper() for code in value.split(',') if code.strip())
+    return list(dict.fromkeys(codes))
+
+@app.route('/api/getCitiesFromCodes', methods=['GET'])
+def fetch_cities_from_codes():
+    """
+    Bulk reverse lookup of city names for airport and/or railway station codes.
+    """
+    airport_codes = parse_code_list('airport_codes')
+    station_codes = parse_code_list('railway_station_codes')
+    if not airport_codes and not station_codes:
+        return jsonify({'error': 'airport_codes or railway_station_codes is required'}), 400
+    if len(airport_codes) + len(station_codes) > MAX_RESOLVE_CITIES * 4:
+        return jsonify({'error': 'Too many codes in one request'}), 400
+
+    city_index = get_city_index()
+    return jsonify({
+        'airport_codes': {code: city_index.city_for_airport(code) for code in airport_codes},
+        'railway_station_codes': {code: city_index.city_for_station(code) for code in station_codes},
+    }), 200
+
+def cache_json(cache_key, data, fetched_at=None):
+    """
+    Serialize a listing response once and store the bytes in the result
+    cache, together with when the rows were last fetched from a provider.
+    """
+    payload = app.json.dumps(data).encode("utf-8")
+    result_cache.set(cache_key, (payload, fetched_at))
+    return payload
+
+def cached_json_response(payload, cache_status):
+    response = Response(payload, status=200, mimetype="application/json")
+    response.headers["X-Cache"] = cache_status
+    return response
+
+def listing_entry(mode, source, destination, journey_date, cache_empty=True):
+    """
+    Return (payload, fetched_at, cache_status) for a listing query, where
+    payload is the serialized JSON array of rows and fetched_at the latest
+    provider fetch among them, served from the result cache when possible.
+    """
+    cache_key = result_cache.make_key(mode, source, destination, journey_date)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached + ("HIT",)
+
+    data = search.LISTING_QUERIES[mode](source, destination, journey_date)
+    fetched_at = freshness.latest_fetch(data)
+    if not data and not cache_empty:
+        return app.json.dumps(data).encode("utf-8"), fetched_at, "MISS"
+    return cache_json(cache_key, data, fetched_at), fetched_at, "MISS"
+
+def listing_payload(mode, source, destination, journey_date, cache_empty=True):
+    """
+    Return (payload, cache_status) for a listing query.
+    """
+    payload, _, cache_status = listing_entry(mode, source, destination, journey_date, cache_empty)
+    return payload, cache_status
+
+def listing_freshness(mode, source, destination, journey_date):
+    """
+    Freshness of a route's stored rows, from the result cache when it holds
+    the route, so a cached route costs no database round trip.
+    """
+    try:
+        _, fetched_at, _ = listing_entry(mode, source, destination, journey_date)
+    except Exception as e:
+        print(f"Error checking {mode} freshness for {source}-{destination} on {journey_date}: {e}")
+        return freshness.MISSING
+    return freshness.classify(mode, fetched_at)
+
+def listing_rows(mode, source, destination, journey_date):
+    """
+    Listing rows decoded from the result cache, for callers that need the
+    rows rather than the response bytes.
+    """
+    payload, _ = listing_payload(mode, source, destination, journey_date)
+    return json.loads(payload)
+
+@app.route('/api/resultCacheStats', methods=['GET'])
+def fetch_result_cache_stats():
+    return jsonify(result_cache.stats()), 200
+
 @app.route('/api/flights', methods=['GET'])
 def fetch_flights():
     source = request.args.get('source_city', '').strip()
@@ -193,21 +509,8 @@ def fetch_flights():
         return jsonify({"error": "Source city, destination city, and journey date are required"}), 400
 
     try:
-        with get_flight_db_connection() as conn:
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT flight_id, source_city, destination_city, departure_timestamp,
-                        arrival_timestamp, fare, airline
-                    FROM global_flights
-                    WHERE source_city = %s AND destination_city = %s AND DATE(departure_timestamp) = %s
-                    ORDER BY departure_timestamp ASC
-                    LIMIT 50;
-                """
-                cursor.execute(query, (source, destination, journey_date))
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                data = [dict(zip(columns, row)) for row in rows]
-        return jsonify(data), 200
+        payload, cache_status = listing_payload("flight", source, destination, journey_date)
+        return cached_json_response(payload, cache_status)
     except Exception as e:
         print(f"Error fetching flights: {e}")
         return jsonify({"error": "An error occurred while fetching flight data."}), 500
@@ -222,31 +525,24 @@ def fetch_buses():
         return jsonify({"error": "Source city, destination city, and journey date are required"}), 400
 
     try:
-        with get_bus_db_connection() as conn:  # Use a function to get the bus database connection
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT id AS bus_id, source_city, destination_city, departure_time,
-                        arrival_time, total_travel_time, fare, bus_type
-                    FROM buses
-                    WHERE source_city = %s AND destination_city = %s AND DATE(departure_time) = %s
-                    ORDER BY departure_time ASC
-                    LIMIT 50;
-                """
-                cursor.execute(query, (source, destination, journey_date))
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                data = [dict(zip(columns, row)) for row in rows]
-        return jsonify(data), 200
+        payload, cache_status = listing_payload("bus", source, destination, journey_date)
+        return cached_json_response(payload, cache_status)
     except Exception as e:
         print(f"Error fetching buses: {e}")
         return jsonify({"error": "An error occurred while fetching bus data."}), 500
 
+def train_data_response(payload, cache_status):
+    return cached_json_response(b'{"train_data":' + payload + b'}', cache_status)
+
 @app.route('/api/getTrainData', methods=['GET'])
 def get_train_data():
     """
     Fetch train data for a given source, destination, and travel date.
-    If data is not found in PostgreSQL, fetch it from the external API, save to MongoDB,
-    and then transfer to PostgreSQL.
+    Stored rows are served straight away, with a background refresh queued
+    once they pass the soft TTL. If there are none, or they are past the
+    hard TTL, fetch from the external API (which writes straight to TrainDB)
+    first and nudge the background Mongo migration to pick up anything
+    staged there.
     """
     source = request.args.get('source', '').strip().upper()
     destination = request.args.get('destination', '').strip().upper()
@@ -255,102 +551,345 @@ def get_train_data():
     if not all([source, destination, travel_date]):
         return jsonify({"error": "Source, destination, and travel date are required"}), 400
 
-    try:
-        # Check if data exists in PostgreSQL
-        with get_train_db_connection() as conn:
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT train_number, train_name, source_station_code, source_city,
-                           destination_station_code, destination_city, departure_date, arrival_date,
-                           departure_time::TEXT AS departure_time, departure_day, 
-                           arrival_time::TEXT AS arrival_time, arrival_day, travel_duration, ticket_prices
-                    FROM TrainDetails
-                    WHERE source_station_code = %s
-                      AND destination_station_code = %s
-                      AND departure_date = %s
-                """
-                cursor.execute(query, (source, destination, travel_date))
-                rows = cursor.fetchall()
-
-                if rows:
-                    # Data found in PostgreSQL
-                    columns = [desc[0] for desc in cursor.description]
-                    data = [dict(zip(columns, row)) for row in rows]
-                    return jsonify({"train_data": data}), 200
-
-        # If no data found in PostgreSQL, fetch from external API
-        formatted_date = datetime.strptime(travel_date, "%Y-%m-%d").strftime("%Y%m%d")
-        train_details = fetch_store_train.fetch_train_details(source, destination, formatted_date)
-        fetch_store_train.transfer_data_to_postgres()
-
-        if not train_details:
-            return jsonify({"error": "No train details found for the given parameters"}), 404
-
-        # Transfer data to MongoDB
-        collection = fetch_store_train.get_mongo_connection()
-        if collection is not None:
-            collection.insert_many(train_details)
-            print(f"Inserted {len(train_details)} records into MongoDB.")
+    prefetch.route_popularity.record(
+        get_city_index().city_for_station(source),
+        get_city_index().city_for_station(destination),
+    )
 
-        # Transfer data from MongoDB to PostgreSQL
-        fetch_store_train.transfer_data_to_postgres()
+    try:
+        # Check if data exists in the cache or PostgreSQL
+        payload, fetched_at, cache_status = listing_entry("train", source, destination, travel_date,
+                                                          cache_empty=False)
+        if payload != b"[]":
+            state = freshness.classify("train", fetched_at)
+            if state == freshness.STALE:
+                freshness.revalidator.queue("train", source, destination, travel_date)
+            if state != freshness.EXPIRED:
+                return train_data_response(payload, cache_status)
+
+        # If no data found in PostgreSQL, or it is too old to serve, fetch from external API
+        coalesced(
+            ("train", source, destination, travel_date),
+            lambda: scheduled_fetch("train", source, destination, travel_date),
+            recheck=lambda: is_fresh("train", source, destination, travel_date),
+        )()
+        migrationpipeline.request_migration()
 
         # Fetch data from PostgreSQL to return to the user
-        with get_train_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(query, (source, destination, travel_date))
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                data = [dict(zip(columns, row)) for row in rows]
-
-        return jsonify({"train_data": data}), 200
+        payload, cache_status = listing_payload("train", source, destination, travel_date, cache_empty=False)
+        if payload == b"[]":
+            return jsonify({"error": "No train details found for the given parameters"}), 404
+        return train_data_response(payload, cache_status)
 
     except Exception as e:
         print(f"Error fetching train data: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Budget for the database queries behind /api/search, in seconds
+SEARCH_QUERY_DEADLINE = 10
+SEARCH_MODES = ("flight", "train", "bus")
+
+# Listing queries get their own threads so slow provider fetches cannot starve them
+query_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="search-query")
+
+def search_tasks(source_match, destination_match, journey_date, modes=SEARCH_MODES):
+    """
+    Build one listing task per mode for two resolved cities. Modes a city
+    has no code for are left out.
+    """
+    tasks = {}
+    for mode in modes:
+        source, destination = search.route_for_mode(mode, source_match, destination_match)
+        if source and destination:
+            tasks[mode] = (lambda m=mode, s=source, d=destination:
+                           listing_payload(m, s, d, journey_date))
+    return tasks
+
+def mode_result_json(mode, result):
+    """
+    Serialize one mode's outcome for a merged search response, splicing in
+    the cached payload bytes rather than re-serializing the rows.
+    """
+    meta = {"status": result.status, "elapsed_ms": round(result.elapsed * 1000, 1)}
+    if result.status == fanout.STATUS_OK:
+        payload, cache_status = result.value
+        meta["cache"] = cache_status
+        return app.json.dumps(meta).encode("utf-8")[:-1] + b',"data":' + payload + b'}'
+    if result.error is not None:
+        print(f"Error querying {mode} data: {result.error}")
+        meta["error"] = f"An error occurred while fetching {mode} data."
+    return app.json.dumps(meta).encode("utf-8")
+
+def parse_search_request():
+    """
+    Read and resolve the source, destination and date of a search request.
+    Returns (query, source_match, destination_match, error_response).
+    """
+    source_city = request.args.get('source_city', '').strip()
+    destination_city = request.args.get('destination_city', '').strip()
+    journey_date = request.args.get('journey_date', '').strip()
+
+    if not source_city or not destination_city or not journey_date:
+        return None, None, None, (jsonify({"error": "Source city, destination city, and journey date are required"}), 400)
+
+    source_match = get_city_index().resolve(source_city)
+    destination_match = get_city_index().resolve(destination_city)
+    if not source_match or not destination_match:
+        return None, None, None, (jsonify({"error": "Invalid city names. Please check and try again."}), 404)
+    prefetch.route_popularity.record(source_match.city, destination_match.city)
+
+    query = {
+        "journey_date": journey_date,
+        "source": resolve_city(source_city),
+        "destination": resolve_city(destination_city),
+    }
+    return query, source_match, destination_match, None
+
+@app.route('/api/search', methods=['GET'])
+def unified_search():
+    """
+    Resolve both cities once, query the flight, train and bus databases in
+    parallel and return one merged response with per-mode status and timings.
+    """
+    query, source_match, destination_match, error = parse_search_request()
+    if error:
+        return error
+
+    tasks = search_tasks(source_match, destination_match, query["journey_date"])
+    results = fanout.run_fanout(tasks, SEARCH_QUERY_DEADLINE, executor=query_executor)
+
+    parts = [b'"query":' + app.json.dumps(query).encode("utf-8")]
+    for mode in SEARCH_MODES:
+        if mode in results:
+            parts.append(app.json.dumps(mode).encode("utf-8") + b':' + mode_result_json(mode, results[mode]))
+        else:
+            parts.append(app.json.dumps(mode).encode("utf-8") + b':{"status":"skipped","data":[]}')
+    return Response(b'{' + b','.join(parts) + b'}', status=200, mimetype="application/json")
+
+# Overall budget for a search submission and per-provider budgets, in seconds
+SEARCH_DEADLINE = 25
+PROVIDER_TIMEOUTS = {
+    "train": 15,
+    "bus": 15,
+    "priceline": 20,
+    "skyscanner": 20,
+    "tripadvisor": 20,
+}
+
+# Identical concurrent provider fetches share one in-flight call
+provider_calls = singleflight.SingleFlight()
+
+def coalesced(key, fetch, recheck=None):
+    """
+    Wrap a provider fetch so concurrent searches for the same
+    (mode, source, destination, date) key share a single upstream call.
+    """
+    def run():
+        value, _ = provider_calls.do(
+            key, fetch,
+            timeout=SEARCH_DEADLINE,
+            cross_process=configfile.SINGLEFLIGHT_CROSS_PROCESS,
+            recheck=recheck,
+        )
+        return value
+    return run
+
+def scheduled_fetch(name, *args, priority=scheduler.INTERACTIVE):
+    """
+    Call a provider once the scheduler grants it a slot within its rate
+    limits, waiting at most the provider's timeout for one.
+    """
+    return provider_scheduler.run(
+        name, lambda: providers.fetch(name, *args),
+        priority=priority, timeout=PROVIDER_TIMEOUTS[name],
+    )
+
+def is_fresh(mode, source, destination, journey_date):
+    """
+    True when a route's stored rows are within the soft TTL, so a refresh
+    another process just finished need not be repeated.
+    """
+    return freshness.route_freshness(mode, source, destination, journey_date) == freshness.FRESH
+
+# Travel mode each provider refreshes
+PROVIDER_MODES = providers.PROVIDER_MODES
+
+def provider_fetch_tasks(source_match, destination_match, journey_date, modes=SEARCH_MODES,
+                         priority=scheduler.INTERACTIVE):
+    """
+    Build the coalesced provider fetches for two resolved cities, limited to
+    `modes`. Routes are keyed the way search.route_for_mode stores them, so
+    every entry point coalesces and rechecks the same route the same way.
+    Each fetch is queued with the scheduler at `priority`.
+    """
+    src_air_code, dst_air_code = search.route_for_mode("flight", source_match, destination_match)
+    sc_stn_code, dst_stn_code = search.route_for_mode("train", source_match, destination_match)
+    source_city, destination_city = search.route_for_mode("bus", source_match, destination_match)
+    flight_key = (src_air_code, dst_air_code, journey_date)
+    tasks = {
+        "train": coalesced(
+            ("train", sc_stn_code, dst_stn_code, journey_date),
+            lambda: scheduled_fetch("train", sc_stn_code, dst_stn_code, journey_date, priority=priority),
+            recheck=lambda: is_fresh("train", sc_stn_code, dst_stn_code, journey_date),
+        ),
+        "bus": coalesced(
+            ("bus", source_city, destination_city, journey_date),
+            lambda: scheduled_fetch("bus", source_city, destination_city, journey_date, priority=priority),
+            recheck=lambda: is_fresh("bus", source_city, destination_city, journey_date),
+        ),
+        "priceline": coalesced(
+            ("priceline",) + flight_key,
+            lambda: scheduled_fetch("priceline", *flight_key, priority=priority),
+        ),
+        "skyscanner": coalesced(
+            ("skyscanner",) + flight_key,
+            lambda: scheduled_fetch("skyscanner", *flight_key, priority=priority),
+        ),
+        "tripadvisor": coalesced(
+            ("tripadvisor",) + flight_key,
+            lambda: scheduled_fetch("tripadvisor", *flight_key, priority=priority),
+        ),
+    }
+    if not all(flight_key):
+        modes = [mode for mode in modes if mode != "flight"]
+    if not (sc_stn_code and dst_stn_code):
+        modes = [mode for mode in modes if mode != "train"]
+    return {name: task for name, task in tasks.items() if PROVIDER_MODES[name] in modes}
+
+def sse_event(event, payload):
+    """
+    Format one server-sent event; `payload` is already-serialized JSON bytes.
+    """
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + payload + b"\n\n"
+
+@app.route('/api/search/stream', methods=['GET'])
+def stream_search():
+    """
+    Streaming variant of /api/search using server-sent events.
+
+    Emits a `query` event with the resolved cities, then one `flight`,
+    `train` or `bus` event per mode as soon as its database query finishes.
+    Afterwards providers are refreshed (`refresh=auto` refreshes only modes
+    that came back empty, `1` refreshes all, `0` none); each provider emits a
+    `provider` event and the affected mode is re-sent with fresh rows.
+    A final `done` event closes the stream.
+    """
+    query, source_match, destination_match, error = parse_search_request()
+    if error:
+        return error
+    refresh = request.args.get('refresh', 'auto').strip().lower()
+    journey_date = query["journey_date"]
+
+    def generate():
+        yield sse_event("query", app.json.dumps(query).encode("utf-8"))
+
+        tasks = search_tasks(source_match, destination_match, journey_date)
+        empty_modes = [mode for mode in SEARCH_MODES if mode not in tasks]
+        for result in fanout.iter_fanout(tasks, SEARCH_QUERY_DEADLINE, executor=query_executor):
+            if result.status != fanout.STATUS_OK or result.value[0] == b"[]":
+                empty_modes.append(result.name)
+            yield sse_event(result.name, mode_result_json(result.name, result))
+
+        if refresh in ("1", "true", "yes"):
+            refresh_modes = SEARCH_MODES
+        elif refresh == "auto":
+            # Empty and expired modes are refreshed now, stale ones in the background
+            refresh_modes = list(empty_modes)
+            for mode in SEARCH_MODES:
+                if mode in empty_modes:
+                    continue
+                route = search.route_for_mode(mode, source_match, destination_match)
+                state = listing_freshness(mode, route[0], route[1], journey_date)
+                if state == freshness.EXPIRED:
+                    refresh_modes.append(mode)
+                elif state == freshness.STALE:
+                    freshness.revalidator.queue(mode, route[0], route[1], journey_date)
+        else:
+            refresh_modes = []
+
+        providers = provider_fetch_tasks(source_match, destination_match, journey_date, refresh_modes)
+        for result in fanout.iter_fanout(providers, SEARCH_DEADLINE, PROVIDER_TIMEOUTS):
+            mode = PROVIDER_MODES[result.name]
+            yield sse_event("provider", app.json.dumps({
+                "provider": result.name,
+                "mode": mode,
+                "status": result.status,
+                "elapsed_ms": round(result.elapsed * 1000, 1),
+            }).encode("utf-8"))
+            if result.status != fanout.STATUS_OK:
+                continue
+            refreshed = search_tasks(source_match, destination_match, journey_date, modes=(mode,))
+            for mode_result in fanout.iter_fanout(refreshed, SEARCH_QUERY_DEADLINE, executor=query_executor):
+                yield sse_event(mode, mode_result_json(mode, mode_result))
+
+        yield sse_event("done", b"{}")
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         source_city = request.form.get("source_city", "").strip()
-        src_air_code = get_airport_code(source_city)
-        sc_stn_code = get_railway_station_code(source_city)
         destination_city = request.form.get("destination_city", "").strip()
-        dst_air_code = get_airport_code(destination_city)
-        dst_stn_code = get_railway_station_code(destination_city)
         journey_date = request.form.get("journey_date", "").strip()
-        
 
         if not source_city or not destination_city or not journey_date:
             flash("All fields are required. Please fill out the form completely.")
             return redirect("/")
 
-        if not src_air_code or not dst_air_code:
+        # Resolve both cities once; every mode is keyed on the canonical match
+        source_match = get_city_index().resolve(source_city)
+        destination_match = get_city_index().resolve(destination_city)
+        if (not source_match or not destination_match
+                or not source_match.airport_code or not destination_match.airport_code):
             flash("Invalid city names. Please check and try again.")
             return redirect("/")
 
-        if get_matching_flights(src_air_code, dst_air_code, journey_date):
-            flash(f"Flight data for {source_city} to {destination_city} on {journey_date} is already available.")
-            return redirect("/results")
+        prefetch.route_popularity.record(source_match.city, destination_match.city)
+
+        # Stale-while-revalidate: serve stored rows and refresh stale ones in
+        # the background; only expired rows (or nothing at all) are fetched now
+        routes = {mode: search.route_for_mode(mode, source_match, destination_match) for mode in SEARCH_MODES}
+        states = {
+            mode: listing_freshness(mode, source, destination, journey_date)
+            for mode, (source, destination) in routes.items() if source and destination
+        }
+        available = [mode for mode, state in states.items() if state != freshness.MISSING]
+        for mode, state in states.items():
+            if state == freshness.STALE:
+                freshness.revalidator.queue(mode, *routes[mode], journey_date)
+        if available:
+            refresh_modes = [mode for mode, state in states.items() if state == freshness.EXPIRED]
+        else:
+            refresh_modes = list(states)
 
-        if get_matching_trains(sc_stn_code, dst_stn_code, journey_date):
-            flash(f"Train data for {source_city} to {destination_city} on {journey_date} is already available.")
+        if not refresh_modes:
+            flash(f"{', '.join(mode.title() for mode in available)} data for {source_city} to "
+                  f"{destination_city} on {journey_date} is already available.")
             return redirect("/results")
-        
-        if get_matching_buses(source_city, destination_city, journey_date):
-            flash(f"Train data for {source_city} to {destination_city} on {journey_date} is already available.")
-            return redirect("/results")
-        
-        try:
-            fetch_store_train.fetch_train_details(sc_stn_code, dst_stn_code, journey_date)
-            fetch_store_buses.fetch_and_insert_bus_data(source_city, destination_city, journey_date)
-            fetch_store_priceline.get_priceline_flights(src_air_code, dst_air_code, journey_date)
-            fetch_store_skyscanner.get_skyScanner_flights(src_air_code, dst_air_code, journey_date)
-            fetch_store_tripadvisor.get_tripadvisor_flights(src_air_code, dst_air_code, journey_date)
-            flash("Flight and train data fetched successfully!")
-        except Exception as e:
-            flash(f"An error occurred while fetching data: {str(e)}")
+
+        provider_tasks = provider_fetch_tasks(source_match, destination_match, journey_date, refresh_modes)
+        results = fanout.run_fanout(provider_tasks, SEARCH_DEADLINE, PROVIDER_TIMEOUTS)
+        for result in results.values():
+            print(f"Provider {result.name}: {result.status} in {result.elapsed:.2f}s"
+                  + (f" ({result.error})" if result.error else ""))
+
+        summary = fanout.summarize(results)
+        if not summary[fanout.STATUS_OK]:
+            if available:
+                flash("Could not refresh from providers in time; showing the stored results.")
+                return redirect("/results")
+            flash("An error occurred while fetching data: no provider returned results in time.")
             return redirect("/")
+        message = f"Fetched data from: {', '.join(summary[fanout.STATUS_OK])}."
+        if summary[fanout.STATUS_TIMEOUT]:
+            message += f" Timed out: {', '.join(summary[fanout.STATUS_TIMEOUT])}."
+        if summary[fanout.STATUS_FAILED]:
+            message += f" Failed: {', '.join(summary[fanout.STATUS_FAILED])}."
+        flash(message)
     return render_template("index.html")
 
 @app.route('/results', methods=['GET'])
@@ -360,106 +899,47 @@ def results():
     journey_date = request.args.get('journey_date', 'Not Selected')
     return render_template('results.html', source=source_city, destination=destination_city, date=journey_date)
 
-def get_matching_flights(source_code, destination_code, journey_date):
+_started = False
+_start_lock = threading.Lock()
+
+def start_app():
     """
-    Fetch all matching flight data from the global_flights table for the given parameters.
+    Run the one-off startup work: bring every database up to the current
+    schema and start the background jobs. Nothing here runs at import, so
+    tools and tests can import the app without touching Postgres. Call it
+    from the server's startup hook (wsgi.py does) before taking requests.
+    Only the first successful call does anything; after a failure the next
+    call tries again.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
 
-    Args:
-        source_code (str): The source airport code.
-        destination_code (str): The destination airport code.
-        journey_date (str): The journey date in YYYY-MM-DD format.
+        if configfile.SCHEMA_MIGRATE_ON_STARTUP:
+            with startup_timer.phase("schema"):
+                schema.migrate_all()
 
-    Returns:
-        list: A list of dictionaries representing the flight data. Returns an empty list if no flights are found.
-    """
-    try:
-        with get_flight_db_connection() as conn:
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT flight_id, source_city, destination_city, 
-                           departure_timestamp, arrival_timestamp, fare, airline
-                    FROM global_flights
-                    WHERE source_city = %s
-                    AND destination_city = %s
-                    AND DATE(departure_timestamp) = %s
-                    ORDER BY fare ASC;
-                """
-                cursor.execute(query, (source_code, destination_code, journey_date))
-                rows = cursor.fetchall()
-
-                # Convert rows to a list of dictionaries
-                columns = [desc[0] for desc in cursor.description]
-                flights = [dict(zip(columns, row)) for row in rows]
-
-                return flights
-    except Exception as e:
-        print(f"Error fetching flight data from database: {e}")
-        return []
+        with startup_timer.phase("background_jobs"):
+            # Move train records staged in MongoDB into TrainDB in the background
+            migrationpipeline.start_background_migration()
 
-def get_matching_trains(source_station_code, destination_station_code, travel_date):
-    """
-    Retrieve a list of trains for the given source, destination, and travel date.
-    """
-    try:
-        # Connect to the database
-        with get_train_db_connection() as conn:
-            with conn.cursor() as cursor:
-                # Query to fetch train details
-                query = """
-                    SELECT train_number, train_name, source_station_code, source_city,
-                           destination_station_code, destination_city, travel_date, ticket_prices
-                    FROM TrainDetails
-                    WHERE source_station_code = %s
-                      AND destination_station_code = %s
-                      AND travel_date = %s
-                """
-                cursor.execute(query, (source_station_code, destination_station_code, travel_date))
-                rows = cursor.fetchall()
-
-                # Get column names for creating a dictionary
-                columns = [desc[0] for desc in cursor.description]
-
-                # Return the list of trains as dictionaries
-                return [dict(zip(columns, row)) for row in rows]
-    except Exception as e:
-        print(f"Error retrieving train data: {e}")
-        return []
+            # Keep global_flights in step with the provider tables
+            consolidation.start_background_consolidation()
 
-def get_matching_buses(source_city, destination_city, journey_date):
-    """
-    Fetch all matching bus data from the buses table for the given parameters.
+            # Persist provider quota usage so it survives restarts
+            scheduler.start_quota_flush()
 
-    Args:
-        source_city (str): The source city.
-        destination_city (str): The destination city.
-        journey_date (str): The journey date in YYYY-MM-DD format.
+            # Keep the most-searched routes warm during off-peak hours
+            if configfile.PREFETCH_ENABLED:
+                prefetch.start_background_prefetch()
 
-    Returns:
-        list: A list of dictionaries representing the bus data. Returns an empty list if no buses are found.
-    """
-    try:
-        with get_bus_db_connection() as conn:  # Use a function to get the bus database connection
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT id AS bus_id, source_city, destination_city, 
-                           departure_time, arrival_time, fare, bus_type
-                    FROM buses
-                    WHERE source_city = %s
-                    AND destination_city = %s
-                    AND DATE(departure_time) = %s
-                    ORDER BY fare ASC;
-                """
-                cursor.execute(query, (source_city, destination_city, journey_date))
-                rows = cursor.fetchall()
-
-                # Convert rows to a list of dictionaries
-                columns = [desc[0] for desc in cursor.description]
-                buses = [dict(zip(columns, row)) for row in rows]
-
-                return buses
-    except Exception as e:
-        print(f"Error fetching bus data from database: {e}")
-        return []
+        startup_timer.finish()
+        _started = True
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Under the debug reloader the parent process only watches for changes;
+    # the jobs belong to the child that serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_app()
+    app.run(debug=True)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class PeriodicJob(threading.Thread):
+    """
+    Daemon thread that calls `fn` every `interval` seconds, or sooner when
+    `request_run` is called. With `interval=None` it only runs on request.
+
+    `debounce` delays a requested run briefly so a burst of requests (for
+    example several providers finishing at once) collapses into one run.
+    `fn` should return a row count, which is accumulated in `status()`.
+    """
+
+    def __init__(self, name, fn, interval=None, debounce=0.0):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.interval = interval
+        self.debounce = debounce
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._status = {"runs": 0, "total_rows": 0, "last_run": None,
+                        "last_rows": 0, "last_duration": None, "last_error": None}
+
+    def request_run(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def run(self):
+        run_now = self.interval is not None
+        while not self._stop_event.is_set():
+            if run_now:
+                self._run_once()
+            run_now = self._wake.wait(self.interval) or self.interval is not None
+            if self._wake.is_set() and self.debounce:
+                time.sleep(self.debounce)
+            self._wake.clear()
+
+    def _run_once(self):
+        started = time.monotonic()
+        error = None
+        rows = 0
+        try:
+            rows = self.fn() or 0
+        except Exception as e:
+            error = str(e)
+            print(f"Error in background job {self.name}: {e}")
+        with self._lock:
+            self._status["runs"] += 1
+            self._status["total_rows"] += rows
+            self._status["last_run"] = time.time()
+            self._status["last_rows"] = rows
+            self._status["last_duration"] = round(time.monotonic() - started, 3)
+            self._status["last_error"] = error
+
+    def status(self):
+        with self._lock:
+            status = dict(self._status)
+        status["interval"] = self.interval
+        status["running"] = self.is_alive()
+        return status
@@ -0,0 +1,228 @@
+import math
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from functions import configfile
+from functions.city_index import get_city_index
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning for matching questions against each other
+STOPWORDS = frozenset("""
+    a an the is are was were be to of in on at for from with by and or
+    what whats which who how when where why can could would should do does
+    i me my we our you your please tell know about any some there it this that
+""".split())
+
+# Wording that refers back to earlier turns ("what about there", "is it cheaper")
+_FOLLOW_UP = re.compile(
+    r"\b(it|its|they|them|there|that|those|these|same|also|instead|else|another|above|"
+    r"earlier|previous|before|again|you said|what about|how about|and then|my|mine|our)\b"
+)
+
+# Size of the hashed feature space
+FEATURE_BUCKETS = 1 << 18
+
+
+def normalize_prompt(text):
+    return " ".join(_WORD.findall((text or "").lower()))
+
+
+def _stem(word):
+    # Fold plain plurals so "flights" and "flight" share features
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def content_words(text):
+    return [word for word in _WORD.findall((text or "").lower()) if word not in STOPWORDS]
+
+
+def place_names(words):
+    """
+    Cities named in a list of words, in order. Only exact names, aliases
+    and codes count, two-word names first ("new delhi").
+    """
+    index = get_city_index()
+    places = []
+    i = 0
+    while i < len(words):
+        city = index.exact(" ".join(words[i:i + 2])) if i + 1 < len(words) else None
+        if city:
+            places.append(city)
+            i += 2
+            continue
+        city = index.exact(words[i])
+        if city:
+            places.append(city)
+        i += 1
+    return tuple(places)
+
+
+def signature(text):
+    """
+    What two questions must share for one's answer to serve the other: the
+    places in order (so "Delhi to Manali" is not "Manali to Delhi") and the
+    set of content words, numbers included (so "in monsoon" or another date
+    is not dropped).
+    """
+    words = content_words(text)
+    return place_names(words), frozenset(_stem(word) for word in words)
+
+
+def embed(text):
+    """
+    Hashed n-gram embedding of a question as a sparse {feature: weight}
+    vector of unit length: content words, word bigrams and character
+    trigrams, so small rewordings and typos still land close together.
+    """
+    words = [_stem(word) for word in content_words(text)]
+    features = {}
+
+    def add(token, weight):
+        bucket = zlib.crc32(token.encode("utf-8")) % FEATURE_BUCKETS
+        features[bucket] = features.get(bucket, 0.0) + weight
+
+    for i, word in enumerate(words):
+        add("w:" + word, 1.0)
+        if i:
+            add("b:" + words[i - 1] + " " + word, 0.5)
+        padded = f" {word} "
+        for j in range(len(padded) - 2):
+            add("c:" + padded[j:j + 3], 0.25)
+
+    norm = math.sqrt(sum(weight * weight for weight in features.values()))
+    return {bucket: weight / norm for bucket, weight in features.items()} if norm else {}
+
+
+def is_follow_up(message, chat=None):
+    """
+    True when a message depends on the conversation so far, so a shared
+    cached answer would be wrong for it.
+    """
+    if chat is not None and not (chat.turns or chat.summary):
+        return False
+    normalized = normalize_prompt(message)
+    return len(normalized.split()) < 3 or bool(_FOLLOW_UP.search(normalized))
+
+
+class _Entry:
+    __slots__ = ("response", "expires_at", "vector", "signature")
+
+    def __init__(self, response, expires_at, vector, signature):
+        self.response = response
+        self.expires_at = expires_at
+        self.vector = vector
+        self.signature = signature
+
+
+class ChatResponseCache:
+    """
+    Two-layer cache of chatbot answers for context-free questions.
+
+    Lookups first try the normalized question exactly, then the most
+    similar stored question by cosine similarity of hashed n-gram
+    embeddings, found through an inverted index of features (like the city
+    trigram index). A semantic match must reach `threshold` and have the
+    same `signature` as the question: the same places in the same order
+    and the same content words, numbers included. The embedding ignores
+    word order, so similarity alone would equate a route and its reverse.
+    Entries expire
+    after `ttl` seconds and the least recently used go first beyond
+    `maxsize`.
+    """
+
+    def __init__(self, ttl=None, maxsize=None, threshold=None):
+        self.ttl = configfile.CHAT_CACHE_TTL if ttl is None else ttl
+        self.maxsize = configfile.CHAT_CACHE_MAX_ENTRIES if maxsize is None else maxsize
+        self.threshold = configfile.CHAT_CACHE_SIMILARITY if threshold is None else threshold
+        self._entries = OrderedDict()  # normalized question -> _Entry
+        self._index = {}  # feature bucket -> set of normalized questions
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0,
+                       "stores": 0, "expired": 0, "evictions": 0}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for bucket in entry.vector:
+            keys = self._index.get(bucket)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[bucket]
+
+    def _similar(self, vector, signature, now):
+        scores = {}
+        for bucket, weight in vector.items():
+            for key in self._index.get(bucket, ()):
+                scores[key] = scores.get(key, 0.0) + weight * self._entries[key].vector[bucket]
+        for key, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if score < self.threshold:
+                break
+            entry = self._entries[key]
+            if entry.expires_at > now and entry.signature == signature:
+                return key, score
+        return None, 0.0
+
+    def lookup(self, question):
+        """
+        Return (response, match) for a cached answer, where match is "exact"
+        or "semantic", or (None, None) on a miss.
+        """
+        key = normalize_prompt(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return entry.response, "exact"
+
+            match, _ = self._similar(embed(question), signature(question), now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                self._stats["semantic_hits"] += 1
+                return self._entries[match].response, "semantic"
+            self._stats["misses"] += 1
+        return None, None
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def store(self, question, response):
+        key = normalize_prompt(question)
+        if not key or not response or self.ttl <= 0:
+            return
+        vector = embed(question)
+        entry = _Entry(response, time.monotonic() + self.ttl, vector, signature(question))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for bucket in vector:
+                self._index.setdefault(bucket, set()).add(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["maxsize"] = self.maxsize
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from collections import deque
+
+from functions import configfile
+
+# Number of recent chat turns kept for the latency metrics
+LATENCY_SAMPLES = 500
+
+_TOKEN = re.compile(r"\s*\S+")
+
+
+class FakeMessage:
+    __slots__ = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Local stand-in for ChatGroq with the same `invoke`/`stream` interface.
+    It answers with a canned reply built from the last question and streams
+    it word by word after `first_token_delay`, `token_delay` apart, so the
+    streaming path and its latency can be exercised without network access.
+    """
+
+    def __init__(self, first_token_delay=None, token_delay=None):
+        self.first_token_delay = (configfile.CHAT_FAKE_FIRST_TOKEN_DELAY
+                                  if first_token_delay is None else first_token_delay)
+        self.token_delay = configfile.CHAT_FAKE_TOKEN_DELAY if token_delay is None else token_delay
+
+    @staticmethod
+    def reply_for(messages):
+        question = next((content for role, content in reversed(messages) if role == "human"), "")
+        return (f"This is a placeholder answer from the local test model. You asked: "
+                f"\"{question.strip()}\". Connect the Groq backend for real travel advice.")
+
+    def stream(self, messages):
+        time.sleep(self.first_token_delay)
+        for i, match in enumerate(_TOKEN.finditer(self.reply_for(messages))):
+            if i:
+                time.sleep(self.token_delay)
+            yield FakeMessage(match.group())
+
+    def invoke(self, messages):
+        return FakeMessage("".join(chunk.content for chunk in self.stream(messages)))
+
+
+def make_chat_llm(backend=None):
+    """
+    Build the chat model for the configured backend ("groq" or "fake").
+    """
+    backend = backend or configfile.CHAT_LLM_BACKEND
+    if backend == "fake":
+        return FakeChatModel()
+    if backend == "groq":
+        from langchain_groq import ChatGroq
+
+        return ChatGroq(
+            temperature=0,
+            groq_api_key=configfile.GROQ_API_KEY,
+            model_name=configfile.GROQ_MODEL,
+        )
+    raise ValueError(f"Unknown chat backend: {backend}")
+
+
+def stream_text(llm, messages):
+    """
+    Iterate over the reply to `messages` as text pieces as the model
+    produces them, skipping empty chunks. The stream is started right away,
+    so a gateway that refuses the call raises here rather than mid-response.
+    """
+    chunks = llm.stream(messages)
+    return (text for text in (getattr(chunk, "content", chunk) for chunk in chunks) if text)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ChatLatency:
+    """
+    Time-to-first-token and total time of recent chat turns.
+    """
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self._first_token = deque(maxlen=samples)
+        self._total = deque(maxlen=samples)
+        self._turns = {"streamed": 0, "blocking": 0, "cached": 0, "database": 0, "failed": 0}
+
+    def record(self, kind, total, first_token=None):
+        with self._lock:
+            self._turns[kind] += 1
+            if kind == "failed":
+                return
+            self._total.append(total)
+            self._first_token.append(total if first_token is None else first_token)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._turns)
+            series = {"first_token_ms": sorted(self._first_token), "total_ms": sorted(self._total)}
+        for name, values in series.items():
+            stats[name] = {
+                "p50": round(_percentile(values, 0.5) * 1000, 1) if values else 0.0,
+                "p95": round(_percentile(values, 0.95) * 1000, 1) if values else 0.0,
+                "max": round(values[-1] * 1000, 1) if values else 0.0,
+            }
+        return stats
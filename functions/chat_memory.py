@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from functions import configfile
+
+SYSTEM_PROMPT = (
+    "You are TransitGuide's travel assistant. Help with flights, trains, buses, "
+    "hotels, destinations, visas and itineraries. Keep answers concise."
+)
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a travel-planning conversation. Keep the "
+    "traveller's destinations, dates, budget, preferences and open questions; "
+    "drop small talk. Answer with the summary only, in at most {words} words."
+)
+
+# Threads folding old turns into summaries, off the request path
+SUMMARY_WORKERS = 2
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for budgeting prompts (about four characters per
+    token for English), so no tokenizer has to be loaded.
+    """
+    return len(text or "") // 4 + 1
+
+
+def clip_to_tokens(text, max_tokens):
+    """
+    Cut `text` to roughly `max_tokens`, keeping the most recent part.
+    """
+    limit = max_tokens * 4
+    return text if len(text) <= limit else "..." + text[-limit:]
+
+
+def format_turns(turns):
+    return "\n".join(f"Traveller: {user}\nAssistant: {assistant}" for user, assistant in turns)
+
+
+class ChatSession:
+    """
+    One visitor's conversation: a running summary of older turns plus the
+    most recent turns verbatim.
+    """
+
+    __slots__ = ("summary", "turns", "last_used", "lock", "summarizing")
+
+    def __init__(self):
+        self.summary = ""
+        self.turns = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.summarizing = False
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(user) + estimate_tokens(assistant) for user, assistant in self.turns
+        )
+
+    def messages(self, user_input, system_prompt=SYSTEM_PROMPT):
+        """
+        Chat messages for the next turn, as (role, content) pairs.
+        """
+        system = system_prompt
+        if self.summary:
+            system += f"\n\nSummary of the conversation so far:\n{self.summary}"
+        messages = [("system", system)]
+        for user, assistant in self.turns:
+            messages.append(("human", user))
+            messages.append(("ai", assistant))
+        messages.append(("human", user_input))
+        return messages
+
+
+class ChatMemoryStore:
+    """
+    Bounded, per-session chat memory.
+
+    Each session keeps its history within `history_tokens`: once a turn
+    pushes it over, the oldest turns are folded into the session summary by
+    `summarizer(summary, turns)` until the verbatim turns fit in half the
+    budget. Folding runs on a background thread without holding the session
+    lock; the folded turns stay in the prompt until their summary is in.
+    Sessions are dropped after `idle_ttl` seconds without use, and
+    the least recently used ones go first when there are more than
+    `max_sessions`.
+    """
+
+    def __init__(self, summarizer=None, history_tokens=None, summary_tokens=None,
+                 max_sessions=None, idle_ttl=None):
+        self.summarizer = summarizer
+        self.history_tokens = history_tokens or configfile.CHAT_HISTORY_TOKENS
+        self.summary_tokens = summary_tokens or configfile.CHAT_SUMMARY_TOKENS
+        self.max_sessions = max_sessions or configfile.CHAT_MAX_SESSIONS
+        self.idle_ttl = idle_ttl or configfile.CHAT_SESSION_IDLE_TTL
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="chat-summary")
+        self._pending = 0
+        self._stats = {"created": 0, "evicted_idle": 0, "evicted_lru": 0,
+                       "summarizations": 0, "summary_failures": 0}
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used > self.idle_ttl:
+                self._stats["evicted_idle"] += 1
+            elif len(self._sessions) > self.max_sessions:
+                self._stats["evicted_lru"] += 1
+            else:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession()
+                self._stats["created"] += 1
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+        return session
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def add_turn(self, session, user_input, response):
+        """
+        Record a finished turn and, when the session is over its token
+        budget, queue its oldest turns to be folded into the summary.
+        """
+        with session.lock:
+            session.turns.append((user_input, response))
+        self._schedule_fold(session)
+
+    def _schedule_fold(self, session):
+        with session.lock:
+            if session.summarizing or session.history_tokens() <= self.history_tokens:
+                return
+            target = self.history_tokens // 2
+            tokens = session.history_tokens()
+            count = 0
+            while count < len(session.turns) - 1 and tokens > target:
+                user, assistant = session.turns[count]
+                tokens -= estimate_tokens(user) + estimate_tokens(assistant)
+                count += 1
+            if not count:
+                return
+            folded = session.turns[:count]
+            summary = session.summary
+            session.summarizing = True
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._fold, session, summary, folded)
+
+    def _fold(self, session, summary, folded):
+        new_summary = summary
+        try:
+            new_summary = self._summarize(summary, folded)
+        finally:
+            with session.lock:
+                # Only this job removes turns, so they are still at the front
+                del session.turns[:len(folded)]
+                session.summary = new_summary
+                session.summarizing = False
+            with self._lock:
+                self._pending -= 1
+        # Turns added meanwhile may have pushed the session over again
+        self._schedule_fold(session)
+
+    def _summarize(self, summary, turns):
+        if self.summarizer is not None:
+            try:
+                new_summary = self.summarizer(summary, turns)
+                with self._lock:
+                    self._stats["summarizations"] += 1
+                return clip_to_tokens(new_summary.strip(), self.summary_tokens)
+            except Exception as e:
+                print(f"Error summarizing chat history: {e}")
+                with self._lock:
+                    self._stats["summary_failures"] += 1
+        # Without a summary from the model, keep the latest folded questions
+        questions = " ".join(f"Traveller asked: {user}" for user, _ in turns)
+        return clip_to_tokens(f"{summary} {questions}".strip(), self.summary_tokens)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._sessions)
+            stats["summaries_pending"] = self._pending
+            stats["max_sessions"] = self.max_sessions
+        return stats
+
+
+def llm_summarizer(get_llm, summary_tokens=None):
+    """
+    Build a summarizer that asks the chat model to merge folded turns into
+    the running summary. `get_llm` is called lazily on first use.
+    """
+    words = int((summary_tokens or configfile.CHAT_SUMMARY_TOKENS) * 0.75)
+
+    def summarize(summary, turns):
+        prompt = f"Current summary:\n{summary or '(none)'}\n\nNew conversation:\n{format_turns(turns)}"
+        response = get_llm().invoke([("system", SUMMARY_PROMPT.format(words=words)), ("human", prompt)])
+        return getattr(response, "content", response)
+
+    return summarize
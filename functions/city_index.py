@@ -0,0 +1,257 @@
+import csv
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, namedtuple
+
+from rapidfuzz import fuzz, process
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+AIRPORT_DATA_PATH = os.path.join(ASSETS_DIR, "airport_data.csv")
+CITY_ALIASES_PATH = os.path.join(ASSETS_DIR, "city_aliases.csv")
+
+# Minimum fuzz.ratio score for a fuzzy match to be accepted
+MATCH_THRESHOLD = 50
+# Number of n-gram candidates passed on to fuzzy scoring
+CANDIDATE_LIMIT = 64
+# Number of resolved inputs remembered by the LRU
+RESOLVE_CACHE_SIZE = 4096
+
+CityMatch = namedtuple(
+    "CityMatch",
+    ["city", "airport_code", "railway_station_code", "airport_codes", "railway_station_codes", "score"],
+)
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+    """
+    Normalize a place name for lookups: strip accents, lowercase and collapse
+    punctuation and whitespace into single spaces.
+    """
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+
+def _ngrams(normalized, n=3):
+    padded = f" {normalized} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def _clean_code(value):
+    value = (value or "").strip().upper()
+    return value if value and value != "NONE" else None
+
+
+class CityIndex:
+    """
+    In-memory gazetteer that resolves free-text city names to the canonical
+    city together with its airport and railway station codes.
+
+    Exact names and aliases are answered from a dict, everything else goes
+    through a trigram candidate index before fuzzy scoring, and resolved
+    inputs are memoized in a bounded LRU.
+    """
+
+    def __init__(self, rows, aliases=None, threshold=MATCH_THRESHOLD,
+                 candidate_limit=CANDIDATE_LIMIT, cache_size=RESOLVE_CACHE_SIZE):
+        self.threshold = threshold
+        self.candidate_limit = candidate_limit
+        self.cache_size = cache_size
+
+        self._cities = []  # canonical display names, indexed by city id
+        self._normalized = []  # normalized canonical names, indexed by city id
+        self._airport_codes = []  # list of airport codes per city id
+        self._station_codes = []  # list of station codes per city id
+        self._exact = {}  # normalized name or alias -> city id
+        self._ngram_index = {}  # trigram -> list of city ids
+        self._city_by_airport = {}
+        self._city_by_station = {}
+
+        for city, airport_code, station_code in rows:
+            self._add_row(city, _clean_code(airport_code), _clean_code(station_code))
+
+        # Codes double as aliases when they identify exactly one city
+        for code_map in (self._city_by_airport, self._city_by_station):
+            for code, city_id in code_map.items():
+                if city_id is not None:
+                    self._exact.setdefault(normalize_name(code), city_id)
+
+        for alias, city in (aliases or []):
+            city_id = self._exact.get(normalize_name(city))
+            if city_id is not None:
+                self._exact.setdefault(normalize_name(alias), city_id)
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _add_row(self, city, airport_code, station_code):
+        city = (city or "").strip()
+        key = normalize_name(city)
+        if not key:
+            return
+        city_id = self._exact.get(key)
+        if city_id is None or self._normalized[city_id] != key:
+            city_id = len(self._cities)
+            self._cities.append(city)
+            self._normalized.append(key)
+            self._airport_codes.append([])
+            self._station_codes.append([])
+            self._exact[key] = city_id
+            for gram in _ngrams(key):
+                self._ngram_index.setdefault(gram, []).append(city_id)
+
+        for code, codes, code_map in (
+            (airport_code, self._airport_codes[city_id], self._city_by_airport),
+            (station_code, self._station_codes[city_id], self._city_by_station),
+        ):
+            if not code or code in codes:
+                continue
+            codes.append(code)
+            # A code shared by several cities is ambiguous, so it maps to None
+            if code_map.get(code, city_id) != city_id:
+                code_map[code] = None
+            else:
+                code_map[code] = city_id
+
+    @classmethod
+    def from_csv(cls, path=AIRPORT_DATA_PATH, aliases_path=CITY_ALIASES_PATH, **kwargs):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [
+                (row.get("city"), row.get("airport_code"), row.get("railway_station_code"))
+                for row in csv.DictReader(f)
+            ]
+        aliases = []
+        if aliases_path and os.path.exists(aliases_path):
+            with open(aliases_path, newline="", encoding="utf-8") as f:
+                aliases = [(row["alias"], row["city"]) for row in csv.DictReader(f)]
+        return cls(rows, aliases=aliases, **kwargs)
+
+    def __len__(self):
+        return len(self._cities)
+
+    @property
+    def cities(self):
+        return list(self._cities)
+
+    def _match(self, city_id, score):
+        airport_codes = tuple(self._airport_codes[city_id])
+        station_codes = tuple(self._station_codes[city_id])
+        return CityMatch(
+            self._cities[city_id],
+            airport_codes[0] if airport_codes else None,
+            station_codes[0] if station_codes else None,
+            airport_codes,
+            station_codes,
+            score,
+        )
+
+    def _candidates(self, key):
+        counts = {}
+        for gram in _ngrams(key):
+            for city_id in self._ngram_index.get(gram, ()):
+                counts[city_id] = counts.get(city_id, 0) + 1
+        if len(counts) <= self.candidate_limit:
+            return list(counts)
+        return sorted(counts, key=counts.__getitem__, reverse=True)[:self.candidate_limit]
+
+    def _fuzzy(self, key):
+        candidate_ids = self._candidates(key)
+        if candidate_ids:
+            choices = {city_id: self._normalized[city_id] for city_id in candidate_ids}
+        else:
+            # No shared trigram at all: fall back to scoring every name
+            choices = dict(enumerate(self._normalized))
+        result = process.extractOne(key, choices, scorer=fuzz.ratio, score_cutoff=self.threshold)
+        if result is None:
+            return None
+        _, score, city_id = result
+        return self._match(city_id, score)
+
+    def resolve(self, user_city):
+        """
+        Resolve a free-text city name to a CityMatch, or None if nothing
+        scores above the threshold.
+        """
+        key = normalize_name(user_city)
+        if not key:
+            return None
+
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return self._cache[key]
+            self._misses += 1
+
+        city_id = self._exact.get(key)
+        match = self._match(city_id, 100) if city_id is not None else self._fuzzy(key)
+
+        with self._cache_lock:
+            self._cache[key] = match
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return match
+
+    def exact(self, name):
+        """
+        Canonical city for an exact name, alias or unambiguous code, or None.
+        Never falls back to fuzzy matching.
+        """
+        city_id = self._exact.get(normalize_name(name))
+        return self._cities[city_id] if city_id is not None else None
+
+    def closest_city(self, user_city):
+        match = self.resolve(user_city)
+        return match.city if match else None
+
+    def airport_code(self, user_city):
+        match = self.resolve(user_city)
+        return match.airport_code if match else None
+
+    def railway_station_code(self, user_city):
+        match = self.resolve(user_city)
+        return match.railway_station_code if match else None
+
+    def city_for_airport(self, airport_code):
+        city_id = self._city_by_airport.get(_clean_code(airport_code))
+        return self._cities[city_id] if city_id is not None else None
+
+    def city_for_station(self, station_code):
+        city_id = self._city_by_station.get(_clean_code(station_code))
+        return self._cities[city_id] if city_id is not None else None
+
+    def cache_info(self):
+        with self._cache_lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._cache),
+                "maxsize": self.cache_size,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_city_index():
+    """
+    Return the process-wide CityIndex, loading the gazetteer on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CityIndex.from_csv()
+    return _index
@@ -1,4 +1,243 @@
-import psycopg2
+import os
+
+# Connection settings for every logical database the app talks to.
+# Each entry can be overridden with TRANSITGUIDE_<NAME>_HOST / _PORT / _USER / _PASSWORD.
+DATABASES = {
+    "TransitGlobal": {
+        "dbname": "TransitGlobal",
+        "user": "postgres",
+        "password": "0000",
+        "host": "localhost",
+        "port": "5432",
+    },
+    "TrainDB": {
+        "dbname": "TrainDB",
+        "user": "postgres",
+        "password": "root",
+        "host": "192.168.42.185",
+        "port": "5432",
+    },
+    "BUS_DATA": {
+        "dbname": "BUS_DATA",
+        "user": "postgres",
+        "password": "2301",
+        "host": "192.168.42.113",
+        "port": "5432",
+    },
+    "PriceLineDB": {
+        "dbname": "PriceLineDB",
+        "user": "postgres",
+        "password": "0000",
+        "host": "localhost",
+        "port": "5432",
+    },
+    "SkyScannerDB": {
+        "dbname": "SkyScannerDB",
+        "user": "postgres",
+        "password": "0000",
+        "host": "localhost",
+        "port": "5432",
+    },
+    "TripAdvisorDB": {
+        "dbname": "TripAdvisorDB",
+        "user": "postgres",
+        "password": "0000",
+        "host": "localhost",
+        "port": "5432",
+    },
+}
+
+# Pool sizing shared by every database pool
+DB_POOL_MIN_CONN = int(os.environ.get("TRANSITGUIDE_DB_POOL_MIN", "1"))
+DB_POOL_MAX_CONN = int(os.environ.get("TRANSITGUIDE_DB_POOL_MAX", "10"))
+DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("TRANSITGUIDE_DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE_SECONDS = float(os.environ.get("TRANSITGUIDE_DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME_SECONDS = float(os.environ.get("TRANSITGUIDE_DB_POOL_MAX_LIFETIME", "3600"))
+DB_POOL_HEALTH_CHECK_AFTER = float(os.environ.get("TRANSITGUIDE_DB_POOL_HEALTH_CHECK_AFTER", "5"))
+
+
+def get_database_settings(name):
+    """
+    Return the psycopg2 connection keyword arguments for a logical database,
+    applying any environment overrides.
+    """
+    if name not in DATABASES:
+        raise KeyError(f"Unknown database: {name}")
+    settings = dict(DATABASES[name])
+    prefix = f"TRANSITGUIDE_{name.upper()}_"
+    for key, env_key in (("host", "HOST"), ("port", "PORT"), ("user", "USER"), ("password", "PASSWORD")):
+        value = os.environ.get(prefix + env_key)
+        if value:
+            settings[key] = value
+    return settings
+
 
 def get_globalview_db_connection():
-    return psycopg2.connect("dbname=TransitGlobal user=postgres password=0000")
+    from functions.db_pool import connection
+    return connection("TransitGlobal")
+
+
+# Outbound provider endpoints. Point these at a local stub server to test
+# the fetchers without touching the real APIs.
+PROVIDER_BASE_URLS = {
+    "priceline": os.environ.get("TRANSITGUIDE_PRICELINE_URL", "https://priceline-com2.p.rapidapi.com"),
+    "skyscanner": os.environ.get("TRANSITGUIDE_SKYSCANNER_URL", "https://sky-scanner3.p.rapidapi.com"),
+    "tripadvisor": os.environ.get("TRANSITGUIDE_TRIPADVISOR_URL", "https://tripadvisor16.p.rapidapi.com"),
+    "train": os.environ.get("TRANSITGUIDE_TRAIN_URL", "https://railways.makemytrip.com"),
+    "bus": os.environ.get("TRANSITGUIDE_BUS_URL", "https://www.zingbus.com"),
+}
+RAPIDAPI_KEY = os.environ.get("TRANSITGUIDE_RAPIDAPI_KEY", "8523b3d236msh567ad42fd95c905p1bcbb8jsn1aa82f1b392e")
+
+# Outbound HTTP client settings
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("TRANSITGUIDE_HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("TRANSITGUIDE_HTTP_READ_TIMEOUT", "15"))
+HTTP_MAX_RESPONSE_BYTES = int(os.environ.get("TRANSITGUIDE_HTTP_MAX_RESPONSE_BYTES", str(8 * 1024 * 1024)))
+HTTP_POOL_MAXSIZE = int(os.environ.get("TRANSITGUIDE_HTTP_POOL_MAXSIZE", "10"))
+HTTP2_ENABLED = os.environ.get("TRANSITGUIDE_HTTP2", "0") == "1"
+
+# Serialize identical provider fetches across worker processes with Postgres advisory locks
+SINGLEFLIGHT_CROSS_PROCESS = os.environ.get("TRANSITGUIDE_SINGLEFLIGHT_CROSS_PROCESS", "0") == "1"
+
+# Listing endpoint result cache: TTL in seconds per mode and maximum number of entries
+RESULT_CACHE_TTLS = {
+    "flight": int(os.environ.get("TRANSITGUIDE_CACHE_TTL_FLIGHT", "300")),
+    "bus": int(os.environ.get("TRANSITGUIDE_CACHE_TTL_BUS", "300")),
+    "train": int(os.environ.get("TRANSITGUIDE_CACHE_TTL_TRAIN", "600")),
+}
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSITGUIDE_CACHE_MAX_ENTRIES", "2048"))
+
+# MongoDB staging store for train records and the incremental Mongo -> Postgres migrator
+MONGO_URI = os.environ.get("TRANSITGUIDE_MONGO_URI", "mongodb://localhost:27017/")
+MONGO_TRAIN_DB = os.environ.get("TRANSITGUIDE_MONGO_TRAIN_DB", "TrainDatabase")
+MONGO_TRAIN_COLLECTION = os.environ.get("TRANSITGUIDE_MONGO_TRAIN_COLLECTION", "TrainDetails")
+TRAIN_MIGRATION_BATCH_SIZE = int(os.environ.get("TRANSITGUIDE_TRAIN_MIGRATION_BATCH", "1000"))
+# Seconds between background migration runs; 0 disables the background job
+TRAIN_MIGRATION_INTERVAL = float(os.environ.get("TRANSITGUIDE_TRAIN_MIGRATION_INTERVAL", "300"))
+
+# Apply pending schema migrations (functions/schema.py) when the app starts
+SCHEMA_MIGRATE_ON_STARTUP = os.environ.get("TRANSITGUIDE_SCHEMA_MIGRATE", "1") == "1"
+
+# Local time zone provider flight times are given in
+FLIGHT_TIMEZONE = os.environ.get("TRANSITGUIDE_FLIGHT_TIMEZONE", "Asia/Kolkata")
+
+# Consolidation of provider flight tables into global_flights
+CONSOLIDATION_BATCH_SIZE = int(os.environ.get("TRANSITGUIDE_CONSOLIDATION_BATCH", "5000"))
+# Rows ingested this many seconds before the watermark are re-read, to catch
+# ingest transactions that committed after a run had already moved past them
+CONSOLIDATION_OVERLAP_SECONDS = float(os.environ.get("TRANSITGUIDE_CONSOLIDATION_OVERLAP", "30"))
+# Seconds between background consolidation runs; 0 runs only when requested
+CONSOLIDATION_INTERVAL = float(os.environ.get("TRANSITGUIDE_CONSOLIDATION_INTERVAL", "60"))
+CONSOLIDATION_LOCK_TIMEOUT = float(os.environ.get("TRANSITGUIDE_CONSOLIDATION_LOCK_TIMEOUT", "2"))
+
+# Exchange rate for providers that quote fares in US dollars
+USD_TO_INR = float(os.environ.get("TRANSITGUIDE_USD_TO_INR", "84.46"))
+
+# Chatbot LLM (built on the first /chatbot request)
+GROQ_API_KEY = os.environ.get("TRANSITGUIDE_GROQ_API_KEY", "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")
+GROQ_MODEL = os.environ.get("TRANSITGUIDE_GROQ_MODEL", "llama-3.1-70b-versatile")
+
+# Cold-start budget in seconds reported by /api/startupReport
+STARTUP_BUDGET_SECONDS = float(os.environ.get("TRANSITGUIDE_STARTUP_BUDGET", "2"))
+
+# Provider rate limits. Providers sharing an upstream key share a bucket:
+# rate is sustained requests/second, burst the bucket size, quota the number
+# of calls allowed per quota_period ("day" or "month"; 0 means unlimited).
+RATE_BUCKETS = {
+    "rapidapi": {
+        "rate": float(os.environ.get("TRANSITGUIDE_RAPIDAPI_RATE", "2")),
+        "burst": int(os.environ.get("TRANSITGUIDE_RAPIDAPI_BURST", "5")),
+        "quota": int(os.environ.get("TRANSITGUIDE_RAPIDAPI_QUOTA", "10000")),
+        "quota_period": os.environ.get("TRANSITGUIDE_RAPIDAPI_QUOTA_PERIOD", "month"),
+    },
+    "makemytrip": {
+        "rate": float(os.environ.get("TRANSITGUIDE_TRAIN_RATE", "1")),
+        "burst": int(os.environ.get("TRANSITGUIDE_TRAIN_BURST", "3")),
+        "quota": 0,
+        "quota_period": "day",
+    },
+    "zingbus": {
+        "rate": float(os.environ.get("TRANSITGUIDE_BUS_RATE", "2")),
+        "burst": int(os.environ.get("TRANSITGUIDE_BUS_BURST", "4")),
+        "quota": 0,
+        "quota_period": "day",
+    },
+}
+# Bucket and maximum concurrent calls per provider
+PROVIDER_LIMITS = {
+    "priceline": {"bucket": "rapidapi", "concurrency": 3},
+    "skyscanner": {"bucket": "rapidapi", "concurrency": 3},
+    "tripadvisor": {"bucket": "rapidapi", "concurrency": 3},
+    "train": {"bucket": "makemytrip", "concurrency": 2},
+    "bus": {"bucket": "zingbus", "concurrency": 2},
+}
+# Seconds between writes of quota usage to TransitGlobal
+QUOTA_FLUSH_INTERVAL = float(os.environ.get("TRANSITGUIDE_QUOTA_FLUSH_INTERVAL", "15"))
+
+# Background prefetch of popular routes
+PREFETCH_ENABLED = os.environ.get("TRANSITGUIDE_PREFETCH_ENABLED", "1") == "1"
+# Seconds between prefetch cycles
+PREFETCH_INTERVAL = float(os.environ.get("TRANSITGUIDE_PREFETCH_INTERVAL", "900"))
+# How many of the most-searched routes to keep warm, and for how many days ahead
+PREFETCH_TOP_ROUTES = int(os.environ.get("TRANSITGUIDE_PREFETCH_TOP_ROUTES", "20"))
+PREFETCH_DAYS = int(os.environ.get("TRANSITGUIDE_PREFETCH_DAYS", "3"))
+# Local hours ("start-end", FLIGHT_TIMEZONE) when prefetching may run; empty means any time
+PREFETCH_OFFPEAK_HOURS = os.environ.get("TRANSITGUIDE_PREFETCH_OFFPEAK_HOURS", "0-6")
+# Largest share of a bucket's quota the prefetcher may spend per quota period
+PREFETCH_QUOTA_SHARE = float(os.environ.get("TRANSITGUIDE_PREFETCH_QUOTA_SHARE", "0.25"))
+# Search counts halve after this many hours, so popularity follows recent traffic
+PREFETCH_HALF_LIFE_HOURS = float(os.environ.get("TRANSITGUIDE_PREFETCH_HALF_LIFE_HOURS", "72"))
+# Seconds a prefetch waits for a scheduler slot before skipping the provider
+PREFETCH_SLOT_TIMEOUT = float(os.environ.get("TRANSITGUIDE_PREFETCH_SLOT_TIMEOUT", "60"))
+
+# Stale-while-revalidate policy for stored listings, in seconds since a route
+# was last fetched: younger than "soft" is served as is, between "soft" and
+# "hard" is served while a background refresh runs, past "hard" is refreshed
+# before answering
+FRESHNESS_TTLS = {
+    "flight": {
+        "soft": int(os.environ.get("TRANSITGUIDE_FRESH_SOFT_FLIGHT", "1800")),
+        "hard": int(os.environ.get("TRANSITGUIDE_FRESH_HARD_FLIGHT", "21600")),
+    },
+    "train": {
+        "soft": int(os.environ.get("TRANSITGUIDE_FRESH_SOFT_TRAIN", "21600")),
+        "hard": int(os.environ.get("TRANSITGUIDE_FRESH_HARD_TRAIN", "86400")),
+    },
+    "bus": {
+        "soft": int(os.environ.get("TRANSITGUIDE_FRESH_SOFT_BUS", "3600")),
+        "hard": int(os.environ.get("TRANSITGUIDE_FRESH_HARD_BUS", "43200")),
+    },
+}
+# Worker threads and scheduler wait for background revalidation
+REVALIDATE_WORKERS = int(os.environ.get("TRANSITGUIDE_REVALIDATE_WORKERS", "2"))
+REVALIDATE_SLOT_TIMEOUT = float(os.environ.get("TRANSITGUIDE_REVALIDATE_SLOT_TIMEOUT", "60"))
+
+# Chatbot memory: per-session history is kept within CHAT_HISTORY_TOKENS,
+# older turns folded into a summary of at most CHAT_SUMMARY_TOKENS. Sessions
+# idle for CHAT_SESSION_IDLE_TTL seconds, or beyond CHAT_MAX_SESSIONS, are dropped.
+CHAT_HISTORY_TOKENS = int(os.environ.get("TRANSITGUIDE_CHAT_HISTORY_TOKENS", "1200"))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("TRANSITGUIDE_CHAT_SUMMARY_TOKENS", "250"))
+CHAT_MAX_SESSIONS = int(os.environ.get("TRANSITGUIDE_CHAT_MAX_SESSIONS", "1000"))
+CHAT_SESSION_IDLE_TTL = int(os.environ.get("TRANSITGUIDE_CHAT_SESSION_IDLE_TTL", "1800"))
+
+# Chat model backend: "groq" for the hosted model, "fake" for a local stand-in
+# that streams a canned reply (for development and load tests)
+CHAT_LLM_BACKEND = os.environ.get("TRANSITGUIDE_CHAT_LLM_BACKEND", "groq")
+CHAT_FAKE_FIRST_TOKEN_DELAY = float(os.environ.get("TRANSITGUIDE_CHAT_FAKE_FIRST_TOKEN_DELAY", "0.3"))
+CHAT_FAKE_TOKEN_DELAY = float(os.environ.get("TRANSITGUIDE_CHAT_FAKE_TOKEN_DELAY", "0.03"))
+
+# Chatbot response cache: exact and near-duplicate questions reuse a stored
+# answer for CHAT_CACHE_TTL seconds. CHAT_CACHE_SIMILARITY is the cosine
+# similarity a question needs to reuse the answer of a different wording; it
+# must also name the same places in the same order and the same content words.
+CHAT_CACHE_ENABLED = os.environ.get("TRANSITGUIDE_CHAT_CACHE_ENABLED", "1") == "1"
+CHAT_CACHE_TTL = int(os.environ.get("TRANSITGUIDE_CHAT_CACHE_TTL", "86400"))
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSITGUIDE_CHAT_CACHE_MAX_ENTRIES", "2000"))
+CHAT_CACHE_SIMILARITY = float(os.environ.get("TRANSITGUIDE_CHAT_CACHE_SIMILARITY", "0.92"))
+
+# LLM gateway: chatbot model calls run on their own pool of LLM_GATEWAY_WORKERS
+# threads with up to LLM_GATEWAY_QUEUE waiting; beyond that requests get a 503.
+# Keep workers + queue below the web server's thread count so search traffic
+# always has threads left. LLM_GATEWAY_DEADLINE bounds queueing plus generation.
+LLM_GATEWAY_WORKERS = int(os.environ.get("TRANSITGUIDE_LLM_GATEWAY_WORKERS", "4"))
+LLM_GATEWAY_QUEUE = int(os.environ.get("TRANSITGUIDE_LLM_GATEWAY_QUEUE", "8"))
+LLM_GATEWAY_DEADLINE = float(os.environ.get("TRANSITGUIDE_LLM_GATEWAY_DEADLINE", "30"))
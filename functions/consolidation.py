@@ -0,0 +1,319 @@
+import csv
+import io
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+
+from functions import configfile, db_pool
+from functions.background import PeriodicJob
+from functions.result_cache import invalidate_routes
+from functions.singleflight import advisory_lock
+
+GLOBAL_DB = "TransitGlobal"
+LOCK_KEY = ("consolidation", "global_flights")
+
+# Every provider query returns the same column layout:
+# airline, flight_number, source_code, destination_code, departure_date,
+# departure_time, arrival_date, arrival_time, duration, stops, price, ingested_at
+FLIGHT_SOURCES = {
+    "priceline": ("PriceLineDB", """
+        SELECT Airlines, Flight_Number, Source_Airport_Code, Destination_Airport_Code,
+               Departure_Date, Departure_Time, Arrival_Date, Arrival_Time,
+               Duration_of_Travel, Stop_Quantity, Price_in_INR, ingested_at
+        FROM FlightsInfo
+        WHERE ingested_at > %s
+        ORDER BY ingested_at
+    """),
+    "skyscanner": ("SkyScannerDB", """
+        SELECT Airlines, Flight_Number, Source_Airport_Code, Destination_Airport_Code,
+               Departure_Date, Departure_Time, Arrival_Date, Arrival_Time,
+               Duration_of_Travel, NULL, Price_in_INR, ingested_at
+        FROM FlightsData
+        WHERE ingested_at > %s
+        ORDER BY ingested_at
+    """),
+    "tripadvisor": ("TripAdvisorDB", """
+        SELECT Airline_Name, Flight_Number, Source_City_Airport_Code, Destination_City_Airport_Code,
+               Departure_Date_Time::DATE, Departure_Date_Time::TIME,
+               Arrival_Date_Time::DATE, Arrival_Date_Time::TIME,
+               NULL, Number_of_Stops, Price_INR, ingested_at
+        FROM FlightDetails
+        WHERE ingested_at > %s
+        ORDER BY ingested_at
+    """),
+}
+
+OFFER_COLUMNS = (
+    "source_city", "destination_city", "departure_timestamp", "flight_number", "provider",
+    "airline", "arrival_timestamp", "duration_minutes", "stops", "fare", "ingested_at",
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# Optional two-character IATA carrier code followed by the flight number
+_FLIGHT_NUMBER = re.compile(r"^(?:[A-Z]{2}|[A-Z]\d|\d[A-Z])?(\d{1,4}[A-Z]?)$")
+_local_tz = ZoneInfo(configfile.FLIGHT_TIMEZONE)
+
+
+def parse_fare(value):
+    """
+    Numeric fare from the stored price text, e.g. "₹ 1234.00" -> Decimal("1234.00").
+    """
+    if value is None:
+        return None
+    match = _NUMBER.search(str(value).replace(",", ""))
+    if not match:
+        return None
+    try:
+        return Decimal(match.group())
+    except InvalidOperation:
+        return None
+
+
+def parse_minutes(value):
+    """
+    Whole minutes from the stored duration text, e.g. "95 minutes" -> 95.
+    """
+    if value is None:
+        return None
+    match = _NUMBER.search(str(value))
+    return int(float(match.group())) if match else None
+
+
+def normalize_flight_number(value):
+    """
+    Reduce a flight number to its numeric part ("6E 0123" -> "123") so the
+    same flight matches across providers that do or don't prefix the
+    carrier code. Returns "" when there is no usable number.
+    """
+    text = re.sub(r"[\s-]", "", str(value or "")).upper()
+    if not text or text == "N/A":
+        return ""
+    match = _FLIGHT_NUMBER.match(text)
+    if match:
+        text = match.group(1)
+    return text.lstrip("0") or text
+
+
+def normalize_flight(provider, row):
+    """
+    Turn one provider row into an offer tuple in OFFER_COLUMNS order, or None
+    if it lacks the route, departure or flight number needed to place it.
+    """
+    (airline, flight_number, source, destination, dep_date, dep_time,
+     arr_date, arr_time, duration, stops, price, ingested_at) = row
+    flight_number = normalize_flight_number(flight_number)
+    if not (source and destination and dep_date and dep_time and flight_number):
+        return None
+
+    departure = datetime.combine(dep_date, dep_time, tzinfo=_local_tz)
+    arrival = None
+    if arr_time is not None:
+        arrival = datetime.combine(arr_date or dep_date, arr_time, tzinfo=_local_tz)
+        if arrival < departure:
+            arrival += timedelta(days=1)
+
+    minutes = parse_minutes(duration)
+    if minutes is None and arrival is not None:
+        minutes = int((arrival - departure).total_seconds() // 60)
+
+    return (
+        source.strip().upper(),
+        destination.strip().upper(),
+        departure.isoformat(),
+        flight_number,
+        provider,
+        airline if airline and airline != "N/A" else None,
+        arrival.isoformat() if arrival else None,
+        minutes,
+        stops,
+        parse_fare(price),
+        ingested_at.isoformat(),
+    )
+
+
+def load_watermark(provider):
+    with db_pool.connection(GLOBAL_DB) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT last_ingested_at FROM consolidation_watermarks WHERE provider = %s",
+                (provider,),
+            )
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def write_offers(provider, offers, high_water, rows_read):
+    """
+    Merge one batch of offers into flight_offers, rebuild the touched
+    global_flights rows from the cheapest offer per flight, and advance the
+    provider watermark, all in one transaction. Returns the
+    (source, destination, date) routes whose listings changed.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(offers)
+    buffer.seek(0)
+    columns = ", ".join(OFFER_COLUMNS)
+    flight_key = "source_city, destination_city, departure_timestamp, flight_number"
+
+    with db_pool.connection(GLOBAL_DB) as conn:
+        with conn.cursor() as cursor:
+            routes = []
+            if offers:
+                cursor.execute("""
+                    CREATE TEMP TABLE offers_staging
+                    (LIKE flight_offers INCLUDING DEFAULTS) ON COMMIT DROP
+                """)
+                cursor.copy_expert(f"COPY offers_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+                # Latest ingest wins for each provider's own offer
+                cursor.execute(f"""
+                    INSERT INTO flight_offers ({columns})
+                    SELECT DISTINCT ON ({flight_key}, provider) {columns}
+                    FROM offers_staging
+                    ORDER BY {flight_key}, provider, ingested_at DESC
+                    ON CONFLICT ({flight_key}, provider) DO UPDATE
+                    SET airline = EXCLUDED.airline,
+                        arrival_timestamp = EXCLUDED.arrival_timestamp,
+                        duration_minutes = EXCLUDED.duration_minutes,
+                        stops = EXCLUDED.stops,
+                        fare = EXCLUDED.fare,
+                        ingested_at = EXCLUDED.ingested_at
+                    WHERE flight_offers.ingested_at <= EXCLUDED.ingested_at
+                """)
+                # Cheapest offer across providers becomes the listed flight;
+                # fetched_at is the latest time any provider returned it
+                cursor.execute(f"""
+                    INSERT INTO global_flights (
+                        source_city, destination_city, departure_timestamp, flight_number,
+                        airline, arrival_timestamp, duration_minutes, stops, fare, provider,
+                        updated_at, fetched_at
+                    )
+                    SELECT DISTINCT ON (o.source_city, o.destination_city, o.departure_timestamp, o.flight_number)
+                           o.source_city, o.destination_city, o.departure_timestamp, o.flight_number,
+                           o.airline, o.arrival_timestamp, o.duration_minutes, o.stops, o.fare, o.provider,
+                           now(), max(o.ingested_at) OVER (PARTITION BY {flight_key})
+                    FROM flight_offers o
+                    JOIN (SELECT DISTINCT {flight_key} FROM offers_staging) touched USING ({flight_key})
+                    ORDER BY o.source_city, o.destination_city, o.departure_timestamp, o.flight_number,
+                             o.fare ASC NULLS LAST
+                    ON CONFLICT ({flight_key}) DO UPDATE
+                    SET airline = EXCLUDED.airline,
+                        arrival_timestamp = EXCLUDED.arrival_timestamp,
+                        duration_minutes = EXCLUDED.duration_minutes,
+                        stops = EXCLUDED.stops,
+                        fare = EXCLUDED.fare,
+                        provider = EXCLUDED.provider,
+                        updated_at = now(),
+                        fetched_at = GREATEST(global_flights.fetched_at, EXCLUDED.fetched_at)
+                    WHERE (global_flights.fare, global_flights.provider, global_flights.airline,
+                           global_flights.arrival_timestamp, global_flights.stops)
+                          IS DISTINCT FROM
+                          (EXCLUDED.fare, EXCLUDED.provider, EXCLUDED.airline,
+                           EXCLUDED.arrival_timestamp, EXCLUDED.stops)
+                       OR global_flights.fetched_at < EXCLUDED.fetched_at
+                    RETURNING source_city, destination_city,
+                              (departure_timestamp AT TIME ZONE %s)::DATE::TEXT
+                """, (configfile.FLIGHT_TIMEZONE,))
+                routes = cursor.fetchall()
+            cursor.execute("""
+                INSERT INTO consolidation_watermarks (provider, last_ingested_at, consolidated_rows, updated_at)
+                VALUES (%s, %s, %s, now())
+                ON CONFLICT (provider) DO UPDATE
+                SET last_ingested_at = GREATEST(consolidation_watermarks.last_ingested_at,
+                                                EXCLUDED.last_ingested_at),
+                    consolidated_rows = consolidation_watermarks.consolidated_rows + EXCLUDED.consolidated_rows,
+                    updated_at = now()
+            """, (provider, high_water, rows_read))
+    return routes
+
+
+def consolidate_provider(provider, batch_size=None):
+    """
+    Consolidate the rows one provider ingested since its watermark, in
+    batches read through a server-side cursor. Returns the rows read.
+    """
+    batch_size = batch_size or configfile.CONSOLIDATION_BATCH_SIZE
+    db_name, query = FLIGHT_SOURCES[provider]
+    since = load_watermark(provider)
+    start = since - timedelta(seconds=configfile.CONSOLIDATION_OVERLAP_SECONDS) if since else EPOCH
+
+    rows_read = 0
+    with db_pool.connection(db_name) as conn:
+        with conn.cursor(name=f"consolidate_{provider}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, (start,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                offers = [offer for offer in (normalize_flight(provider, row) for row in rows) if offer]
+                routes = write_offers(provider, offers, rows[-1][-1], len(rows))
+                invalidate_routes("flight", routes)
+                rows_read += len(rows)
+    return rows_read
+
+
+def consolidate(providers=None, lock_timeout=30.0):
+    """
+    Bring global_flights up to date with every provider table (or just
+    `providers`). Runs are serialized across processes with an advisory
+    lock; TimeoutError is raised if another run holds it past `lock_timeout`.
+    Returns the number of provider rows read.
+    """
+    total = 0
+    with advisory_lock(LOCK_KEY, timeout=lock_timeout):
+        for provider in providers or FLIGHT_SOURCES:
+            try:
+                total += consolidate_provider(provider)
+            except Exception as e:
+                print(f"Error consolidating {provider} flights: {e}")
+    return total
+
+
+_job = None
+_job_lock = threading.Lock()
+
+
+def start_background_consolidation(interval=None):
+    """
+    Start the consolidation job once per process and return it. With an
+    interval of 0 it still runs whenever `request_consolidation` is called.
+    """
+    global _job
+    interval = configfile.CONSOLIDATION_INTERVAL if interval is None else interval
+    with _job_lock:
+        if _job is None or not _job.is_alive():
+            _job = PeriodicJob("flight-consolidation", consolidate, interval or None, debounce=0.5)
+            _job.start()
+        return _job
+
+
+def request_consolidation():
+    start_background_consolidation().request_run()
+
+
+def consolidate_after_ingest(provider):
+    """
+    Consolidate a provider's new rows right after it ingests, so they are
+    searchable as soon as this returns. If another run holds the lock, hand
+    the work to the background job instead of waiting.
+    """
+    try:
+        return consolidate([provider], lock_timeout=configfile.CONSOLIDATION_LOCK_TIMEOUT)
+    except TimeoutError:
+        request_consolidation()
+    except Exception as e:
+        print(f"Error consolidating {provider} flights: {e}")
+    return 0
+
+
+def consolidation_status():
+    if _job is None:
+        return {"running": False}
+    return _job.status()
+
+
+if __name__ == "__main__":
+    print(f"Consolidated {consolidate()} provider rows into global_flights.")
@@ -0,0 +1,301 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from functions import configfile
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of psycopg2 connections to one database.
+
+    Connections are health checked on checkout, and connections that sat idle
+    for too long or outlived their maximum lifetime are closed and replaced.
+    """
+
+    def __init__(self, name, connect_kwargs, minconn=1, maxconn=10, timeout=10.0,
+                 max_idle=300.0, max_lifetime=3600.0, health_check_after=5.0):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.name = name
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._idle = []  # LIFO stack of _PooledConnection
+        self._in_use = {}  # id(conn) -> _PooledConnection
+        self._size = 0
+        self._closed = False
+        self._last_prune = time.monotonic()
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "connect_errors": 0,
+        }
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except psycopg2.Error as e:
+            with self._cond:
+                self._size -= 1
+                self._stats["connect_errors"] += 1
+                self._cond.notify()
+            print(f"Database connection error ({self.name}): {e}")
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return _PooledConnection(conn)
+
+    def _is_expired(self, entry, now):
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            return True
+        if self.max_idle and now - entry.last_used > self.max_idle:
+            return True
+        return False
+
+    def _is_healthy(self, entry, now):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - entry.last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _discard(entry):
+        try:
+            entry.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """
+        Check a connection out of the pool, opening a new one if the pool is
+        below capacity and waiting up to `timeout` seconds if it is full.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError(f"Connection pool {self.name} is closed")
+                waited = False
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Timed out after {self.timeout}s waiting for a connection to {self.name}"
+                        )
+                    if not waited:
+                        self._stats["waits"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                entry = self._connect()
+            else:
+                now = time.monotonic()
+                if self._is_expired(entry, now) or not self._is_healthy(entry, now):
+                    with self._cond:
+                        if self._is_expired(entry, now):
+                            self._stats["recycled"] += 1
+                        else:
+                            self._stats["failed_health_checks"] += 1
+                        self._size -= 1
+                        self._cond.notify()
+                    self._discard(entry)
+                    continue
+
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                self._stats["checkouts"] += 1
+            return entry.conn
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection to the pool. Broken connections, or any passed
+        with close=True, are closed instead of being reused.
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            raise psycopg2.pool.PoolError(f"Connection was not checked out from pool {self.name}")
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._cond:
+            if close or conn.closed or self._closed:
+                self._size -= 1
+                self._discard(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+            prune_due = self.max_idle and entry.last_used - self._last_prune > self.max_idle / 2
+
+        if prune_due:
+            self.prune()
+
+    def prune(self):
+        """
+        Close idle connections that have expired, keeping at least `minconn` open.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._last_prune = now
+            keep, expired = [], []
+            for entry in self._idle:
+                if self._is_expired(entry, now) and self._size - len(expired) > self.minconn:
+                    expired.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = keep
+            self._size -= len(expired)
+            self._stats["recycled"] += len(expired)
+            self._cond.notify_all()
+        for entry in expired:
+            self._discard(entry)
+        return len(expired)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "maxconn": self.maxconn,
+            })
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name):
+    """
+    Return the shared pool for a logical database, creating it on first use.
+    """
+    pool = _pools.get(db_name)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(
+                db_name,
+                configfile.get_database_settings(db_name),
+                minconn=configfile.DB_POOL_MIN_CONN,
+                maxconn=configfile.DB_POOL_MAX_CONN,
+                timeout=configfile.DB_POOL_CHECKOUT_TIMEOUT,
+                max_idle=configfile.DB_POOL_MAX_IDLE_SECONDS,
+                max_lifetime=configfile.DB_POOL_MAX_LIFETIME_SECONDS,
+                health_check_after=configfile.DB_POOL_HEALTH_CHECK_AFTER,
+            )
+            _pools[db_name] = pool
+    return pool
+
+
+@contextmanager
+def connection(db_name):
+    """
+    Check out a pooled connection for the duration of a `with` block.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises; either way the connection goes back to the pool.
+    """
+    pool = get_pool(db_name)
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken or conn.closed)
+
+
+def pool_stats():
+    """
+    Return a snapshot of the statistics for every pool created so far.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.stats() for pool in pools}
+
+
+def prune_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return sum(pool.prune() for pool in pools)
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.closeall()
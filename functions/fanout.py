@@ -0,0 +1,81 @@
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATUS_OK = "ok"
+STATUS_TIMEOUT = "timeout"
+STATUS_FAILED = "failed"
+
+# Upper bound on provider calls running at once across all requests
+MAX_WORKERS = 32
+
+ProviderResult = namedtuple("ProviderResult", ["name", "status", "elapsed", "value", "error"])
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="provider")
+
+
+def iter_fanout(tasks, deadline, timeouts=None, executor=None):
+    """
+    Run every task concurrently and yield a ProviderResult for each one as
+    soon as it finishes, fails or runs out of time.
+
+    Args:
+        tasks (dict): Maps a provider name to a zero-argument callable.
+        deadline (float): Overall budget in seconds for the whole fan-out.
+        timeouts (dict): Optional per-provider budgets in seconds; a provider
+            never gets more than the overall deadline.
+        executor (Executor): Optional executor to submit to instead of the
+            shared provider pool.
+
+    A timed out task keeps running in the background, its result is simply
+    no longer waited for.
+    """
+    timeouts = timeouts or {}
+    executor = executor or _executor
+    start = time.monotonic()
+    overall_end = start + deadline
+
+    futures = {}
+    for name, task in tasks.items():
+        end = min(overall_end, start + timeouts.get(name, deadline))
+        futures[executor.submit(task)] = (name, end)
+
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for future in [f for f in pending if futures[f][1] <= now and not f.done()]:
+            pending.discard(future)
+            future.cancel()
+            yield ProviderResult(futures[future][0], STATUS_TIMEOUT, now - start, None, None)
+        if not pending:
+            break
+
+        next_end = min(futures[f][1] for f in pending)
+        done, _ = wait(pending, timeout=max(0, next_end - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            name = futures[future][0]
+            elapsed = time.monotonic() - start
+            error = future.exception()
+            if error is not None:
+                yield ProviderResult(name, STATUS_FAILED, elapsed, None, error)
+            else:
+                yield ProviderResult(name, STATUS_OK, elapsed, future.result(), None)
+
+
+def run_fanout(tasks, deadline, timeouts=None, executor=None):
+    """
+    Run every task concurrently and wait for all of them, bounded by the
+    deadline. Returns a dict of provider name -> ProviderResult.
+    """
+    return {result.name: result for result in iter_fanout(tasks, deadline, timeouts, executor)}
+
+
+def summarize(results):
+    """
+    Group provider names by outcome, e.g. {"ok": [...], "timeout": [...], "failed": [...]}.
+    """
+    summary = {STATUS_OK: [], STATUS_TIMEOUT: [], STATUS_FAILED: []}
+    for result in results.values():
+        summary[result.status].append(result.name)
+    return summary
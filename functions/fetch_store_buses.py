@@ -1,18 +1,86 @@
-import psycopg2
-from psycopg2 import sql
+import csv
+import io
+
 import requests
 import json
 
-def convert_timestamp(milliseconds):
-    from datetime import datetime, timezone, timedelta
-    ist = timezone(timedelta(hours=5, minutes=30))
-    return datetime.fromtimestamp(milliseconds / 1000, tz=ist).strftime('%Y-%m-%d %H:%M:%S')
+from functions import configfile, db_pool, http_client
+from functions.result_cache import invalidate_routes
+
+BUS_DB = "BUS_DATA"
+
+def parse_bus_trips(bus_data):
+    """
+    Flatten the Zingbus response into staging rows. Timestamps are kept as
+    epoch milliseconds and converted by Postgres for the whole batch.
+    """
+    rows = []
+    for data in bus_data:  # bus_data is a list of dictionaries
+        for trip in data.get("trips", []):
+            rows.append((
+                trip.get("fromCity", ""),
+                trip.get("toCity", ""),
+                trip.get("type", "") or "",
+                int(trip.get("startTimeInMills", 0) or 0),
+                int(trip.get("endTimeInMills", 0) or 0),
+                trip.get("timeDifference", ""),
+                trip.get("fare", ""),
+            ))
+    return rows
+
+def bulk_upsert_buses(rows):
+    """
+    Stage rows with COPY into a temporary table and merge them into `buses`
+    on (source_city, destination_city, departure_time, bus_type) in a single
+    statement. Epoch timestamps become local times in FLIGHT_TIMEZONE.
+    Returns the (source, destination, date) routes written.
+    """
+    if not rows:
+        return []
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    with db_pool.connection(BUS_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE buses_staging (
+                    source_city TEXT,
+                    destination_city TEXT,
+                    bus_type TEXT,
+                    departure_ms BIGINT,
+                    arrival_ms BIGINT,
+                    total_travel_time TEXT,
+                    fare NUMERIC
+                ) ON COMMIT DROP
+            """)
+            cur.copy_expert("COPY buses_staging FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute("""
+                INSERT INTO buses (source_city, destination_city, bus_type, departure_time,
+                                   arrival_time, total_travel_time, fare)
+                SELECT DISTINCT ON (source_city, destination_city, departure_ms, COALESCE(bus_type, ''))
+                       source_city, destination_city, COALESCE(bus_type, ''),
+                       to_timestamp(departure_ms / 1000.0) AT TIME ZONE %(tz)s,
+                       to_timestamp(arrival_ms / 1000.0) AT TIME ZONE %(tz)s,
+                       total_travel_time, fare
+                FROM buses_staging
+                ORDER BY source_city, destination_city, departure_ms, COALESCE(bus_type, ''), fare
+                ON CONFLICT (source_city, destination_city, departure_time, bus_type)
+                DO UPDATE SET arrival_time = EXCLUDED.arrival_time,
+                              total_travel_time = EXCLUDED.total_travel_time,
+                              fare = EXCLUDED.fare,
+                              fetched_at = now()
+                RETURNING source_city, destination_city, departure_time::DATE::TEXT
+            """, {"tz": configfile.FLIGHT_TIMEZONE})
+            return list(set(cur.fetchall()))
 
 def fetch_and_insert_bus_data(from_city, to_city, trip_date):
     # Fetch data from the Zingbus API
-    url = f"https://www.zingbus.com/v1/search/zingbus/buses/?fromCity={from_city}&toCity={to_city}&tripDate={trip_date}"
+    url = f"{configfile.PROVIDER_BASE_URLS['bus']}/v1/search/zingbus/buses/"
+    params = {"fromCity": from_city, "toCity": to_city, "tripDate": trip_date}
     try:
-        response = requests.get(url)
+        response = http_client.get(url, params=params)
         if response.status_code != 200:
             print(f"Failed to fetch data. Status code: {response.status_code}")
             print(f"Response content: {response.text}")
@@ -26,74 +94,11 @@ def fetch_and_insert_bus_data(from_city, to_city, trip_date):
         return
 
     # Insert fetched data into the PostgreSQL database
-    conn = psycopg2.connect(
-        dbname="BUS_DATA",  # Change this to your database name
-        user="postgres",  # Replace with your PostgreSQL username
-        password="2301",  # Replace with your PostgreSQL password
-        host="192.168.42.113",  # Or your host (use 'localhost' if running locally)
-        port="5432"  # Default port for PostgreSQL
-    )
-
-    # Create a cursor object to interact with the database
-    cur = conn.cursor()
-
-    # Create the table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS buses (
-            id SERIAL PRIMARY KEY,
-            source_city VARCHAR(255) NOT NULL,
-            destination_city VARCHAR(255) NOT NULL,
-            bus_type VARCHAR(255),
-            departure_time TIMESTAMP NOT NULL,
-            arrival_time TIMESTAMP NOT NULL,
-            total_travel_time VARCHAR(255),
-            fare NUMERIC
-        )
-    """
-    cur.execute(create_table_query)
-
-    # Loop through the list of JSON objects
-    for data in bus_data:  # bus_data is a list of dictionaries
-        trips = data.get("trips", [])
-        for trip in trips:
-            source_city = trip.get("fromCity", "")
-            destination_city = trip.get("toCity", "")
-            departure_time_ist = convert_timestamp(trip.get("startTimeInMills", 0))
-            arrival_time_ist = convert_timestamp(trip.get("endTimeInMills", 0))
-
-            bus_info = {
-                "source_city": source_city,
-                "destination_city": destination_city,
-                "bus_type": trip.get("type", ""),
-                "departure_time": departure_time_ist,
-                "arrival_time": arrival_time_ist,
-                "total_travel_time": trip.get("timeDifference", ""),
-                "fare": trip.get("fare", ""),
-            }
-
-            # Prepare the SQL INSERT statement
-            insert_query = """
-                INSERT INTO buses (source_city, destination_city, bus_type, departure_time, arrival_time, total_travel_time, fare)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            cur.execute(insert_query, (
-                bus_info['source_city'], 
-                bus_info['destination_city'], 
-                bus_info['bus_type'], 
-                bus_info['departure_time'], 
-                bus_info['arrival_time'], 
-                bus_info['total_travel_time'], 
-                bus_info['fare'], 
-            ))
-
-    # Commit the transaction
-    conn.commit()
-
-    # Close the cursor and connection
-    cur.close()
-    conn.close()
+    rows = parse_bus_trips(bus_data)
+    routes = bulk_upsert_buses(rows)
 
-    print("Data fetched and inserted successfully into the PostgreSQL database.")
+    invalidate_routes("bus", routes)
+    print(f"Data fetched and {len(rows)} trips upserted into the PostgreSQL database.")
 
 # # Example usage
-# fetch_and_insert_bus_data("Delhi", "Jaipur", "2024-12-01")
\ No newline at end of file
+# fetch_and_insert_bus_data("Delhi", "Jaipur", "2024-12-01")
@@ -1,17 +1,14 @@
-import http.client
 import json
 from datetime import datetime
-import pandas as pd
-from rapidfuzz import process, fuzz
-import psycopg2
+from functions import configfile, db_pool, http_client
+from functions.city_index import get_city_index
+from functions.consolidation import consolidate_after_ingest
+from functions.itinerary import ItineraryBatch
 
 def get_priceline_db_connection():
-    return psycopg2.connect("dbname=PriceLineDB user=postgres password=0000")
+    return db_pool.connection("PriceLineDB")
 
 
-# Load the CSV data into a DataFrame
-airport_df = pd.read_csv('assets/airport_data.csv', usecols=['city', 'airport_code','railway_station_code'])
-
 # Load airline data into a dictionary
 airline_data = {
     "6E": "IndiGo",
@@ -30,48 +27,14 @@ def get_closest_city(user_city):
     """
     Find the closest matching city to the user's input using fuzzy matching.
     """
-    try:
-        # List of available city names
-        city_list = airport_df['city'].tolist()
-
-        # Perform fuzzy matching
-        closest_match, score, _ = process.extractOne(
-            user_city.strip().title(), city_list, scorer=fuzz.ratio
-        )
-
-        # Debugging: Print matching details
-        print(f"Input: {user_city}, Closest Match: {closest_match}, Score: {score}")
-
-        # Threshold to ensure it's a valid match
-        if score >= 50:  # 70 is a lenient similarity threshold
-            return closest_match
-        else:
-            return None
-    except Exception as e:
-        print(f"Error finding closest city: {e}")
-        return None
-
-
-# get_closest_city('Hydrabad')
+    return get_city_index().closest_city(user_city)
 
 
 def get_airport_code(user_city):
     """
     Get the airport code for the given city.
     """
-    try:
-        # Find the closest matching city
-        closest_city = get_closest_city(user_city)
-
-        if closest_city:
-            # Filter the DataFrame to find the airport code for the closest city
-            result = airport_df[airport_df['city'] == closest_city]['airport_code']
-            return result.iloc[0] if not result.empty else None
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching airport code for {user_city}: {e}")
-        return None
+    return get_city_index().airport_code(user_city)
     
     
 # get_airport_code("Bumbai")
@@ -79,20 +42,14 @@ def get_airport_code(user_city):
 
 # Function to fetch and store flight data
 def get_priceline_flights(source, destination, formatted_date):
-    # API connection setup
-    conn = http.client.HTTPSConnection("priceline-com2.p.rapidapi.com")
-    headers = {
-        'x-rapidapi-key': "8523b3d236msh567ad42fd95c905p1bcbb8jsn1aa82f1b392e",
-        'x-rapidapi-host': "priceline-com2.p.rapidapi.com"
-    }
+    # API request setup
     endpoint = f"/flights/search-one-way?originAirportCode={source}&destinationAirportCode={destination}&departureDate={formatted_date}&numOfStops=0"
 
     # Fetch data from API
     try:
-        conn.request("GET", endpoint, headers=headers)
-        res = conn.getresponse()
-        data = res.read()
-        response = json.loads(data.decode("utf-8"))
+        res = http_client.get(configfile.PROVIDER_BASE_URLS["priceline"] + endpoint,
+                              headers=http_client.rapidapi_headers("priceline"))
+        response = json.loads(res.content.decode("utf-8"))
     except json.JSONDecodeError:
         print("Error decoding the API response.")
         return
@@ -106,98 +63,60 @@ def get_priceline_flights(source, destination, formatted_date):
         print("No flight listings found.")
         return
 
-    # Create the FlightsInfo table if not exists
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS FlightsInfo (
-        Airlines TEXT,
-        Flight_Number TEXT,
-        Source_City TEXT,
-        Source_Airport_Code TEXT,
-        Destination_City TEXT,
-        Destination_Airport_Code TEXT,
-        Departure_Date DATE,
-        Departure_Time TIME,
-        Arrival_Date DATE,
-        Arrival_Time TIME,
-        Duration_of_Travel TEXT,
-        Stop_Quantity INTEGER,
-        Equipment_Name TEXT,
-        Price_in_INR TEXT
-    );
-    """
-    try:
-        connection = get_priceline_db_connection()
-        if not connection:
-            return
-        with connection:
-            with connection.cursor() as cursor:
-                cursor.execute(create_table_query)
-    except Exception as e:
-        print(f"Error creating table: {e}")
-        return
-
-    # Prepare flight data
-    flights = []
+    # Parse listings straight into a column batch
+    batch = ItineraryBatch("flight", "priceline")
     for listing in listings:
-        slices = listing.get("slices", [])
-        price_usd = listing.get("totalPriceWithDecimal", {}).get("price", "N/A")
-        try:
-            price_inr = float(price_usd) * 84.46 if price_usd != "N/A" else None
-        except ValueError:
-            price_inr = None
-
-        for slice_data in slices:
-            segments = slice_data.get("segments", [])
-            for segment in segments:
-                airline_code = segment.get("marketingAirline", "N/A")
-                airline_name = airline_data.get(airline_code, "Unknown")
-                if airline_name == "Unknown":
-                    airline_name = "Akasa Air"  # Replace 'Unknown' with 'Akasa Air'
-                date_time_depart = segment.get("departInfo", {}).get("time", {}).get("dateTime", "")
-                date_time_arrival = segment.get("arrivalInfo", {}).get("time", {}).get("dateTime", "")
-
-                flight_details = {
-                    "Airlines": airline_name,
-                    "Flight_Number": segment.get("flightNumber", "N/A"),
-                    "Source_City": segment.get("departInfo", {}).get("airport", {}).get("name", "N/A"),
-                    "Source_Airport_Code": segment.get("departInfo", {}).get("airport", {}).get("code", "N/A"),
-                    "Destination_City": segment.get("arrivalInfo", {}).get("airport", {}).get("name", "N/A"),
-                    "Destination_Airport_Code": segment.get("arrivalInfo", {}).get("airport", {}).get("code", "N/A"),
-                    "Departure_Date": date_time_depart.split("T")[0] if "T" in date_time_depart else "N/A",
-                    "Departure_Time": date_time_depart.split("T")[1] if "T" in date_time_depart else "N/A",
-                    "Arrival_Date": date_time_arrival.split("T")[0] if "T" in date_time_arrival else "N/A",
-                    "Arrival_Time": date_time_arrival.split("T")[1] if "T" in date_time_arrival else "N/A",
-                    "Duration_of_Travel": f"{segment.get('duration', 'N/A')} minutes",
-                    "Stop_Quantity": segment.get("stopQuantity", 0),
-                    "Equipment_Name": segment.get("equipmentName", "N/A"),
-                    "Price_in_INR": f"₹ {price_inr:.2f}" if price_inr is not None else "N/A"
-                }
-                flights.append(flight_details)
+        price_usd = listing.get("totalPriceWithDecimal", {}).get("price")
+        for slice_data in listing.get("slices", []):
+            for segment in slice_data.get("segments", []):
+                depart_info = segment.get("departInfo", {})
+                arrival_info = segment.get("arrivalInfo", {})
+                batch.add(
+                    # Codes missing from airline_data are Akasa Air
+                    airline_data.get(segment.get("marketingAirline"), "Akasa Air"),
+                    segment.get("flightNumber", "N/A"),
+                    depart_info.get("airport", {}).get("code", "N/A"),
+                    depart_info.get("airport", {}).get("name", "N/A"),
+                    arrival_info.get("airport", {}).get("code", "N/A"),
+                    arrival_info.get("airport", {}).get("name", "N/A"),
+                    depart_info.get("time", {}).get("dateTime"),
+                    arrival_info.get("time", {}).get("dateTime"),
+                    duration_minutes=segment.get("duration"),
+                    stops=segment.get("stopQuantity", 0),
+                    fare=price_usd,
+                    equipment=segment.get("equipmentName", "N/A"),
+                )
+    batch.normalize_timestamps().convert_fares(configfile.USD_TO_INR).fill_durations()
 
     # Insert flight data
-    if flights:
-        insert_query = """
-        INSERT INTO FlightsInfo (
-            Airlines, Flight_Number, Source_City, Source_Airport_Code,
-            Destination_City, Destination_Airport_Code, Departure_Date,
-            Departure_Time, Arrival_Date, Arrival_Time, Duration_of_Travel,
-            Stop_Quantity, Equipment_Name, Price_in_INR
-        ) VALUES (
-            %(Airlines)s, %(Flight_Number)s, %(Source_City)s, %(Source_Airport_Code)s,
-            %(Destination_City)s, %(Destination_Airport_Code)s, %(Departure_Date)s,
-            %(Departure_Time)s, %(Arrival_Date)s, %(Arrival_Time)s, %(Duration_of_Travel)s,
-            %(Stop_Quantity)s, %(Equipment_Name)s, %(Price_in_INR)s
-        );
-        """
+    if batch:
+        columns = batch.columns
         try:
-            with connection:
+            with get_priceline_db_connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.executemany(insert_query, flights)
-            print(f"{len(flights)} rows inserted into FlightsInfo successfully.")
+                    batch.copy_to(cursor, "FlightsInfo", [
+                        ("Airlines", columns["carrier"]),
+                        ("Flight_Number", columns["service_number"]),
+                        ("Source_City", columns["source_name"]),
+                        ("Source_Airport_Code", columns["source_code"]),
+                        ("Destination_City", columns["destination_name"]),
+                        ("Destination_Airport_Code", columns["destination_code"]),
+                        ("Departure_Date", batch.dates("departure")),
+                        ("Departure_Time", batch.times("departure")),
+                        ("Arrival_Date", batch.dates("arrival")),
+                        ("Arrival_Time", batch.times("arrival")),
+                        ("Duration_of_Travel", columns["duration_minutes"]),
+                        ("Stop_Quantity", columns["stops"]),
+                        ("Equipment_Name", columns["equipment"]),
+                        ("Price_in_INR", columns["fare"]),
+                    ])
+            consolidate_after_ingest("priceline")
+            print(f"{len(batch)} rows inserted into FlightsInfo successfully.")
         except Exception as e:
             print(f"Error inserting data: {e}")
     else:
         print("No flights to insert.")
+    return batch
         
         
-get_priceline_flights('RPR','BOM','2024-12-24')
\ No newline at end of file
+# get_priceline_flights('RPR','BOM','2024-12-24')
\ No newline at end of file
@@ -1,195 +1,96 @@
-import http.client
 import json
 from datetime import datetime
-import pandas as pd
-from rapidfuzz import process, fuzz
-import psycopg2
+from functions import configfile, db_pool, http_client
+from functions.city_index import get_city_index
+from functions.consolidation import consolidate_after_ingest
+from functions.itinerary import ItineraryBatch
 
 def get_skyscanner_db_connection():
-    return psycopg2.connect("dbname=SkyScannerDB user=postgres password=0000")
+    return db_pool.connection("SkyScannerDB")
 
 
-# Load the CSV data into a DataFrame
-airport_df = pd.read_csv('assets/airport_data.csv', usecols=['city', 'airport_code','railway_station_code'])
-
 def get_closest_city(user_city):
     """
     Find the closest matching city to the user's input using fuzzy matching.
     """
-    try:
-        # List of available city names
-        city_list = airport_df['city'].tolist()
-
-        # Perform fuzzy matching
-        closest_match, score, _ = process.extractOne(
-            user_city.strip().title(), city_list, scorer=fuzz.ratio
-        )
-
-        # Debugging: Print matching details
-        print(f"Input: {user_city}, Closest Match: {closest_match}, Score: {score}")
-
-        # Threshold to ensure it's a valid match
-        if score >= 50:  # 70 is a lenient similarity threshold
-            return closest_match
-        else:
-            return None
-    except Exception as e:
-        print(f"Error finding closest city: {e}")
-        return None
-
-
-# get_closest_city('Hydrabad')
+    return get_city_index().closest_city(user_city)
 
 
 def get_airport_code(user_city):
     """
     Get the airport code for the given city.
     """
-    try:
-        # Find the closest matching city
-        closest_city = get_closest_city(user_city)
-
-        if closest_city:
-            # Filter the DataFrame to find the airport code for the closest city
-            result = airport_df[airport_df['city'] == closest_city]['airport_code']
-            return result.iloc[0] if not result.empty else None
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching airport code for {user_city}: {e}")
-        return None
+    return get_city_index().airport_code(user_city)
     
     
 # get_airport_code("Bumbai")
 
 
-# Function to create the FlightsData table
-def create_flights_table():
-    try:
-        conn = get_skyscanner_db_connection()
-        cursor = conn.cursor()
-        
-        # SQL command to create the table
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS FlightsData (
-            id SERIAL PRIMARY KEY,
-            Airlines VARCHAR(255),
-            Source_City VARCHAR(255),
-            Source_Airport_Code VARCHAR(255),
-            Destination_City VARCHAR(255),
-            Destination_Airport_Code VARCHAR(255),
-            Departure_Date DATE,
-            Departure_Time TIME,
-            Arrival_Date DATE,
-            Arrival_Time TIME,
-            Duration_of_Travel VARCHAR(50),
-            Flight_Number VARCHAR(50),
-            Price_in_INR VARCHAR(50)
-        );
-        """
-        cursor.execute(create_table_query)
-        conn.commit()
-        print("Table FlightsData created successfully.")
-        
-    except Exception as e:
-        print("Error creating table:", e)
-        
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
-
 # Function to fetch flights from SkyScanner
 def get_skyScanner_flights(source, destination, travel_date):
     
     formatted_date = datetime.strptime(travel_date, "%Y-%m-%d").strftime("%Y-%m-%d")
-    conn = http.client.HTTPSConnection("sky-scanner3.p.rapidapi.com")
-    
-    headers = {
-        'x-rapidapi-key': "8523b3d236msh567ad42fd95c905p1bcbb8jsn1aa82f1b392e",
-        'x-rapidapi-host': "sky-scanner3.p.rapidapi.com"
-    }
-    
     endpoint = f"/flights/search-one-way?fromEntityId={source}&toEntityId={destination}&departDate={formatted_date}&currency=INR&cabinClass=economy"
-    conn.request("GET", endpoint, headers=headers)
-    res = conn.getresponse()
-    data = res.read()
-    
     try:
-        response = json.loads(data.decode("utf-8"))
+        res = http_client.get(configfile.PROVIDER_BASE_URLS["skyscanner"] + endpoint,
+                              headers=http_client.rapidapi_headers("skyscanner"))
+        response = json.loads(res.content.decode("utf-8"))
     except json.JSONDecodeError:
         print("Error decoding the API response.")
         return
-    
-    # Create the FlightsData table
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS FlightsData (
-        id SERIAL PRIMARY KEY,
-        Airlines VARCHAR(255),
-        Source_City VARCHAR(255),
-        Source_Airport_Code VARCHAR(255),
-        Destination_City VARCHAR(255),
-        Destination_Airport_Code VARCHAR(255),
-        Departure_Date DATE,
-        Departure_Time TIME,
-        Arrival_Date DATE,
-        Arrival_Time TIME,
-        Duration_of_Travel VARCHAR(50),
-        Flight_Number VARCHAR(50),
-        Price_in_INR VARCHAR(50)
-    );
-    """
-    try:
-        connection = get_skyscanner_db_connection()
-        if not connection:
-            return
-        with connection:
-            with connection.cursor() as cursor:
-                cursor.execute(create_table_query)
     except Exception as e:
-        print(f"Error creating table: {e}")
+        print(f"Error fetching data from API: {e}")
         return
-
-    # Extract flight details
-    itineraries = response.get("data", {}).get("itineraries", [])
-    flights = []
-    for itinerary in itineraries:
-        price = itinerary.get("price", {}).get("raw", "N/A")
-        legs = itinerary.get("legs", [])
-        for leg in legs:
-            flights.append((
+    
+    # Parse itineraries straight into a column batch
+    batch = ItineraryBatch("flight", "skyscanner")
+    for itinerary in response.get("data", {}).get("itineraries", []):
+        price = itinerary.get("price", {}).get("raw")
+        for leg in itinerary.get("legs", []):
+            origin = leg.get("origin", {})
+            arrival_at = leg.get("destination", {})
+            batch.add(
                 leg.get("carriers", {}).get("marketing", [{}])[0].get("name", "N/A"),
-                leg.get("origin", {}).get("city", "N/A"),
-                leg.get("origin", {}).get("displayCode", "N/A"),
-                leg.get("destination", {}).get("city", "N/A"),
-                leg.get("destination", {}).get("displayCode", "N/A"),
-                leg.get("departure", "").split("T")[0],
-                leg.get("departure", "").split("T")[1] if "T" in leg.get("departure", "") else None,
-                leg.get("arrival", "").split("T")[0],
-                leg.get("arrival", "").split("T")[1] if "T" in leg.get("arrival", "") else None,
-                f"{leg.get('durationInMinutes', 'N/A')} minutes",
                 leg.get("segments", [{}])[0].get("flightNumber", "N/A"),
-                f"₹ {float(price):.2f}" if price != "N/A" else "N/A"
-            ))
-    
+                origin.get("displayCode", "N/A"),
+                origin.get("city", "N/A"),
+                arrival_at.get("displayCode", "N/A"),
+                arrival_at.get("city", "N/A"),
+                leg.get("departure"),
+                leg.get("arrival"),
+                duration_minutes=leg.get("durationInMinutes"),
+                stops=leg.get("stopCount"),
+                fare=price,
+            )
+    batch.normalize_timestamps().convert_fares().fill_durations()
+
     # Insert data into the database
-    if flights:
-        insert_query = """
-        INSERT INTO FlightsData (
-            Airlines, Source_City, Source_Airport_Code, Destination_City,
-            Destination_Airport_Code, Departure_Date, Departure_Time,
-            Arrival_Date, Arrival_Time, Duration_of_Travel, Flight_Number, Price_in_INR
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """
+    if batch:
+        columns = batch.columns
         try:
-            with connection:
+            with get_skyscanner_db_connection() as connection:
                 with connection.cursor() as cursor:
-                    cursor.executemany(insert_query, flights)
-            print(f"{len(flights)} rows inserted into FlightsData successfully.")
+                    batch.copy_to(cursor, "FlightsData", [
+                        ("Airlines", columns["carrier"]),
+                        ("Source_City", columns["source_name"]),
+                        ("Source_Airport_Code", columns["source_code"]),
+                        ("Destination_City", columns["destination_name"]),
+                        ("Destination_Airport_Code", columns["destination_code"]),
+                        ("Departure_Date", batch.dates("departure")),
+                        ("Departure_Time", batch.times("departure")),
+                        ("Arrival_Date", batch.dates("arrival")),
+                        ("Arrival_Time", batch.times("arrival")),
+                        ("Duration_of_Travel", columns["duration_minutes"]),
+                        ("Flight_Number", columns["service_number"]),
+                        ("Price_in_INR", columns["fare"]),
+                    ])
+            consolidate_after_ingest("skyscanner")
+            print(f"{len(batch)} rows inserted into FlightsData successfully.")
         except Exception as e:
             print(f"Error inserting data: {e}")
     else:
         print("No flights to insert.")
+    return batch
         
         
         
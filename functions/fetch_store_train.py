@@ -1,71 +1,28 @@
 import requests
 import json
 from datetime import datetime
-import psycopg2
+
+from functions import configfile, db_pool, http_client
+from functions.itinerary import ItineraryBatch
+from functions.result_cache import invalidate_routes
 
 # PostgreSQL setup
 def get_postgres_connection():
-    try:
-        connection = psycopg2.connect(
-            host="192.168.42.185",
-            database="TrainDB",
-            user="postgres",
-            password="root",
-            port="5432"
-        )
-        return connection
-    except Exception as e:
-        print(f"Error connecting to PostgreSQL: {e}")
-        return None
+    return db_pool.connection("TrainDB")
 
 
-def create_train_table():
-    """
-    Create the TrainDetails table in PostgreSQL with fields for departure, arrival, duration, and fares.
-    """
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS TrainDetails (
-        train_number TEXT NOT NULL,
-        train_name TEXT,
-        source_station_code TEXT NOT NULL,
-        source_city TEXT,
-        destination_station_code TEXT NOT NULL,
-        destination_city TEXT,
-        departure_date DATE NOT NULL,
-        departure_time TIME NOT NULL,
-        departure_day TEXT NOT NULL,
-        arrival_date DATE NOT NULL,
-        arrival_time TIME NOT NULL,
-        arrival_day TEXT NOT NULL,
-        travel_duration TEXT NOT NULL,
-        ticket_prices JSONB,
-        PRIMARY KEY (train_number, departure_date)
-    );
-    """
-    try:
-        connection = get_postgres_connection()
-        if connection is None:
-            return
-        with connection:
-            with connection.cursor() as cursor:
-                cursor.execute(create_table_query)
-        print("TrainDetails table created or already exists with updated schema.")
-    except Exception as e:
-        print(f"Error creating TrainDetails table: {e}")
-                
-
 def fetch_train_details(source, destination, travel_date):
     """
     Fetch train details from the API, process the response, and store in the PostgreSQL database.
     """
     formatted_date = datetime.strptime(travel_date, "%Y-%m-%d").strftime("%Y%m%d")
-    url = f"https://railways.makemytrip.com/api/tbsWithAvailabilityAndRecommendation/{source}/{destination}/{formatted_date}"
+    url = f"{configfile.PROVIDER_BASE_URLS['train']}/api/tbsWithAvailabilityAndRecommendation/{source}/{destination}/{formatted_date}"
     headers = {
         "User-Agent": "Mozilla/5.0"
     }
     try:
         # Fetch data from the API
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -75,70 +32,90 @@ def fetch_train_details(source, destination, travel_date):
             print("No train details found.")
             return
 
-        # Prepare records for insertion
-        train_records = []
+        # Parse trains straight into a column batch
+        batch = ItineraryBatch("train", "makemytrip")
         for train in trains:
-            departure_time = datetime.strptime(train["departureTime"], "%H:%M")
-            arrival_time = datetime.strptime(train["arrivalTime"], "%H:%M")
-            travel_duration = f"{train['duration'] // 60}h {train['duration'] % 60}m"
-            ticket_prices = {
-                availability["className"]: availability["totalFare"]
-                for availability in train.get("tbsAvailability", [])
-            }
-
-            train_record = {
-                "train_number": train["trainNumber"],
-                "train_name": train["trainName"],
-                "source_station_code": train["frmStnCode"],
-                "source_city": train["frmStnCity"],
-                "destination_station_code": train["toStnCode"],
-                "destination_city": train["toStnCity"],
-                "departure_date": travel_date,
-                "departure_time": departure_time.time(),
-                "departure_day": departure_time.strftime("%A"),
-                "arrival_date": travel_date,  # Assuming same-day arrival for simplicity; adjust as needed.
-                "arrival_time": arrival_time.time(),
-                "arrival_day": arrival_time.strftime("%A"),
-                "travel_duration": travel_duration,
-                "ticket_prices": json.dumps(ticket_prices),
-            }
-            train_records.append(train_record)
+            batch.add(
+                train["trainName"],
+                train["trainNumber"],
+                train["frmStnCode"],
+                train["frmStnCity"],
+                train["toStnCode"],
+                train["toStnCity"],
+                # Assuming same-day arrival for simplicity; adjust as needed.
+                f"{travel_date}T{train['departureTime']}",
+                f"{travel_date}T{train['arrivalTime']}",
+                duration_minutes=train["duration"],
+                fare_classes={
+                    availability["className"]: availability["totalFare"]
+                    for availability in train.get("tbsAvailability", [])
+                },
+            )
+        batch.normalize_timestamps()
 
         # Insert train records into PostgreSQL
-        insert_train_data(train_records)
+        insert_train_data(batch)
+        return batch
     except requests.exceptions.RequestException as e:
         print(f"Error fetching train details from API: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-def insert_train_data(train_records):
-    """
-    Insert train data into PostgreSQL database with updated schema.
+# Primary key of TrainDetails (TrainDB migration 5)
+TRAIN_KEY = "train_number, departure_date, source_station_code, destination_station_code"
+
+def insert_train_data(batch):
     """
-    insert_query = """
-    INSERT INTO TrainDetails (
-        train_number, train_name, source_station_code, source_city,
-        destination_station_code, destination_city, departure_date,
-        departure_time, departure_day, arrival_date, arrival_time,
-        arrival_day, travel_duration, ticket_prices
-    ) VALUES (
-        %(train_number)s, %(train_name)s, %(source_station_code)s, %(source_city)s,
-        %(destination_station_code)s, %(destination_city)s, %(departure_date)s,
-        %(departure_time)s, %(departure_day)s, %(arrival_date)s, %(arrival_time)s,
-        %(arrival_day)s, %(travel_duration)s, %(ticket_prices)s
-    )
-    ON CONFLICT (train_number, departure_date) DO NOTHING;
+    Upsert an ItineraryBatch of trains into TrainDetails through a COPY
+    staging table. A train already stored for the same date and station
+    pair gets the new times and prices, and every row's fetched_at is set
+    to now.
     """
+    columns = batch.columns
+    departures = batch.datetimes("departure")
+    arrivals = batch.datetimes("arrival")
+    column_map = [
+        ("train_number", columns["service_number"]),
+        ("train_name", columns["carrier"]),
+        ("source_station_code", columns["source_code"]),
+        ("source_city", columns["source_name"]),
+        ("destination_station_code", columns["destination_code"]),
+        ("destination_city", columns["destination_name"]),
+        ("departure_date", batch.dates("departure")),
+        ("departure_time", batch.times("departure")),
+        ("departure_day", [d.strftime("%A") for d in departures]),
+        ("arrival_date", batch.dates("arrival")),
+        ("arrival_time", batch.times("arrival")),
+        ("arrival_day", [a.strftime("%A") for a in arrivals]),
+        ("travel_duration", [f"{m // 60}h {m % 60}m" for m in columns["duration_minutes"]]),
+        ("ticket_prices", [json.dumps(prices) for prices in columns["fare_classes"]]),
+    ]
+    names = ", ".join(column for column, _ in column_map)
     try:
-        connection = get_postgres_connection()
-        if connection is None:
-            return
-        with connection:
+        with get_postgres_connection() as connection:
             with connection.cursor() as cursor:
-                cursor.executemany(insert_query, train_records)
-        print(f"Inserted {len(train_records)} records into TrainDetails table.")
+                cursor.execute("""
+                    CREATE TEMP TABLE train_staging
+                    (LIKE TrainDetails INCLUDING DEFAULTS) ON COMMIT DROP
+                """)
+                batch.copy_to(cursor, "train_staging", column_map)
+                cursor.execute(f"""
+                    INSERT INTO TrainDetails ({names})
+                    SELECT DISTINCT ON ({TRAIN_KEY}) {names} FROM train_staging
+                    ON CONFLICT ({TRAIN_KEY}) DO UPDATE
+                    SET train_name = EXCLUDED.train_name,
+                        departure_time = EXCLUDED.departure_time,
+                        arrival_date = EXCLUDED.arrival_date,
+                        arrival_time = EXCLUDED.arrival_time,
+                        arrival_day = EXCLUDED.arrival_day,
+                        travel_duration = EXCLUDED.travel_duration,
+                        ticket_prices = EXCLUDED.ticket_prices,
+                        fetched_at = now()
+                """)
+        invalidate_routes("train", batch.routes())
+        print(f"Upserted {len(batch)} records into TrainDetails table.")
     except Exception as e:
         print(f"Error inserting train records: {e}")
              
         
-fetch_train_details('VSKP', 'SC', '2024-12-22')
+# fetch_train_details('VSKP', 'SC', '2024-12-22')
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from functions import configfile, providers, search
+from functions.scheduler import BACKGROUND, provider_scheduler
+
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+MISSING = "missing"
+
+
+def classify(mode, fetched_at, now=None):
+    """
+    Place a route's last fetch time against the mode's soft and hard TTLs.
+    """
+    if fetched_at is None:
+        return MISSING
+    ttls = configfile.FRESHNESS_TTLS[mode]
+    age = ((now or datetime.now(timezone.utc)) - fetched_at).total_seconds()
+    if age < ttls["soft"]:
+        return FRESH
+    if age < ttls["hard"]:
+        return STALE
+    return EXPIRED
+
+
+def latest_fetch(rows):
+    """
+    The latest `fetched_at` among listing rows, or None for no rows.
+    """
+    return max((row["fetched_at"] for row in rows if row.get("fetched_at") is not None), default=None)
+
+
+def route_freshness(mode, source, destination, journey_date):
+    """
+    FRESH, STALE, EXPIRED or MISSING for the rows stored for a route and day.
+    A failed lookup counts as MISSING so the caller fetches from the provider.
+    """
+    try:
+        return classify(mode, search.last_fetched(mode, source, destination, journey_date))
+    except Exception as e:
+        print(f"Error checking {mode} freshness for {source}-{destination} on {journey_date}: {e}")
+        return MISSING
+
+
+class Revalidator:
+    """
+    Refresh stale listings in the background while the stored rows are
+    served. Each (provider, route, date) is refreshed at most once at a time,
+    at background priority on the provider scheduler.
+    """
+
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or configfile.REVALIDATE_WORKERS,
+            thread_name_prefix="revalidate",
+        )
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._stats = {"queued": 0, "deduplicated": 0, "completed": 0, "failed": 0}
+
+    def queue(self, mode, source, destination, journey_date):
+        """
+        Queue a refresh of every provider serving `mode` for the route.
+        """
+        for provider, provider_mode in providers.PROVIDER_MODES.items():
+            if provider_mode != mode:
+                continue
+            key = (provider, source, destination, journey_date)
+            with self._lock:
+                if key in self._pending:
+                    self._stats["deduplicated"] += 1
+                    continue
+                self._pending.add(key)
+                self._stats["queued"] += 1
+            self._executor.submit(self._refresh, key)
+
+    def _refresh(self, key):
+        provider, source, destination, journey_date = key
+        try:
+            provider_scheduler.run(
+                provider, lambda: providers.fetch(provider, source, destination, journey_date),
+                priority=BACKGROUND, timeout=configfile.REVALIDATE_SLOT_TIMEOUT,
+            )
+            outcome = "completed"
+        except Exception as e:
+            print(f"Error revalidating {provider} {source}-{destination} on {journey_date}: {e}")
+            outcome = "failed"
+        with self._lock:
+            self._pending.discard(key)
+            self._stats[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+
+revalidator = Revalidator()
@@ -0,0 +1,187 @@
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from functions import configfile
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 support is optional
+    httpx = None
+
+
+class HttpClientError(requests.exceptions.RequestException):
+    """
+    Raised for transport errors from the optional HTTP/2 backend.
+    """
+
+
+class ResponseTooLarge(HttpClientError):
+    """
+    Raised when a response body exceeds the configured size limit.
+    """
+
+
+class HttpResponse:
+    """
+    Fully-read response returned by both the requests and the HTTP/2 backends.
+    """
+
+    __slots__ = ("url", "status_code", "headers", "content", "http_version")
+
+    def __init__(self, url, status_code, headers, content, http_version):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.http_version = http_version
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error for url: {self.url}", response=self)
+
+
+class HttpClient:
+    """
+    Shared outbound HTTP client with per-host keep-alive pools, connect/read
+    timeouts, transparent gzip decoding and a response size limit.
+
+    Uses requests by default; when `http2` is set and httpx is installed,
+    requests go over an httpx client with HTTP/2 enabled instead.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, max_response_bytes=None,
+                 pool_maxsize=None, http2=None):
+        self.connect_timeout = connect_timeout or configfile.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or configfile.HTTP_READ_TIMEOUT
+        self.max_response_bytes = max_response_bytes or configfile.HTTP_MAX_RESPONSE_BYTES
+        pool_maxsize = pool_maxsize or configfile.HTTP_POOL_MAXSIZE
+        http2 = configfile.HTTP2_ENABLED if http2 is None else http2
+
+        self._httpx = None
+        self._session = None
+        if http2 and httpx is not None:
+            self._httpx = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=pool_maxsize, max_connections=pool_maxsize * 4),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        else:
+            if http2:
+                print("HTTP/2 requested but httpx is not installed; falling back to HTTP/1.1.")
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    @staticmethod
+    def _check_length(url, headers, limit):
+        length = headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > limit:
+            raise ResponseTooLarge(f"Response from {url} is {length} bytes, limit is {limit}")
+
+    @staticmethod
+    def _read_limited(url, chunks, limit):
+        body = bytearray()
+        for chunk in chunks:
+            body.extend(chunk)
+            if len(body) > limit:
+                raise ResponseTooLarge(f"Response from {url} exceeded {limit} bytes")
+        return bytes(body)
+
+    def request(self, method, url, headers=None, params=None, timeout=None, max_response_bytes=None):
+        """
+        Send a request and return an HttpResponse with the decoded body.
+
+        Args:
+            timeout (float | tuple): Read timeout, or a (connect, read) tuple.
+            max_response_bytes (int): Overrides the client-wide size limit.
+        """
+        limit = max_response_bytes or self.max_response_bytes
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, timeout)
+
+        if self._httpx is not None:
+            try:
+                with self._httpx.stream(method, url, headers=headers, params=params,
+                                        timeout=httpx.Timeout(timeout[1], connect=timeout[0])) as response:
+                    self._check_length(url, response.headers, limit)
+                    content = self._read_limited(url, response.iter_bytes(), limit)
+                    return HttpResponse(str(response.url), response.status_code, response.headers,
+                                        content, response.http_version)
+            except httpx.HTTPError as e:
+                raise HttpClientError(str(e)) from e
+
+        with self._session.request(method, url, headers=headers, params=params,
+                                   timeout=timeout, stream=True) as response:
+            self._check_length(url, response.headers, limit)
+            content = self._read_limited(url, response.iter_content(chunk_size=64 * 1024), limit)
+            return HttpResponse(response.url, response.status_code, response.headers, content, "HTTP/1.1")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        if self._httpx is not None:
+            self._httpx.close()
+        if self._session is not None:
+            self._session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide HttpClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+
+def reset_client(client=None):
+    """
+    Replace the shared client, e.g. with one configured for a stub server.
+    """
+    global _client
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None:
+        old.close()
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+RAPIDAPI_HOSTS = {
+    "priceline": "priceline-com2.p.rapidapi.com",
+    "skyscanner": "sky-scanner3.p.rapidapi.com",
+    "tripadvisor": "tripadvisor16.p.rapidapi.com",
+}
+
+
+def rapidapi_headers(provider):
+    """
+    Headers required by the RapidAPI-hosted flight providers.
+    """
+    return {
+        "x-rapidapi-key": configfile.RAPIDAPI_KEY,
+        "x-rapidapi-host": RAPIDAPI_HOSTS[provider],
+    }
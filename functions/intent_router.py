@@ -0,0 +1,366 @@
+import json
+import re
+import threading
+from collections import deque, namedtuple
+from datetime import date, datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+from functions import search
+from functions.city_index import get_city_index
+
+FARE = "fare"
+SCHEDULE = "schedule"
+LLM = "llm"
+OFF_TOPIC = "off_topic"
+
+# Rows listed in a database answer
+ANSWER_ROWS = 5
+# Lowest city-index score accepted for a place named in a chat message; exact
+# names and aliases score 100, so this only admits close spelling variants
+PLACE_MIN_SCORE = 85
+# Number of recent requests kept per intent for the latency metrics
+LATENCY_SAMPLES = 500
+
+Intent = namedtuple("Intent", ["name", "modes", "source", "destination", "journey_date"])
+
+MODE_PATTERNS = {
+    "flight": re.compile(r"\b(?:flights?|fly|flying|airfares?|planes?|airlines?)\b"),
+    "train": re.compile(r"\b(?:trains?|rail|railways?)\b"),
+    "bus": re.compile(r"\b(?:bus|buses|coach(?:es)?)\b"),
+}
+_FARE = re.compile(r"\b(?:cheapest|cheap|cheaper|lowest|fares?|prices?|costs?|how much|budget)\b")
+_TRAVEL = re.compile(
+    r"\b(?:flight|hotel|train|bus|accommodation|trip|destination|visa|itinerar|travel|"
+    r"baggage|luggage|airport|station|holiday|vacation|tour|ticket|fare|visit|sightseeing|"
+    r"passport|booking|beach|weather|places)"
+)
+
+_MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"(?:,?\s+(\d{4}))?")
+_MONTH_DAY = re.compile(r"\b" + _MONTH + r"\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(\d{4}))?")
+_NUMERIC_DATE = re.compile(r"\b(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?\b")
+_RELATIVE_DATE = re.compile(r"\b(day after tomorrow|tomorrow|today|tonight)\b")
+_RELATIVE_DAYS = {"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2}
+
+_TO = re.compile(r"\bto\b")
+_FROM = re.compile(r"\bfrom\b")
+_BETWEEN = re.compile(r"\bbetween\s+(?P<source>.+?)\s+and\s+(?P<destination>.+)")
+# Words that end a place name
+_PLACE_STOP = frozenset("""
+    on for by in at this next tomorrow today tonight day via under below with and
+    the a an is are of flight flights train trains bus buses fare fares price prices
+    jan feb mar apr may jun jul aug sep oct nov dec january february march april june july
+    august september october november december
+""".split())
+# Words before "to" that are not part of the source place
+_LEAD_WORDS = frozenset("""
+    cheapest cheap lowest fare fares price prices cost show list find any what whats
+    is are the a an me next first last earliest latest flight flights train trains bus
+    buses go going get travel from schedule timings time times when how much
+""".split())
+# Everyday words that fuzzy-match some city name ("safe" -> Salem) and never
+# start or end a place name in a question
+_COMMON_WORDS = frozenset("""
+    i it its we you they he she my our your their can could should would will shall
+    do does did need want take taking pack packing bring book booking safe best good
+    better worth there here trip journey ride way visit route night morning evening
+    afternoon while during before after around about back return only also
+    cheap fast quick long short all any some which who where why what
+""".split())
+_NOT_PLACE = _PLACE_STOP | _COMMON_WORDS
+
+
+class InvalidDate(ValueError):
+    """Raised when a message names a date that does not exist ("31/2")."""
+
+
+def _build_date(year, month, day, today):
+    try:
+        value = date(int(year) if year else today.year, int(month), int(day))
+    except ValueError:
+        raise InvalidDate(f"{day}/{month}" + (f"/{year}" if year else ""))
+    if not year and value < today:
+        value = value.replace(year=value.year + 1)
+    return value
+
+
+def extract_date(text, today=None):
+    """
+    First journey date mentioned in `text` ("24 Dec", "Dec 24 2024",
+    "2024-12-24", "24/12", "tomorrow"), or None. Dates without a year are
+    taken as the next such day on or after today. Raises InvalidDate for a
+    date that does not exist, rather than guessing one.
+    """
+    today = today or datetime.now(search.FLIGHT_TZ).date()
+    match = _ISO_DATE.search(text)
+    if match:
+        return _build_date(*match.groups(), today)
+    match = _DAY_MONTH.search(text)
+    if match:
+        day, month, year = match.groups()
+        return _build_date(year, _MONTHS[month], day, today)
+    match = _MONTH_DAY.search(text)
+    if match:
+        month, day, year = match.groups()
+        return _build_date(year, _MONTHS[month], day, today)
+    match = _NUMERIC_DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        if year and len(year) == 2:
+            year = "20" + year
+        return _build_date(year, month, day, today)
+    match = _RELATIVE_DATE.search(text)
+    if match:
+        return today + timedelta(days=_RELATIVE_DAYS[match.group(1)])
+    return None
+
+
+def _place_words(phrase, from_end=False):
+    """
+    The words that could make up a place name at the start of `phrase`, or
+    at its end for a source read backwards from "to".
+    """
+    words = re.findall(r"[a-z][a-z.'-]*|\d+", phrase)
+    if from_end:
+        words.reverse()
+    place = []
+    for word in words:
+        if word in _NOT_PLACE or word in _LEAD_WORDS or word.isdigit():
+            break
+        place.append(word)
+    if from_end:
+        place.reverse()
+    return place
+
+
+def _resolve_place(words, from_end=False):
+    """
+    Resolve the longest run of up to three words (the last ones for a
+    source, the first ones for a destination) that confidently names a
+    known city.
+    """
+    index = get_city_index()
+    for size in range(min(3, len(words)), 0, -1):
+        phrase = " ".join(words[-size:] if from_end else words[:size])
+        match = index.resolve(phrase)
+        if match and match.score >= PLACE_MIN_SCORE:
+            return match
+    return None
+
+
+def _route_candidates(text):
+    """
+    (source words, source reads from the end, destination words) for each
+    way the text could name a route.
+    """
+    match = _BETWEEN.search(text)
+    if match:
+        yield _place_words(match.group("source")), False, _place_words(match.group("destination"))
+    for to in _TO.finditer(text):
+        before, after = text[:to.start()], text[to.end():]
+        froms = list(_FROM.finditer(before))
+        if froms:
+            yield _place_words(before[froms[-1].end():]), False, _place_words(after)
+            continue
+        trailing_from = _FROM.search(after)
+        if trailing_from:
+            # "flights to Goa from Delhi"
+            yield (_place_words(after[trailing_from.end():]), False,
+                   _place_words(after[:trailing_from.start()]))
+        yield _place_words(before, from_end=True), True, _place_words(after)
+
+
+def extract_route(text):
+    """
+    Resolve "from X to Y", "X to Y", "to Y from X" or "between X and Y" in
+    `text` to a pair of CityMatch objects, or (None, None) unless both ends
+    resolve confidently.
+    """
+    for source_words, from_end, destination_words in _route_candidates(text):
+        destination = _resolve_place(destination_words)
+        source = destination and _resolve_place(source_words, from_end=from_end)
+        if source and destination and source.city != destination.city:
+            return source, destination
+    return None, None
+
+
+def classify(message):
+    """
+    Work out what a chat message asks for. Fare and schedule questions with
+    a resolvable route become FARE or SCHEDULE intents answered from the
+    database (with no journey_date when the date given is invalid, so the
+    answer asks for it); other travel questions go to the LLM. Naming a
+    mode of travel is enough to count as a travel question.
+    """
+    text = message.lower()
+    modes = tuple(mode for mode, pattern in MODE_PATTERNS.items() if pattern.search(text))
+    asks_fare = bool(_FARE.search(text))
+    if modes or asks_fare:
+        source, destination = extract_route(text)
+        if source and destination:
+            try:
+                journey_date = extract_date(text) or datetime.now(search.FLIGHT_TZ).date()
+            except InvalidDate:
+                journey_date = None
+            name = FARE if asks_fare else SCHEDULE
+            return Intent(name, modes or tuple(MODE_PATTERNS), source, destination, journey_date)
+    if modes or _TRAVEL.search(text):
+        return Intent(LLM, modes, None, None, None)
+    return Intent(OFF_TOPIC, (), None, None, None)
+
+
+def _train_fare(prices):
+    if isinstance(prices, str):
+        try:
+            prices = json.loads(prices)
+        except ValueError:
+            return None
+    fares = []
+    for value in (prices or {}).values():
+        try:
+            fares.append(float(value))
+        except (TypeError, ValueError):
+            continue
+    return min(fares) if fares else None
+
+
+def _timestamp(value):
+    """
+    A timestamp from a listing row, which is a datetime, or a string when
+    the row was decoded from a cached JSON payload (HTTP-date for datetime
+    columns, "HH:MM:SS" text for train times).
+    """
+    if isinstance(value, str) and len(value) > 8:
+        try:
+            return parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                return value
+    return value
+
+
+def _clock(value, tz=None):
+    """
+    HH:MM of a row timestamp. Aware values are shown in `tz`; naive ones
+    (bus times, which JSON marks as GMT) keep their wall-clock time.
+    """
+    value = _timestamp(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None and tz is not None:
+            value = value.astimezone(tz)
+        return value.strftime("%H:%M")
+    return str(value or "")[:5]
+
+
+def _times(departure, arrival):
+    return f"{departure}–{arrival}" if arrival else departure
+
+
+def _rupees(fare):
+    return f"₹{float(fare):,.0f}" if fare is not None else "fare n/a"
+
+
+def listing_lines(mode, rows):
+    """
+    (fare, departure, line) per row, for sorting and display.
+    """
+    lines = []
+    for row in rows:
+        if mode == "flight":
+            fare = row.get("fare")
+            departure = _clock(row.get("departure_timestamp"), search.FLIGHT_TZ)
+            arrival = _clock(row.get("arrival_timestamp"), search.FLIGHT_TZ)
+            label = f"{row.get('airline') or 'Flight'} {_times(departure, arrival)},"
+        elif mode == "train":
+            fare = _train_fare(row.get("ticket_prices"))
+            departure = _clock(row.get("departure_time"))
+            label = (f"{row.get('train_name')} ({row.get('train_number')}) "
+                     f"{_times(departure, _clock(row.get('arrival_time')))}, from")
+        else:
+            fare = row.get("fare")
+            departure = _clock(row.get("departure_time"))
+            label = f"{row.get('bus_type') or 'Bus'} {_times(departure, _clock(row.get('arrival_time')))},"
+        lines.append((float(fare) if fare is not None else None, departure, f"{label} {_rupees(fare)}"))
+    return lines
+
+
+def query_rows(mode, source, destination, journey_date):
+    return search.LISTING_QUERIES[mode](source, destination, journey_date)
+
+
+def answer(intent, rows_for=query_rows):
+    """
+    Answer a FARE or SCHEDULE intent from the flight, train and bus tables.
+    `rows_for(mode, source, destination, journey_date)` returns the listing
+    rows; the app passes one that reads through the result cache.
+    """
+    source, destination, journey_date = intent.source, intent.destination, intent.journey_date
+    if journey_date is None:
+        return (f"I couldn't make out the travel date for {source.city} to {destination.city}. "
+                f"Which day do you want to travel? For example \"24 Dec\" or \"2024-12-24\".")
+    day = journey_date.strftime("%a %d %b %Y")
+    sections = []
+    missing = []
+    for mode in intent.modes:
+        route = search.route_for_mode(mode, source, destination)
+        if not all(route):
+            continue
+        rows = rows_for(mode, route[0], route[1], journey_date.isoformat())
+        lines = listing_lines(mode, rows)
+        if not lines:
+            missing.append(f"{mode}s" if mode != "bus" else "buses")
+            continue
+        plural = f"{mode}s" if mode != "bus" else "buses"
+        if intent.name == FARE:
+            lines.sort(key=lambda line: (line[0] is None, line[0] or 0, line[1]))
+            heading = f"Cheapest {plural}"
+        else:
+            lines.sort(key=lambda line: line[1])
+            heading = f"{plural.title()} ({len(lines)} departures, earliest first)"
+        body = "\n".join(f"{i}. {line}" for i, (_, _, line) in enumerate(lines[:ANSWER_ROWS], 1))
+        sections.append(f"{heading} from {source.city} to {destination.city} on {day}:\n{body}")
+
+    if missing:
+        sections.append(
+            f"I don't have stored {', '.join(missing)} from {source.city} to {destination.city} "
+            f"on {day} yet. Search this route on the home page to fetch live results."
+        )
+    if not sections:
+        return f"I couldn't find a way to search {source.city} to {destination.city} in our listings."
+    return "\n\n".join(sections)
+
+
+class IntentMetrics:
+    """
+    Request counts and latency (p50/p95/max) per intent.
+    """
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._counts = {}
+
+    def record(self, intent, seconds):
+        with self._lock:
+            self._counts[intent] = self._counts.get(intent, 0) + 1
+            self._latencies.setdefault(intent, deque(maxlen=self.samples)).append(seconds)
+
+    def stats(self):
+        with self._lock:
+            snapshot = {intent: (self._counts[intent], sorted(values))
+                        for intent, values in self._latencies.items()}
+        stats = {}
+        for intent, (count, values) in snapshot.items():
+            stats[intent] = {
+                "requests": count,
+                "p50_ms": round(values[min(len(values) - 1, int(len(values) * 0.5))] * 1000, 1),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        return stats
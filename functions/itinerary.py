@@ -0,0 +1,135 @@
+import csv
+import io
+from datetime import datetime
+
+# Canonical itinerary fields, shared by every provider adapter. Timestamps are
+# naive local ISO strings ("YYYY-MM-DDTHH:MM:SS"), fares are INR floats.
+FIELDS = (
+    "carrier", "service_number", "source_code", "source_name",
+    "destination_code", "destination_name", "departure", "arrival",
+    "duration_minutes", "stops", "fare", "fare_classes", "cabin",
+    "equipment", "distance_km",
+)
+
+
+def iso_local(value):
+    """
+    Cut a provider timestamp down to the canonical naive local form, dropping
+    any fractional seconds and UTC offset: "2024-12-24T06:10:00.000+05:30"
+    -> "2024-12-24T06:10:00". Returns None for missing values.
+    """
+    if not value or len(value) < 16:
+        return None
+    value = value[:19]
+    return value if len(value) == 19 else value + ":00"
+
+
+class ItineraryBatch:
+    """
+    Column-oriented container of itineraries from one provider.
+
+    Adapters append provider fields with `add`, then run the column-wide
+    conversions (`normalize_timestamps`, `convert_fares`,
+    `fill_durations`) once per batch instead of once per row. The columns
+    go straight to COPY (`copy_to`) and cache invalidation (`routes`).
+    """
+
+    __slots__ = ("mode", "provider", "columns")
+
+    def __init__(self, mode, provider):
+        self.mode = mode
+        self.provider = provider
+        self.columns = {name: [] for name in FIELDS}
+
+    def add(self, carrier, service_number, source_code, source_name, destination_code,
+            destination_name, departure, arrival, duration_minutes=None, stops=None, fare=None,
+            fare_classes=None, cabin=None, equipment=None, distance_km=None):
+        columns = self.columns
+        columns["carrier"].append(carrier)
+        columns["service_number"].append(service_number)
+        columns["source_code"].append(source_code)
+        columns["source_name"].append(source_name)
+        columns["destination_code"].append(destination_code)
+        columns["destination_name"].append(destination_name)
+        columns["departure"].append(departure)
+        columns["arrival"].append(arrival)
+        columns["duration_minutes"].append(duration_minutes)
+        columns["stops"].append(stops)
+        columns["fare"].append(fare)
+        columns["fare_classes"].append(fare_classes)
+        columns["cabin"].append(cabin)
+        columns["equipment"].append(equipment)
+        columns["distance_km"].append(distance_km)
+
+    def __len__(self):
+        return len(self.columns["departure"])
+
+    def __bool__(self):
+        return len(self) > 0
+
+    # Column-wide conversions
+
+    def normalize_timestamps(self):
+        for name in ("departure", "arrival"):
+            self.columns[name] = [iso_local(value) for value in self.columns[name]]
+        return self
+
+    def convert_fares(self, rate=1.0):
+        """
+        Turn raw provider prices (numbers or numeric strings) into INR floats
+        rounded to paise; anything unparseable becomes None.
+        """
+        converted = []
+        for value in self.columns["fare"]:
+            try:
+                converted.append(round(float(value) * rate, 2))
+            except (TypeError, ValueError):
+                converted.append(None)
+        self.columns["fare"] = converted
+        return self
+
+    def fill_durations(self):
+        """
+        Derive missing durations from the departure and arrival columns.
+        """
+        columns = self.columns
+        durations = columns["duration_minutes"]
+        for i, (minutes, departure, arrival) in enumerate(zip(durations, columns["departure"], columns["arrival"])):
+            if minutes is None and departure and arrival:
+                delta = datetime.fromisoformat(arrival) - datetime.fromisoformat(departure)
+                durations[i] = int(delta.total_seconds() // 60)
+        return self
+
+    # Derived columns
+
+    def dates(self, name="departure"):
+        return [value[:10] if value else None for value in self.columns[name]]
+
+    def times(self, name="departure"):
+        return [value[11:19] if value else None for value in self.columns[name]]
+
+    def datetimes(self, name="departure"):
+        return [datetime.fromisoformat(value) if value else None for value in self.columns[name]]
+
+    def routes(self):
+        """
+        Distinct (source_code, destination_code, date) routes in the batch.
+        """
+        return set(zip(self.columns["source_code"], self.columns["destination_code"], self.dates()))
+
+    # Output
+
+    def copy_to(self, cursor, table, column_map):
+        """
+        COPY the batch into `table`. `column_map` is a sequence of
+        (table_column, values) pairs, where values is a column list from
+        this batch or one derived from it, all the same length.
+        """
+        if not self:
+            return 0
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(*(values for _, values in column_map)))
+        buffer.seek(0)
+        names = ", ".join(column for column, _ in column_map)
+        cursor.copy_expert(f"COPY {table} ({names}) FROM STDIN WITH (FORMAT csv)", buffer)
+        return len(self)
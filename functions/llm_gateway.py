@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from functions import configfile
+
+# Number of recent calls kept for the queue-wait metrics
+WAIT_SAMPLES = 500
+
+_END = object()
+
+
+class GatewayBusy(Exception):
+    """Raised when the gateway's workers and wait queue are all taken."""
+
+
+class GatewayTimeout(TimeoutError):
+    """Raised when a call does not finish before its deadline."""
+
+
+class LLMGateway:
+    """
+    Run chat model calls on a dedicated, bounded thread pool.
+
+    At most `max_workers` calls run at once and `max_queue` more wait; a
+    call beyond that is refused straight away with GatewayBusy rather than
+    tying up another web thread. Every call has a deadline covering both
+    queueing and generation: a call still queued at its deadline never
+    starts, and the caller gets GatewayTimeout.
+
+    The gateway has the same `invoke`/`stream` interface as the model
+    returned by `get_llm`, so it can stand in for it.
+    """
+
+    def __init__(self, get_llm, max_workers=None, max_queue=None, deadline=None):
+        self.get_llm = get_llm
+        self.max_workers = max_workers or configfile.LLM_GATEWAY_WORKERS
+        self.max_queue = configfile.LLM_GATEWAY_QUEUE if max_queue is None else max_queue
+        self.deadline = deadline or configfile.LLM_GATEWAY_DEADLINE
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-gateway")
+        self._lock = threading.Lock()
+        self._admitted = 0  # queued or running
+        self._running = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                       "timeouts": 0, "expired_in_queue": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _submit(self, fn, deadline):
+        """
+        Queue `fn(expires_at)` on the pool, or raise GatewayBusy when full.
+        """
+        with self._lock:
+            if self._admitted >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise GatewayBusy("Too many chatbot requests in progress")
+            self._admitted += 1
+            self._stats["submitted"] += 1
+        submitted = time.monotonic()
+        expires_at = submitted + (deadline or self.deadline)
+
+        def run():
+            with self._lock:
+                self._waits.append(time.monotonic() - submitted)
+                self._running += 1
+            try:
+                if time.monotonic() >= expires_at:
+                    self._count("expired_in_queue")
+                    raise GatewayTimeout("Chatbot request expired while queued")
+                return fn(expires_at)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            self._release()
+            raise
+        # Runs once the call finishes or is cancelled while still queued
+        future.add_done_callback(lambda _: self._release())
+        return future, expires_at
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def invoke(self, messages, deadline=None):
+        """
+        Call the model and wait for the whole reply, at most until the deadline.
+        """
+        future, expires_at = self._submit(lambda expires_at: self.get_llm().invoke(messages), deadline)
+        try:
+            result = future.result(timeout=max(expires_at - time.monotonic(), 0))
+        except (FutureTimeout, TimeoutError):
+            future.cancel()
+            self._count("timeouts")
+            raise GatewayTimeout("Chatbot request timed out")
+        except Exception:
+            self._count("failed")
+            raise
+        self._count("completed")
+        return result
+
+    def stream(self, messages, deadline=None):
+        """
+        Start streaming a reply and return an iterator over its chunks. The
+        call is admitted (or refused with GatewayBusy) before this returns;
+        the iterator raises GatewayTimeout if the deadline passes, and
+        closing it early stops generation at the next chunk.
+        """
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce(expires_at):
+            try:
+                for chunk in self.get_llm().stream(messages):
+                    if cancelled.is_set() or time.monotonic() >= expires_at:
+                        break
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(_END)
+
+        future, expires_at = self._submit(produce, deadline)
+        return self._iterate(chunks, future, cancelled, expires_at)
+
+    def _iterate(self, chunks, future, cancelled, expires_at):
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=max(expires_at - time.monotonic(), 0))
+                except queue.Empty:
+                    self._count("timeouts")
+                    raise GatewayTimeout("Chatbot request timed out")
+                if item is _END:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                    self._count("completed")
+                    return
+                if isinstance(item, Exception):
+                    self._count("failed")
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            future.cancel()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            waits = sorted(self._waits)
+            stats["running"] = self._running
+            stats["queued"] = self._admitted - self._running
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        stats["queue_wait_ms"] = {
+            "p50": round(waits[min(len(waits) - 1, int(len(waits) * 0.5))] * 1000, 1) if waits else 0.0,
+            "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+        return stats
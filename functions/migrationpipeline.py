@@ -1,119 +1,480 @@
-import psycopg2
 from pymongo import MongoClient
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+import io
 import json
+import sys
+import threading
+import time
+
+from functions import configfile, db_pool, schema
+from functions.background import PeriodicJob
+from functions.result_cache import invalidate_routes
+from functions.singleflight import advisory_lock
+
+TRAIN_DB = "TrainDB"
+
+# Name of the high-water mark row for the train collection
+TRAIN_WATERMARK = "mongo_train_details"
+
+# Column order shared by the incremental INSERT and the backfill COPY
+TRAIN_COLUMNS = (
+    "train_number", "train_name", "source_station_code", "source_city",
+    "destination_station_code", "destination_city", "departure_date", "ticket_prices",
+)
+
+_mongo_client = None
+_mongo_lock = threading.Lock()
 
 # MongoDB setup
 def get_mongo_connection():
+    """
+    Return the Mongo train collection. The client is created once per
+    process and reused, since MongoClient keeps its own connection pool.
+    """
+    global _mongo_client
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["TrainDatabase"]
-        collection = db["TrainDetails"]
+        with _mongo_lock:
+            if _mongo_client is None:
+                _mongo_client = MongoClient(configfile.MONGO_URI)
+        db = _mongo_client[configfile.MONGO_TRAIN_DB]
+        collection = db[configfile.MONGO_TRAIN_COLLECTION]
         return collection
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
         return None
 
 # PostgreSQL setup
-def get_postgres_connection():
+def get_postgres_connection(db_name=TRAIN_DB):
+    return db_pool.connection(db_name)
+
+def load_watermark(name=TRAIN_WATERMARK):
+    """
+    Return the last migrated ObjectId for `name`, or None before the first run.
+    """
+    from bson import ObjectId
+    with get_postgres_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT last_id FROM migration_watermarks WHERE name = %s", (name,))
+            row = cursor.fetchone()
+    return ObjectId(row[0]) if row else None
+
+def train_rows(documents):
+    """
+    Map Mongo train documents to TrainDetails rows, dropping those without a
+    travel date since departure_date is part of the key.
+    """
+    return [train_row(doc) for doc in documents if doc.get("Travel Date")]
+
+def train_row(record):
+    """
+    Map a Mongo train document to a TrainDetails row.
+    """
+    return (
+        record.get("Train Number", "N/A"),
+        record.get("Train Name", "N/A"),
+        record.get("Source Station Code", "N/A"),
+        record.get("Source City", "N/A"),
+        record.get("Destination Station Code", "N/A"),
+        record.get("Destination City", "N/A"),
+        record.get("Travel Date", None),
+        json.dumps(record.get("Ticket Prices", {}), default=str),
+    )
+
+def write_train_batch(documents, watermark=TRAIN_WATERMARK):
+    """
+    Bulk insert one batch of Mongo documents and advance the high-water mark
+    in the same transaction, so a failed batch is retried on the next run.
+    Returns the (source, destination, date) routes inserted.
+    """
+    insert_query = """
+    INSERT INTO TrainDetails (
+        train_number, train_name, source_station_code, source_city,
+        destination_station_code, destination_city, departure_date, ticket_prices
+    ) VALUES %s
+    ON CONFLICT DO NOTHING  -- Prevent duplicate entries
+    RETURNING source_station_code, destination_station_code, departure_date::TEXT
+    """
+    rows = train_rows(documents)
+    routes = []
+    with get_postgres_connection() as connection:
+        with connection.cursor() as cursor:
+            if rows:
+                routes = execute_values(cursor, insert_query, rows, page_size=len(rows), fetch=True)
+            cursor.execute("""
+                INSERT INTO migration_watermarks (name, last_id, migrated_rows, updated_at)
+                VALUES (%s, %s, %s, now())
+                ON CONFLICT (name) DO UPDATE
+                SET last_id = EXCLUDED.last_id,
+                    migrated_rows = migration_watermarks.migrated_rows + EXCLUDED.migrated_rows,
+                    updated_at = now()
+            """, (watermark, str(documents[-1]["_id"]), len(documents)))
+    return routes
+
+def migrate_new_documents(batch_size=None, max_batches=None):
+    """
+    Copy train documents added to Mongo since the last run into Postgres.
+
+    Documents are read in `_id` order from the stored high-water mark through
+    a batched cursor and written with one multi-row INSERT per batch. Only one
+    process migrates at a time; others return immediately. Returns the number
+    of documents migrated.
+    """
+    batch_size = batch_size or configfile.TRAIN_MIGRATION_BATCH_SIZE
+    collection = get_mongo_connection()
+    if collection is None:
+        print("Failed to connect to MongoDB. Aborting data transfer.")
+        return 0
+
     try:
-        connection = psycopg2.connect(
-            host="localhost",
-            database="TrainDB",  # Replace with your PostgreSQL database name
-            user="postgres",  # Replace with your PostgreSQL username
-            password="0000"  # Replace with your PostgreSQL password
-        )
-        return connection
+        with advisory_lock(("migration", TRAIN_WATERMARK), timeout=0):
+            last_id = load_watermark()
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = collection.find(query).sort("_id", 1).batch_size(batch_size)
+
+            migrated = 0
+            batches = 0
+            batch = []
+            try:
+                for document in cursor:
+                    batch.append(document)
+                    if len(batch) < batch_size:
+                        continue
+                    invalidate_routes("train", write_train_batch(batch))
+                    migrated += len(batch)
+                    batches += 1
+                    batch = []
+                    if max_batches and batches >= max_batches:
+                        break
+                if batch:
+                    invalidate_routes("train", write_train_batch(batch))
+                    migrated += len(batch)
+            finally:
+                cursor.close()
+    except TimeoutError:
+        print("Train migration already running elsewhere; skipping this run.")
+        return 0
+    return migrated
+
+# Transfer data from MongoDB to PostgreSQL
+def transfer_data_to_postgres():
+    try:
+        migrated = migrate_new_documents()
+        if migrated:
+            print(f"Transferred {migrated} records from MongoDB to PostgreSQL.")
+        else:
+            print("No new data found in MongoDB to transfer.")
+        return migrated
     except Exception as e:
-        print(f"Error connecting to PostgreSQL: {e}")
+        print(f"Error transferring data to PostgreSQL: {e}")
+        return 0
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_background_migration(interval=None):
+    """
+    Start the background migration worker once per process and return it.
+    Returns None when the interval is 0 (disabled).
+    """
+    global _worker
+    interval = configfile.TRAIN_MIGRATION_INTERVAL if interval is None else interval
+    if interval <= 0:
         return None
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = PeriodicJob("train-migration", migrate_new_documents, interval)
+            _worker.start()
+        return _worker
 
-# Create PostgreSQL table for train data
-def create_postgres_table():
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS TrainDetails (
-        train_number TEXT,
-        train_name TEXT,
-        source_station_code TEXT,
-        source_city TEXT,
-        destination_station_code TEXT,
-        destination_city TEXT,
-        travel_date DATE,
-        ticket_prices JSONB
-    );
+def request_migration():
+    """
+    Wake the background worker for an early run. Returns False if it is not running.
     """
+    if _worker is None or not _worker.is_alive():
+        return False
+    _worker.request_run()
+    return True
+
+def migration_status():
+    if _worker is None:
+        return {"running": False}
+    return _worker.status()
+
+# Bulk backfill of the full collection, resumable from per-partition checkpoints
+
+def plan_partitions(collection, partitions):
+    """
+    Split the collection into `partitions` contiguous `_id` ranges of equal
+    ObjectId time span. Returns (lower, upper, upper_inclusive) tuples, or an
+    empty list for an empty collection.
+    """
+    from bson import ObjectId
+    first = collection.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if first is None:
+        return []
+    start, end = first["_id"].generation_time, last["_id"].generation_time
+    bounds = [first["_id"]]
+    for i in range(1, partitions):
+        boundary = ObjectId.from_datetime(start + (end - start) * i / partitions)
+        if boundary > bounds[-1]:
+            bounds.append(boundary)
+    ranges = [(bounds[i], bounds[i + 1], False) for i in range(len(bounds) - 1)]
+    ranges.append((bounds[-1], last["_id"], True))
+    return ranges
+
+def load_or_plan_checkpoints(run_name, collection, partitions, db_name=TRAIN_DB):
+    """
+    Return the checkpoint rows for `run_name`, planning and storing the
+    partition ranges on the first run. A resumed run keeps its original
+    ranges whatever `partitions` is set to.
+    """
+    query = """
+        SELECT partition, lower_id, upper_id, upper_inclusive, last_id, copied_rows, done
+        FROM backfill_checkpoints WHERE run_name = %s ORDER BY partition
+    """
+    with get_postgres_connection(db_name) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query, (run_name,))
+            rows = cursor.fetchall()
+            if not rows:
+                ranges = plan_partitions(collection, partitions)
+                for partition, (lower, upper, inclusive) in enumerate(ranges):
+                    cursor.execute("""
+                        INSERT INTO backfill_checkpoints
+                            (run_name, partition, lower_id, upper_id, upper_inclusive)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (run_name, partition, str(lower), str(upper), inclusive))
+                cursor.execute(query, (run_name,))
+                rows = cursor.fetchall()
+    columns = ("partition", "lower_id", "upper_id", "upper_inclusive", "last_id", "copied_rows", "done")
+    return [dict(zip(columns, row)) for row in rows]
+
+def copy_train_batch(documents, run_name, partition, db_name=TRAIN_DB):
+    """
+    COPY one batch into a staging table, merge it into TrainDetails skipping
+    rows that already exist, and record the partition checkpoint in the same
+    transaction.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(train_rows(documents))
+    buffer.seek(0)
+    columns = ", ".join(TRAIN_COLUMNS)
+    with get_postgres_connection(db_name) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMP TABLE train_backfill_staging
+                (LIKE TrainDetails INCLUDING DEFAULTS) ON COMMIT DROP
+            """)
+            cursor.copy_expert(f"COPY train_backfill_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(f"""
+                INSERT INTO TrainDetails ({columns})
+                SELECT {columns} FROM train_backfill_staging
+                ON CONFLICT DO NOTHING
+            """)
+            cursor.execute("""
+                UPDATE backfill_checkpoints
+                SET last_id = %s, copied_rows = copied_rows + %s, updated_at = now()
+                WHERE run_name = %s AND partition = %s
+            """, (str(documents[-1]["_id"]), len(documents), run_name, partition))
+
+def mark_partition_done(run_name, partition, db_name=TRAIN_DB):
+    with get_postgres_connection(db_name) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE backfill_checkpoints SET done = TRUE, updated_at = now()
+                WHERE run_name = %s AND partition = %s
+            """, (run_name, partition))
+
+
+class BackfillProgress:
+    """
+    Thread-safe counters for a backfill run, printed periodically as rows
+    copied, rows/sec over the last interval and overall, and lag.
+
+    Lag is reported two ways: documents left to copy, and how far behind the
+    newest document the slowest partition's position is in ObjectId time.
+    """
+
+    def __init__(self, total_rows, already_copied, newest_time):
+        self.total_rows = total_rows
+        self.copied = already_copied
+        self.newest_time = newest_time
+        self.started = time.monotonic()
+        self.session_rows = 0
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._last_report = (self.started, 0)
+
+    def record(self, partition, rows, last_id):
+        with self._lock:
+            self.copied += rows
+            self.session_rows += rows
+            self._positions[partition] = last_id.generation_time
+
+    def finish(self, partition):
+        with self._lock:
+            self._positions.pop(partition, None)
+
+    def report(self):
+        now = time.monotonic()
+        with self._lock:
+            last_at, last_rows = self._last_report
+            interval_rate = (self.session_rows - last_rows) / max(now - last_at, 1e-6)
+            overall_rate = self.session_rows / max(now - self.started, 1e-6)
+            self._last_report = (now, self.session_rows)
+            remaining = max(self.total_rows - self.copied, 0)
+            behind = min(self._positions.values()) if self._positions else None
+        lag = f"{(self.newest_time - behind).total_seconds():.0f}s" if behind else "0s"
+        eta = f"{remaining / overall_rate:.0f}s" if overall_rate > 0 else "n/a"
+        line = (f"[backfill] {self.copied}/{self.total_rows} rows, "
+                f"{interval_rate:.0f} rows/s (avg {overall_rate:.0f}), "
+                f"lag {remaining} docs / {lag}, eta {eta}")
+        print(line, file=sys.stderr, flush=True)
+
+
+def backfill_partition(collection, checkpoint, run_name, batch_size, progress, db_name=TRAIN_DB):
+    """
+    Stream one partition from its checkpoint in `_id` order, copying each
+    full batch before reading the next.
+    """
+    from bson import ObjectId
+    partition = checkpoint["partition"]
+    upper_op = "$lte" if checkpoint["upper_inclusive"] else "$lt"
+    id_filter = {upper_op: ObjectId(checkpoint["upper_id"])}
+    if checkpoint["last_id"]:
+        id_filter["$gt"] = ObjectId(checkpoint["last_id"])
+    else:
+        id_filter["$gte"] = ObjectId(checkpoint["lower_id"])
+    progress.record(partition, 0, ObjectId(checkpoint["last_id"] or checkpoint["lower_id"]))
+
+    cursor = collection.find({"_id": id_filter}, no_cursor_timeout=True).sort("_id", 1).batch_size(batch_size)
     try:
-        connection = get_postgres_connection()
-        if connection is None:
-            return
-
-        cursor = connection.cursor()
-        cursor.execute(create_table_query)
-        connection.commit()
-        print("Table TrainDetails created or already exists.")
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                copy_train_batch(batch, run_name, partition, db_name)
+                progress.record(partition, len(batch), batch[-1]["_id"])
+                batch = []
+        if batch:
+            copy_train_batch(batch, run_name, partition, db_name)
+            progress.record(partition, len(batch), batch[-1]["_id"])
+    finally:
         cursor.close()
-        connection.close()
-    except Exception as e:
-        print(f"Error creating table in PostgreSQL: {e}")
+    mark_partition_done(run_name, partition, db_name)
+    progress.finish(partition)
 
-# Transfer data from MongoDB to PostgreSQL
-def transfer_data_to_postgres():
-    # Get MongoDB data
-    collection = get_mongo_connection()
+def run_backfill(run_name="train-backfill", batch_size=5000, partitions=1, report_every=10.0,
+                 mongo_uri=None, db_name=TRAIN_DB, advance_watermark=True):
+    """
+    Copy the whole Mongo train collection into Postgres in resumable batches.
+
+    Re-running with the same `run_name` resumes each partition from its last
+    committed batch. Once every partition is done the incremental migrator's
+    high-water mark is moved up to the end of the backfilled range.
+    """
+    if mongo_uri:
+        client = MongoClient(mongo_uri)
+        collection = client[configfile.MONGO_TRAIN_DB][configfile.MONGO_TRAIN_COLLECTION]
+    else:
+        collection = get_mongo_connection()
     if collection is None:
-        print("Failed to connect to MongoDB. Aborting data transfer.")
-        return
+        print("Failed to connect to MongoDB. Aborting backfill.")
+        return 1
+
+    from bson import ObjectId
+    schema.migrate(db_name, schema.TRAIN_MIGRATIONS)
+    checkpoints = load_or_plan_checkpoints(run_name, collection, max(partitions, 1), db_name)
+    if not checkpoints:
+        print("No data found in MongoDB to backfill.")
+        return 0
 
+    pending = [cp for cp in checkpoints if not cp["done"]]
+    first_id = ObjectId(checkpoints[0]["lower_id"])
+    last_id = ObjectId(checkpoints[-1]["upper_id"])
+    total = collection.count_documents({"_id": {"$gte": first_id, "$lte": last_id}})
+    progress = BackfillProgress(total, sum(cp["copied_rows"] for cp in checkpoints), last_id.generation_time)
+    print(f"Backfill {run_name}: {len(pending)} of {len(checkpoints)} partitions pending, {total} documents in range.")
+
+    stop_reporting = threading.Event()
+    def reporter():
+        while not stop_reporting.wait(report_every):
+            progress.report()
+    reporter_thread = threading.Thread(target=reporter, name="backfill-progress", daemon=True)
+    reporter_thread.start()
+
+    failed = False
     try:
-        mongo_data = list(collection.find({}))  # Fetch all records from MongoDB
-        if not mongo_data:
-            print("No data found in MongoDB to transfer.")
-            return
-
-        # Connect to PostgreSQL
-        connection = get_postgres_connection()
-        if connection is None:
-            print("Failed to connect to PostgreSQL. Aborting data transfer.")
-            return
-
-        cursor = connection.cursor()
-
-        # Insert data into PostgreSQL
-        insert_query = """
-        INSERT INTO TrainDetails (
-            train_number, train_name, source_station_code, source_city,
-            destination_station_code, destination_city, travel_date, ticket_prices
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT DO NOTHING;  -- Prevent duplicate entries
-        """
-        for record in mongo_data:
-            # Prepare the data
-            train_number = record.get("Train Number", "N/A")
-            train_name = record.get("Train Name", "N/A")
-            source_station_code = record.get("Source Station Code", "N/A")
-            source_city = record.get("Source City", "N/A")
-            destination_station_code = record.get("Destination Station Code", "N/A")
-            destination_city = record.get("Destination City", "N/A")
-            travel_date = record.get("Travel Date", None)
-            ticket_prices = record.get("Ticket Prices", {})
-
-            # Execute the insert query
-            cursor.execute(
-                insert_query,
-                (
-                    train_number, train_name, source_station_code, source_city,
-                    destination_station_code, destination_city, travel_date, json.dumps(ticket_prices)
-                )
-            )
-
-        connection.commit()
-        print(f"Transferred {len(mongo_data)} records from MongoDB to PostgreSQL.")
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1), thread_name_prefix="backfill") as executor:
+            futures = {
+                executor.submit(backfill_partition, collection, cp, run_name, batch_size, progress, db_name): cp["partition"]
+                for cp in pending
+            }
+            for future, partition in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed = True
+                    print(f"Backfill partition {partition} failed: {e}")
+    finally:
+        stop_reporting.set()
+        progress.report()
 
-        cursor.close()
-        connection.close()
-    except Exception as e:
-        print(f"Error transferring data to PostgreSQL: {e}")
+    if failed:
+        print(f"Backfill {run_name} incomplete; re-run the same command to resume.")
+        return 1
+
+    if advance_watermark:
+        with get_postgres_connection(db_name) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO migration_watermarks (name, last_id, updated_at)
+                    VALUES (%s, %s, now())
+                    ON CONFLICT (name) DO UPDATE
+                    SET last_id = GREATEST(migration_watermarks.last_id, EXCLUDED.last_id),
+                        updated_at = now()
+                """, (TRAIN_WATERMARK, str(last_id)))
+    print(f"Backfill {run_name} complete: {progress.copied} rows copied.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m functions.migrationpipeline",
+                                     description="Move train records from MongoDB into PostgreSQL.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("migrate", help="copy documents added since the last run (default)")
+    backfill = commands.add_parser("backfill", help="resumable bulk copy of the whole collection")
+    backfill.add_argument("--run-name", default="train-backfill",
+                          help="checkpoint name; re-use it to resume an interrupted run")
+    backfill.add_argument("--batch-size", type=int, default=5000)
+    backfill.add_argument("--partitions", type=int, default=1,
+                          help="number of parallel readers over disjoint _id ranges")
+    backfill.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    backfill.add_argument("--mongo-uri", help="source MongoDB URI (defaults to TRANSITGUIDE_MONGO_URI)")
+    backfill.add_argument("--target-db", default=TRAIN_DB, help="logical target database from configfile")
+    backfill.add_argument("--no-advance-watermark", action="store_true",
+                          help="leave the incremental migrator's high-water mark alone")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        return run_backfill(
+            run_name=args.run_name,
+            batch_size=args.batch_size,
+            partitions=args.partitions,
+            report_every=args.report_every,
+            mongo_uri=args.mongo_uri,
+            db_name=args.target_db,
+            advance_watermark=not args.no_advance_watermark,
+        )
+    schema.migrate(TRAIN_DB)  # Ensure PostgreSQL tables exist
+    transfer_data_to_postgres()  # Transfer new data from MongoDB to PostgreSQL
+    return 0
 
 # Main function to run the pipeline
 if __name__ == "__main__":
-    create_postgres_table()  # Ensure PostgreSQL table exists
-    transfer_data_to_postgres()  # Transfer data from MongoDB to PostgreSQL
\ No newline at end of file
+    sys.exit(main())
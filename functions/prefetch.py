@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from functions import configfile, db_pool, freshness, providers, search
+from functions.background import PeriodicJob
+from functions.city_index import get_city_index
+from functions.scheduler import PREFETCH, QuotaExceeded, provider_scheduler
+
+GLOBAL_DB = "TransitGlobal"
+MODES = ("flight", "train", "bus")
+
+
+class RoutePopularity:
+    """
+    Decaying search counts per (source, destination) city pair.
+
+    Searches are counted in memory by `record`, which is cheap enough to call
+    on every request, and added to the route_popularity table by `flush`.
+    Scores halve every `half_life` seconds, so the ranking follows recent
+    traffic and is shared by every process writing to the table.
+    """
+
+    def __init__(self, db_name=GLOBAL_DB, half_life=None):
+        self.db_name = db_name
+        self.half_life = half_life or configfile.PREFETCH_HALF_LIFE_HOURS * 3600
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+
+    def record(self, source_city, destination_city):
+        if not source_city or not destination_city or source_city == destination_city:
+            return
+        with self._lock:
+            self._pending[(source_city, destination_city)] += 1
+
+    def flush(self):
+        """
+        Add the searches counted since the last flush to route_popularity.
+        Returns the number of searches written.
+        """
+        with self._lock:
+            pending = dict(self._pending)
+            self._pending.clear()
+        if not pending:
+            return 0
+        try:
+            with db_pool.connection(self.db_name) as conn:
+                with conn.cursor() as cursor:
+                    for (source_city, destination_city), count in pending.items():
+                        cursor.execute("""
+                            INSERT INTO route_popularity (source_city, destination_city, score, updated_at)
+                            VALUES (%s, %s, %s, now())
+                            ON CONFLICT (source_city, destination_city) DO UPDATE
+                            SET score = route_popularity.score
+                                        * power(0.5, EXTRACT(EPOCH FROM now() - route_popularity.updated_at) / %s)
+                                        + EXCLUDED.score,
+                                updated_at = now()
+                        """, (source_city, destination_city, count, self.half_life))
+        except Exception:
+            with self._lock:
+                for key, count in pending.items():
+                    self._pending[key] += count
+            raise
+        return sum(pending.values())
+
+    def top(self, limit):
+        """
+        The `limit` most-searched routes as (source_city, destination_city, score).
+        """
+        with db_pool.connection(self.db_name) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT source_city, destination_city,
+                           score * power(0.5, EXTRACT(EPOCH FROM now() - updated_at) / %s) AS current_score
+                    FROM route_popularity
+                    ORDER BY current_score DESC
+                    LIMIT %s
+                """, (self.half_life, limit))
+                return cursor.fetchall()
+
+
+route_popularity = RoutePopularity()
+
+
+def parse_hours(window):
+    """
+    Parse an "start-end" hour window such as "0-6" or "22-5" into a pair of
+    hours, or None for an empty window (no restriction).
+    """
+    window = (window or "").strip()
+    if not window:
+        return None
+    start, _, end = window.partition("-")
+    return int(start) % 24, int(end or start) % 24
+
+
+def in_offpeak(now=None, window=None):
+    hours = parse_hours(configfile.PREFETCH_OFFPEAK_HOURS if window is None else window)
+    if hours is None:
+        return True
+    hour = (now or datetime.now(search.FLIGHT_TZ)).hour
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def prefetch_provider(provider, route, journey_date):
+    """
+    Fetch one provider's listings for a route and date at prefetch priority.
+    The scheduler counts the call against the prefetcher's quota share and
+    refuses it with QuotaExceeded once the share is used.
+    """
+    return provider_scheduler.run(
+        provider, lambda: providers.fetch(provider, route[0], route[1], journey_date),
+        priority=PREFETCH, timeout=configfile.PREFETCH_SLOT_TIMEOUT,
+    )
+
+
+def prefetch_route(source_match, destination_match, journey_date, counts):
+    """
+    Refresh every mode of one route and date whose listing is empty, stale
+    or expired. Returns False if the off-peak window closed before it
+    finished.
+    """
+    for mode in MODES:
+        if not in_offpeak():
+            return False
+        route = search.route_for_mode(mode, source_match, destination_match)
+        if not all(route):
+            continue
+        try:
+            state = freshness.classify(mode, search.last_fetched(mode, route[0], route[1], journey_date))
+        except Exception as e:
+            print(f"Error checking {mode} freshness for {route}: {e}")
+            continue
+        counts[state] += 1
+        if state == freshness.FRESH:
+            continue
+        for provider, provider_mode in providers.PROVIDER_MODES.items():
+            if provider_mode != mode:
+                continue
+            if not provider_scheduler.share_left(provider, PREFETCH):
+                counts["quota_share_used"] += 1
+                continue
+            try:
+                prefetch_provider(provider, route, journey_date)
+                counts["fetches"] += 1
+            except (QuotaExceeded, TimeoutError) as e:
+                counts["skipped"] += 1
+                print(f"Skipped prefetching {provider} {route} {journey_date}: {e}")
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Error prefetching {provider} {route} {journey_date}: {e}")
+    return True
+
+
+_stats_lock = threading.Lock()
+_last_cycle = {}
+
+
+def prefetch_hot_routes(limit=None, days=None):
+    """
+    Refresh flights, trains and buses for the most-searched routes over the
+    next `days` days, skipping listings that are still fresh. Only
+    runs inside the off-peak window and stops when it closes. Returns the
+    number of provider fetches made.
+    """
+    limit = configfile.PREFETCH_TOP_ROUTES if limit is None else limit
+    days = configfile.PREFETCH_DAYS if days is None else days
+    route_popularity.flush()
+    if not in_offpeak():
+        return 0
+
+    started = time.monotonic()
+    counts = defaultdict(int)
+    index = get_city_index()
+    today = datetime.now(search.FLIGHT_TZ).date()
+    dates = [(today + timedelta(days=offset)).isoformat() for offset in range(days)]
+
+    finished = True
+    for source_city, destination_city, _ in route_popularity.top(limit):
+        source_match = index.resolve(source_city)
+        destination_match = index.resolve(destination_city)
+        if not source_match or not destination_match:
+            continue
+        counts["routes"] += 1
+        for journey_date in dates:
+            finished = prefetch_route(source_match, destination_match, journey_date, counts)
+            if not finished:
+                break
+        if not finished:
+            break
+
+    with _stats_lock:
+        _last_cycle.clear()
+        _last_cycle.update(counts)
+        _last_cycle["completed"] = finished
+        _last_cycle["duration"] = round(time.monotonic() - started, 3)
+    return counts["fetches"]
+
+
+_job = None
+_job_lock = threading.Lock()
+
+
+def start_background_prefetch(interval=None):
+    """
+    Start the prefetch job once per process and return it.
+    """
+    global _job
+    interval = configfile.PREFETCH_INTERVAL if interval is None else interval
+    with _job_lock:
+        if _job is None or not _job.is_alive():
+            _job = PeriodicJob("route-prefetch", prefetch_hot_routes, interval or None)
+            _job.start()
+        return _job
+
+
+def prefetch_status():
+    status = {"running": False} if _job is None else _job.status()
+    status["offpeak_hours"] = configfile.PREFETCH_OFFPEAK_HOURS
+    status["in_offpeak"] = in_offpeak()
+    with _stats_lock:
+        status["last_cycle"] = dict(_last_cycle)
+    return status
+
+
+if __name__ == "__main__":
+    print(f"Prefetched {prefetch_hot_routes()} provider listings.")
@@ -0,0 +1,59 @@
+import importlib
+import threading
+import time
+from collections import namedtuple
+
+# Where each provider adapter lives and which travel mode it refreshes.
+# Modules are imported on first use so importing the app makes no network
+# calls and pays for no adapter dependencies up front.
+ProviderSpec = namedtuple("ProviderSpec", ["module", "function", "mode"])
+
+PROVIDERS = {
+    "train": ProviderSpec("functions.fetch_store_train", "fetch_train_details", "train"),
+    "bus": ProviderSpec("functions.fetch_store_buses", "fetch_and_insert_bus_data", "bus"),
+    "priceline": ProviderSpec("functions.fetch_store_priceline", "get_priceline_flights", "flight"),
+    "skyscanner": ProviderSpec("functions.fetch_store_skyscanner", "get_skyScanner_flights", "flight"),
+    "tripadvisor": ProviderSpec("functions.fetch_store_tripadvisor", "get_tripadvisor_flights", "flight"),
+}
+
+# Travel mode each provider refreshes
+PROVIDER_MODES = {name: spec.mode for name, spec in PROVIDERS.items()}
+
+_adapters = {}
+_load_times = {}
+_lock = threading.Lock()
+
+
+def get_adapter(name):
+    """
+    Return the fetch function for a provider, importing its module the first
+    time it is asked for.
+    """
+    adapter = _adapters.get(name)
+    if adapter is not None:
+        return adapter
+    spec = PROVIDERS[name]
+    with _lock:
+        adapter = _adapters.get(name)
+        if adapter is None:
+            started = time.perf_counter()
+            module = importlib.import_module(spec.module)
+            adapter = getattr(module, spec.function)
+            _load_times[name] = round((time.perf_counter() - started) * 1000, 1)
+            _adapters[name] = adapter
+    return adapter
+
+
+def fetch(name, *args, **kwargs):
+    """
+    Call a provider's fetch function, loading the adapter if needed.
+    """
+    return get_adapter(name)(*args, **kwargs)
+
+
+def load_times():
+    """
+    Milliseconds spent importing each adapter loaded so far.
+    """
+    with _lock:
+        return dict(_load_times)
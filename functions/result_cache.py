@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from functions import configfile
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of serialized JSON responses with a TTL per mode.
+
+    Entries are keyed on the normalized (mode, source, destination, date)
+    query and hold the response bytes, so a hit skips both the database and
+    serialization. Ingest code calls `invalidate` once it commits new rows
+    for a route.
+    """
+
+    def __init__(self, ttls, maxsize=2048, default_ttl=300):
+        self.ttls = dict(ttls)
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(mode, source, destination, date, *extra):
+        return (
+            mode,
+            (source or "").strip().upper(),
+            (destination or "").strip().upper(),
+            str(date or "").strip(),
+        ) + tuple(extra)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return payload
+
+    def set(self, key, payload, ttl=None):
+        if ttl is None:
+            ttl = self.ttls.get(key[0], self.default_ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, mode, source, destination, date=None):
+        """
+        Drop every cached entry for a route, optionally limited to one date.
+        Returns the number of entries removed.
+        """
+        prefix = self.make_key(mode, source, destination, date)
+        length = 4 if date is not None else 3
+        with self._lock:
+            stale = [key for key in self._entries if key[:length] == prefix[:length]]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["maxsize"] = self.maxsize
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+result_cache = ResultCache(configfile.RESULT_CACHE_TTLS, maxsize=configfile.RESULT_CACHE_MAX_ENTRIES)
+
+
+def invalidate_routes(mode, routes):
+    """
+    Invalidate cached results for each (source, destination, date) route.
+    """
+    for source, destination, date in set(routes):
+        result_cache.invalidate(mode, source, destination, date)
@@ -0,0 +1,394 @@
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from functions import configfile, db_pool
+from functions.background import PeriodicJob
+
+GLOBAL_DB = "TransitGlobal"
+
+# Queue priorities; lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+PREFETCH = 20
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", PREFETCH: "prefetch"}
+
+# Number of recent waits kept per provider for the wait-time metrics
+WAIT_SAMPLES = 500
+
+
+class QuotaExceeded(Exception):
+    """Raised when a provider's rate bucket has used up its quota for the period."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+    A rate of 0 disables the limit. Not thread-safe on its own; the
+    scheduler only touches it while holding its lock.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Seconds until a token is available, 0 if one is available now.
+        """
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+
+def period_start(period, now=None):
+    """
+    First day of the current quota period ("day" or "month"), in UTC.
+    """
+    today = (now or datetime.now(timezone.utc)).date()
+    return today.replace(day=1) if period == "month" else today
+
+
+class QuotaLedger:
+    """
+    Count provider calls per rate bucket and quota period, persisted in
+    TransitGlobal's provider_quota table so quotas survive restarts.
+
+    Usage is loaded the first time a bucket is seen in a period and counted
+    in memory from then on; `flush` adds the unsaved counts to the table, so
+    several processes can share a ledger row.
+    """
+
+    def __init__(self, db_name=GLOBAL_DB, retry_after=30.0):
+        self.db_name = db_name
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._used = defaultdict(int)
+        self._pending = defaultdict(int)
+        self._loaded = set()
+        self._retry_at = {}
+
+    def ensure_loaded(self, bucket, period):
+        key = (bucket, period_start(period))
+        if key in self._loaded or self._retry_at.get(key, 0) > time.monotonic():
+            return
+        with self._io_lock:
+            if key in self._loaded:
+                return
+            try:
+                with db_pool.connection(self.db_name) as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT used FROM provider_quota WHERE bucket = %s AND period_start = %s",
+                            key,
+                        )
+                        row = cursor.fetchone()
+            except Exception as e:
+                print(f"Error loading quota usage for {bucket}: {e}")
+                self._retry_at[key] = time.monotonic() + self.retry_after
+                return
+            with self._lock:
+                # Counts already flushed are in the table; unflushed ones are not
+                self._used[key] = (row[0] if row else 0) + self._pending[key]
+                self._loaded.add(key)
+
+    def used(self, bucket, period):
+        with self._lock:
+            return self._used[(bucket, period_start(period))]
+
+    def add(self, bucket, period, count=1):
+        key = (bucket, period_start(period))
+        with self._lock:
+            self._used[key] += count
+            self._pending[key] += count
+
+    def flush(self):
+        """
+        Write unsaved usage to provider_quota. Returns the number of calls
+        written; on failure the counts are kept for the next flush.
+        """
+        with self._io_lock:
+            with self._lock:
+                pending = {key: count for key, count in self._pending.items() if count}
+                self._pending.clear()
+            if not pending:
+                return 0
+            try:
+                with db_pool.connection(self.db_name) as conn:
+                    with conn.cursor() as cursor:
+                        for (bucket, start), count in pending.items():
+                            cursor.execute("""
+                                INSERT INTO provider_quota (bucket, period_start, used, updated_at)
+                                VALUES (%s, %s, %s, now())
+                                ON CONFLICT (bucket, period_start) DO UPDATE
+                                SET used = provider_quota.used + EXCLUDED.used,
+                                    updated_at = now()
+                            """, (bucket, start, count))
+            except Exception:
+                with self._lock:
+                    for key, count in pending.items():
+                        self._pending[key] += count
+                raise
+        return sum(pending.values())
+
+
+class _Job:
+    __slots__ = ("provider", "priority", "seq", "enqueued", "granted", "rejected")
+
+    def __init__(self, provider, priority, seq):
+        self.provider = provider
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.rejected = False
+
+
+class ProviderScheduler:
+    """
+    Admission control between searches and the provider adapters.
+
+    Each provider has a concurrency cap and draws from a token bucket, which
+    several providers may share (the flight adapters share one RapidAPI key).
+    Callers queue by priority, then arrival; a caller that cannot run yet
+    holds back lower-priority callers for the same provider and bucket, so
+    background refreshes only use capacity interactive searches leave idle.
+    Buckets with a quota reject calls once the period's quota is used.
+
+    `shares` caps the fraction of each bucket's quota a priority may spend
+    per period ({PREFETCH: 0.25}). Its calls are counted in the ledger under
+    "<bucket>:<priority name>" as well as under the bucket, and are rejected
+    once the share is used, so the rest of the quota stays for searches.
+    """
+
+    def __init__(self, limits=None, buckets=None, ledger=None, shares=None):
+        limits = configfile.PROVIDER_LIMITS if limits is None else limits
+        buckets = configfile.RATE_BUCKETS if buckets is None else buckets
+        self.concurrency = {name: limit["concurrency"] for name, limit in limits.items()}
+        self.bucket_of = {name: limit["bucket"] for name, limit in limits.items()}
+        self.buckets = {name: TokenBucket(spec["rate"], spec["burst"]) for name, spec in buckets.items()}
+        self.quotas = {name: (spec.get("quota", 0), spec.get("quota_period", "month"))
+                       for name, spec in buckets.items()}
+        self.ledger = QuotaLedger() if ledger is None else ledger
+        self.shares = {PREFETCH: configfile.PREFETCH_QUOTA_SHARE} if shares is None else dict(shares)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._in_flight = defaultdict(int)
+        self._metrics = {
+            name: {"granted": 0, "timeouts": 0, "quota_rejections": 0, "waits": deque(maxlen=WAIT_SAMPLES)}
+            for name in limits
+        }
+
+    def _share(self, bucket, priority):
+        """
+        (ledger key, calls allowed) for a priority's share of a bucket's
+        quota, or None when the priority has no share or the bucket no quota.
+        """
+        quota, _ = self.quotas[bucket]
+        if not quota or priority not in self.shares:
+            return None
+        return f"{bucket}:{PRIORITY_NAMES[priority]}", int(quota * self.shares[priority])
+
+    def _quota_left(self, bucket, priority=INTERACTIVE):
+        quota, period = self.quotas[bucket]
+        if quota and self.ledger.used(bucket, period) >= quota:
+            return False
+        share = self._share(bucket, priority)
+        return share is None or self.ledger.used(share[0], period) < share[1]
+
+    def share_left(self, provider, priority):
+        """
+        True while `provider`'s bucket has quota left for calls at `priority`.
+        """
+        bucket = self.bucket_of[provider]
+        _, period = self.quotas[bucket]
+        self.ledger.ensure_loaded(bucket, period)
+        share = self._share(bucket, priority)
+        if share is not None:
+            self.ledger.ensure_loaded(share[0], period)
+        with self._cond:
+            return self._quota_left(bucket, priority)
+
+    def _grant_ready(self):
+        """
+        Grant queued jobs in priority order while their provider has a free
+        slot and their bucket a token. Returns seconds until the next token
+        a blocked job needs, or None. Caller holds the lock.
+        """
+        now = time.monotonic()
+        blocked = set()
+        next_wait = None
+        changed = False
+        for job in sorted(self._queue, key=lambda job: (job.priority, job.seq)):
+            bucket = self.bucket_of[job.provider]
+            if job.provider in blocked or bucket in blocked:
+                continue
+            if not self._quota_left(bucket, job.priority):
+                job.rejected = True
+                self._queue.remove(job)
+                changed = True
+                continue
+            if self._in_flight[job.provider] >= self.concurrency[job.provider]:
+                blocked.add(job.provider)
+                continue
+            wait = self.buckets[bucket].wait_time(now)
+            if wait > 0:
+                blocked.update((job.provider, bucket))
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                continue
+            self.buckets[bucket].take(now)
+            period = self.quotas[bucket][1]
+            self.ledger.add(bucket, period)
+            share = self._share(bucket, job.priority)
+            if share is not None:
+                self.ledger.add(share[0], period)
+            self._in_flight[job.provider] += 1
+            job.granted = True
+            self._queue.remove(job)
+            changed = True
+        if changed:
+            self._cond.notify_all()
+        return next_wait
+
+    def acquire(self, provider, priority=INTERACTIVE, timeout=None):
+        """
+        Wait for a slot to call `provider`. Raises TimeoutError if none is
+        granted within `timeout` seconds and QuotaExceeded once the
+        provider's quota for the period is used. Pair with `release`.
+        """
+        bucket = self.bucket_of[provider]
+        quota, period = self.quotas[bucket]
+        self.ledger.ensure_loaded(bucket, period)
+        share = self._share(bucket, priority)
+        if share is not None:
+            self.ledger.ensure_loaded(share[0], period)
+        limit = (f"{bucket} quota of {quota} calls per {period}" if share is None else
+                 f"{share[0]} share of {share[1]} calls per {period}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        metrics = self._metrics[provider]
+        job = _Job(provider, priority, next(self._seq))
+
+        with self._cond:
+            if not self._quota_left(bucket, priority):
+                metrics["quota_rejections"] += 1
+                raise QuotaExceeded(f"{limit} used")
+            self._queue.append(job)
+            while True:
+                next_wait = self._grant_ready()
+                if job.granted:
+                    break
+                if job.rejected:
+                    metrics["quota_rejections"] += 1
+                    raise QuotaExceeded(f"{limit} used")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(job)
+                    metrics["timeouts"] += 1
+                    # This job may have been holding back lower-priority ones
+                    self._cond.notify_all()
+                    raise TimeoutError(f"No {provider} slot within {timeout}s")
+                waits = [value for value in (next_wait, remaining) if value is not None]
+                self._cond.wait(min(waits) if waits else None)
+            metrics["granted"] += 1
+            metrics["waits"].append(time.monotonic() - job.enqueued)
+
+    def release(self, provider):
+        with self._cond:
+            self._in_flight[provider] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, provider, priority=INTERACTIVE, timeout=None):
+        self.acquire(provider, priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(provider)
+
+    def run(self, provider, fn, priority=INTERACTIVE, timeout=None):
+        """
+        Call `fn` once a slot for `provider` is granted and return its result.
+        """
+        with self.slot(provider, priority, timeout):
+            return fn()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            queued = defaultdict(lambda: defaultdict(int))
+            for job in self._queue:
+                queued[job.provider][PRIORITY_NAMES.get(job.priority, str(job.priority))] += 1
+            providers = {}
+            for name, metrics in self._metrics.items():
+                waits = sorted(metrics["waits"])
+                providers[name] = {
+                    "bucket": self.bucket_of[name],
+                    "concurrency": self.concurrency[name],
+                    "in_flight": self._in_flight[name],
+                    "queued": dict(queued[name]),
+                    "granted": metrics["granted"],
+                    "timeouts": metrics["timeouts"],
+                    "quota_rejections": metrics["quota_rejections"],
+                    "wait_ms": {
+                        "avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                        "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                        "max": round(waits[-1] * 1000, 1) if waits else 0.0,
+                    },
+                }
+            buckets = {}
+            for name, bucket in self.buckets.items():
+                quota, period = self.quotas[name]
+                bucket.wait_time(now)
+                buckets[name] = {
+                    "rate": bucket.rate,
+                    "burst": bucket.capacity,
+                    "tokens": round(bucket.tokens, 2),
+                    "quota": quota,
+                    "quota_period": period,
+                    "used": self.ledger.used(name, period),
+                    "shares": {
+                        PRIORITY_NAMES[priority]: {"allowed": share[1], "used": self.ledger.used(share[0], period)}
+                        for priority, share in ((p, self._share(name, p)) for p in self.shares)
+                        if share is not None
+                    },
+                }
+        return {"providers": providers, "buckets": buckets}
+
+
+provider_scheduler = ProviderScheduler()
+
+_flush_job = None
+_flush_lock = threading.Lock()
+
+
+def start_quota_flush(interval=None):
+    """
+    Start the job that persists quota usage, once per process.
+    """
+    global _flush_job
+    interval = configfile.QUOTA_FLUSH_INTERVAL if interval is None else interval
+    with _flush_lock:
+        if _flush_job is None or not _flush_job.is_alive():
+            _flush_job = PeriodicJob("quota-flush", provider_scheduler.ledger.flush, interval)
+            _flush_job.start()
+        return _flush_job
@@ -0,0 +1,481 @@
+import sys
+from collections import namedtuple
+
+from functions import configfile, db_pool
+from functions.singleflight import advisory_lock_id
+
+# One forward-only schema change. Statements run in a single transaction
+# together with the schema_migrations bookkeeping row.
+Migration = namedtuple("Migration", ["version", "description", "statements"])
+
+# Zone provider flight times are local to, as a SQL literal
+LOCAL_TZ = "'" + configfile.FLIGHT_TIMEZONE.replace("'", "''") + "'"
+
+TRANSIT_GLOBAL_MIGRATIONS = [
+    Migration(1, "create global_flights", [
+        """
+        CREATE TABLE IF NOT EXISTS global_flights (
+            flight_id SERIAL PRIMARY KEY,
+            source_city TEXT NOT NULL,
+            destination_city TEXT NOT NULL,
+            departure_timestamp TIMESTAMP NOT NULL,
+            arrival_timestamp TIMESTAMP,
+            fare NUMERIC,
+            airline TEXT
+        )
+        """,
+    ]),
+    Migration(2, "route index on global_flights", [
+        """
+        CREATE INDEX IF NOT EXISTS global_flights_route_departure
+        ON global_flights (source_city, destination_city, departure_timestamp)
+        """,
+    ]),
+    Migration(3, "consolidated global_flights with per-provider offers", [
+        # Stored provider times are local to FLIGHT_TIMEZONE; keep the instant explicit
+        f"""
+        ALTER TABLE global_flights
+            ALTER COLUMN departure_timestamp TYPE TIMESTAMPTZ
+                USING departure_timestamp AT TIME ZONE {LOCAL_TZ},
+            ALTER COLUMN arrival_timestamp TYPE TIMESTAMPTZ
+                USING arrival_timestamp AT TIME ZONE {LOCAL_TZ},
+            ADD COLUMN IF NOT EXISTS flight_number TEXT NOT NULL DEFAULT '',
+            ADD COLUMN IF NOT EXISTS duration_minutes INT,
+            ADD COLUMN IF NOT EXISTS stops INT,
+            ADD COLUMN IF NOT EXISTS provider TEXT,
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        """,
+        """
+        DELETE FROM global_flights a
+        USING global_flights b
+        WHERE a.flight_id > b.flight_id
+          AND a.source_city = b.source_city
+          AND a.destination_city = b.destination_city
+          AND a.departure_timestamp = b.departure_timestamp
+          AND a.flight_number = b.flight_number
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS global_flights_natural_key
+        ON global_flights (source_city, destination_city, departure_timestamp, flight_number)
+        """,
+        # The natural key has the same leading columns
+        "DROP INDEX IF EXISTS global_flights_route_departure",
+        """
+        CREATE TABLE IF NOT EXISTS flight_offers (
+            source_city TEXT NOT NULL,
+            destination_city TEXT NOT NULL,
+            departure_timestamp TIMESTAMPTZ NOT NULL,
+            flight_number TEXT NOT NULL,
+            provider TEXT NOT NULL,
+            airline TEXT,
+            arrival_timestamp TIMESTAMPTZ,
+            duration_minutes INT,
+            stops INT,
+            fare NUMERIC,
+            ingested_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (source_city, destination_city, departure_timestamp, flight_number, provider)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS consolidation_watermarks (
+            provider TEXT PRIMARY KEY,
+            last_ingested_at TIMESTAMPTZ NOT NULL,
+            consolidated_rows BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    Migration(4, "provider quota usage", [
+        """
+        CREATE TABLE IF NOT EXISTS provider_quota (
+            bucket TEXT NOT NULL,
+            period_start DATE NOT NULL,
+            used BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (bucket, period_start)
+        )
+        """,
+    ]),
+    Migration(5, "route search popularity", [
+        """
+        CREATE TABLE IF NOT EXISTS route_popularity (
+            source_city TEXT NOT NULL,
+            destination_city TEXT NOT NULL,
+            score DOUBLE PRECISION NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (source_city, destination_city)
+        )
+        """,
+    ]),
+    # fetched_at is when a provider last returned the flight; rows consolidated
+    # before this migration start from their last change
+    Migration(6, "fetched_at on global_flights", [
+        "ALTER TABLE global_flights ADD COLUMN IF NOT EXISTS fetched_at TIMESTAMPTZ",
+        "UPDATE global_flights SET fetched_at = updated_at WHERE fetched_at IS NULL",
+        """
+        ALTER TABLE global_flights
+            ALTER COLUMN fetched_at SET DEFAULT now(),
+            ALTER COLUMN fetched_at SET NOT NULL
+        """,
+    ]),
+]
+
+TRAIN_MIGRATIONS = [
+    Migration(1, "create TrainDetails and fold the legacy travel_date layout into it", [
+        """
+        CREATE TABLE IF NOT EXISTS TrainDetails (
+            train_number TEXT NOT NULL,
+            train_name TEXT,
+            source_station_code TEXT NOT NULL,
+            source_city TEXT,
+            destination_station_code TEXT NOT NULL,
+            destination_city TEXT,
+            departure_date DATE NOT NULL,
+            departure_time TIME,
+            departure_day TEXT,
+            arrival_date DATE,
+            arrival_time TIME,
+            arrival_day TEXT,
+            travel_duration TEXT,
+            ticket_prices JSONB,
+            PRIMARY KEY (train_number, departure_date)
+        )
+        """,
+        # Tables created by the old Mongo pipeline have travel_date and no
+        # time columns or key
+        """
+        ALTER TABLE TrainDetails
+            ADD COLUMN IF NOT EXISTS departure_date DATE,
+            ADD COLUMN IF NOT EXISTS departure_time TIME,
+            ADD COLUMN IF NOT EXISTS departure_day TEXT,
+            ADD COLUMN IF NOT EXISTS arrival_date DATE,
+            ADD COLUMN IF NOT EXISTS arrival_time TIME,
+            ADD COLUMN IF NOT EXISTS arrival_day TEXT,
+            ADD COLUMN IF NOT EXISTS travel_duration TEXT
+        """,
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                  AND table_name = 'traindetails' AND column_name = 'travel_date'
+            ) THEN
+                UPDATE TrainDetails SET departure_date = travel_date WHERE departure_date IS NULL;
+                ALTER TABLE TrainDetails DROP COLUMN travel_date;
+            END IF;
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = 'traindetails'::regclass AND contype = 'p'
+            ) THEN
+                DELETE FROM TrainDetails WHERE train_number IS NULL OR departure_date IS NULL;
+                DELETE FROM TrainDetails a USING TrainDetails b
+                WHERE a.ctid > b.ctid
+                  AND a.train_number = b.train_number
+                  AND a.departure_date = b.departure_date;
+                ALTER TABLE TrainDetails ADD PRIMARY KEY (train_number, departure_date);
+            END IF;
+        END $$
+        """,
+    ]),
+    Migration(2, "route index on TrainDetails", [
+        """
+        CREATE INDEX IF NOT EXISTS traindetails_route_departure
+        ON TrainDetails (source_station_code, destination_station_code, departure_date)
+        """,
+    ]),
+    Migration(3, "Mongo migration bookkeeping tables", [
+        """
+        CREATE TABLE IF NOT EXISTS migration_watermarks (
+            name TEXT PRIMARY KEY,
+            last_id TEXT NOT NULL,
+            migrated_rows BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            run_name TEXT NOT NULL,
+            partition INT NOT NULL,
+            lower_id TEXT NOT NULL,
+            upper_id TEXT NOT NULL,
+            upper_inclusive BOOLEAN NOT NULL,
+            last_id TEXT,
+            copied_rows BIGINT NOT NULL DEFAULT 0,
+            done BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (run_name, partition)
+        )
+        """,
+    ]),
+    # Rows stored before fetch times were tracked count as long expired
+    Migration(4, "fetched_at on TrainDetails", [
+        "ALTER TABLE TrainDetails ADD COLUMN IF NOT EXISTS fetched_at TIMESTAMPTZ NOT NULL DEFAULT 'epoch'",
+        "ALTER TABLE TrainDetails ALTER COLUMN fetched_at SET DEFAULT now()",
+    ]),
+    # A train serves many station pairs on one date, each with its own times
+    # and fares, so the route is part of the key
+    Migration(5, "route-level primary key on TrainDetails", [
+        """
+        DO $$
+        DECLARE
+            pk_name TEXT;
+        BEGIN
+            SELECT conname INTO pk_name FROM pg_constraint
+            WHERE conrelid = 'traindetails'::regclass AND contype = 'p';
+            IF pk_name IS NOT NULL THEN
+                EXECUTE format('ALTER TABLE TrainDetails DROP CONSTRAINT %I', pk_name);
+            END IF;
+        END $$
+        """,
+        """
+        ALTER TABLE TrainDetails
+            ADD PRIMARY KEY (train_number, departure_date, source_station_code, destination_station_code)
+        """,
+    ]),
+]
+
+BUS_MIGRATIONS = [
+    Migration(1, "create buses", [
+        """
+        CREATE TABLE IF NOT EXISTS buses (
+            id SERIAL PRIMARY KEY,
+            source_city VARCHAR(255) NOT NULL,
+            destination_city VARCHAR(255) NOT NULL,
+            bus_type VARCHAR(255),
+            departure_time TIMESTAMP NOT NULL,
+            arrival_time TIMESTAMP NOT NULL,
+            total_travel_time VARCHAR(255),
+            fare NUMERIC
+        )
+        """,
+    ]),
+    # The natural key leads with (source_city, destination_city, departure_time),
+    # so it also serves route lookups as a range scan
+    Migration(2, "natural key on buses", [
+        "UPDATE buses SET bus_type = '' WHERE bus_type IS NULL",
+        """
+        DELETE FROM buses a
+        USING buses b
+        WHERE a.id > b.id
+          AND a.source_city = b.source_city
+          AND a.destination_city = b.destination_city
+          AND a.departure_time = b.departure_time
+          AND a.bus_type = b.bus_type
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS buses_natural_key
+        ON buses (source_city, destination_city, departure_time, bus_type)
+        """,
+    ]),
+    # Rows stored before fetch times were tracked count as long expired
+    Migration(3, "fetched_at on buses", [
+        "ALTER TABLE buses ADD COLUMN IF NOT EXISTS fetched_at TIMESTAMPTZ NOT NULL DEFAULT 'epoch'",
+        "ALTER TABLE buses ALTER COLUMN fetched_at SET DEFAULT now()",
+    ]),
+]
+
+PRICELINE_MIGRATIONS = [
+    Migration(1, "create FlightsInfo", [
+        """
+        CREATE TABLE IF NOT EXISTS FlightsInfo (
+            Airlines TEXT,
+            Flight_Number TEXT,
+            Source_City TEXT,
+            Source_Airport_Code TEXT,
+            Destination_City TEXT,
+            Destination_Airport_Code TEXT,
+            Departure_Date DATE,
+            Departure_Time TIME,
+            Arrival_Date DATE,
+            Arrival_Time TIME,
+            Duration_of_Travel TEXT,
+            Stop_Quantity INTEGER,
+            Equipment_Name TEXT,
+            Price_in_INR TEXT
+        )
+        """,
+    ]),
+    Migration(2, "route index on FlightsInfo", [
+        """
+        CREATE INDEX IF NOT EXISTS flightsinfo_route_departure
+        ON FlightsInfo (Source_Airport_Code, Destination_Airport_Code, Departure_Date, Departure_Time)
+        """,
+    ]),
+    Migration(3, "ingest timestamp on FlightsInfo for consolidation", [
+        "ALTER TABLE FlightsInfo ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+        "CREATE INDEX IF NOT EXISTS flightsinfo_ingested_at ON FlightsInfo (ingested_at)",
+    ]),
+    Migration(4, "numeric price and duration minutes on FlightsInfo", [
+        """
+        ALTER TABLE FlightsInfo
+            ALTER COLUMN Price_in_INR TYPE NUMERIC
+                USING NULLIF(regexp_replace(Price_in_INR, '[^0-9.]', '', 'g'), '')::NUMERIC,
+            ALTER COLUMN Duration_of_Travel TYPE INT
+                USING NULLIF(regexp_replace(Duration_of_Travel, '[^0-9]', '', 'g'), '')::INT
+        """,
+    ]),
+]
+
+SKYSCANNER_MIGRATIONS = [
+    Migration(1, "create FlightsData", [
+        """
+        CREATE TABLE IF NOT EXISTS FlightsData (
+            id SERIAL PRIMARY KEY,
+            Airlines VARCHAR(255),
+            Source_City VARCHAR(255),
+            Source_Airport_Code VARCHAR(255),
+            Destination_City VARCHAR(255),
+            Destination_Airport_Code VARCHAR(255),
+            Departure_Date DATE,
+            Departure_Time TIME,
+            Arrival_Date DATE,
+            Arrival_Time TIME,
+            Duration_of_Travel VARCHAR(50),
+            Flight_Number VARCHAR(50),
+            Price_in_INR VARCHAR(50)
+        )
+        """,
+    ]),
+    Migration(2, "route index on FlightsData", [
+        """
+        CREATE INDEX IF NOT EXISTS flightsdata_route_departure
+        ON FlightsData (Source_Airport_Code, Destination_Airport_Code, Departure_Date, Departure_Time)
+        """,
+    ]),
+    Migration(3, "ingest timestamp on FlightsData for consolidation", [
+        "ALTER TABLE FlightsData ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+        "CREATE INDEX IF NOT EXISTS flightsdata_ingested_at ON FlightsData (ingested_at)",
+    ]),
+    Migration(4, "numeric price and duration minutes on FlightsData", [
+        """
+        ALTER TABLE FlightsData
+            ALTER COLUMN Price_in_INR TYPE NUMERIC
+                USING NULLIF(regexp_replace(Price_in_INR, '[^0-9.]', '', 'g'), '')::NUMERIC,
+            ALTER COLUMN Duration_of_Travel TYPE INT
+                USING NULLIF(regexp_replace(Duration_of_Travel, '[^0-9]', '', 'g'), '')::INT
+        """,
+    ]),
+]
+
+TRIPADVISOR_MIGRATIONS = [
+    Migration(1, "create FlightDetails", [
+        """
+        CREATE TABLE IF NOT EXISTS FlightDetails (
+            Airline_Name TEXT,
+            Source_City_Airport_Code TEXT,
+            Destination_City_Airport_Code TEXT,
+            Departure_Date_Time TIMESTAMP,
+            Arrival_Date_Time TIMESTAMP,
+            Flight_Class TEXT,
+            Flight_Number TEXT,
+            Number_of_Stops INTEGER,
+            Distance_KM FLOAT,
+            Price_INR TEXT
+        )
+        """,
+    ]),
+    Migration(2, "route index on FlightDetails", [
+        """
+        CREATE INDEX IF NOT EXISTS flightdetails_route_departure
+        ON FlightDetails (Source_City_Airport_Code, Destination_City_Airport_Code, Departure_Date_Time)
+        """,
+    ]),
+    Migration(3, "ingest timestamp on FlightDetails for consolidation", [
+        "ALTER TABLE FlightDetails ADD COLUMN IF NOT EXISTS ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+        "CREATE INDEX IF NOT EXISTS flightdetails_ingested_at ON FlightDetails (ingested_at)",
+    ]),
+    Migration(4, "numeric price on FlightDetails", [
+        """
+        ALTER TABLE FlightDetails
+            ALTER COLUMN Price_INR TYPE NUMERIC
+                USING NULLIF(regexp_replace(Price_INR, '[^0-9.]', '', 'g'), '')::NUMERIC
+        """,
+    ]),
+]
+
+# Migrations per logical database (names from configfile.DATABASES)
+MIGRATIONS = {
+    "TransitGlobal": TRANSIT_GLOBAL_MIGRATIONS,
+    "TrainDB": TRAIN_MIGRATIONS,
+    "BUS_DATA": BUS_MIGRATIONS,
+    "PriceLineDB": PRICELINE_MIGRATIONS,
+    "SkyScannerDB": SKYSCANNER_MIGRATIONS,
+    "TripAdvisorDB": TRIPADVISOR_MIGRATIONS,
+}
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(db_name, migrations=None):
+    """
+    Apply the pending migrations for one logical database in version order
+    and return the versions applied.
+
+    Each migration commits on its own, so a failure leaves the earlier ones
+    in place. A session advisory lock keeps concurrently starting processes
+    from applying the same migration twice; later arrivals wait and then
+    find nothing to do.
+    """
+    migrations = sorted(MIGRATIONS[db_name] if migrations is None else migrations,
+                        key=lambda m: m.version)
+    lock_id = advisory_lock_id(("schema", db_name))
+    applied_now = []
+    with db_pool.connection(db_name) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (lock_id,))
+            conn.commit()
+            try:
+                applied = applied_versions(cursor)
+                conn.commit()
+                for migration in migrations:
+                    if migration.version in applied:
+                        continue
+                    try:
+                        for statement in migration.statements:
+                            cursor.execute(statement)
+                        cursor.execute(
+                            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                            (migration.version, migration.description),
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    applied_now.append(migration.version)
+                    print(f"[{db_name}] applied migration {migration.version}: {migration.description}")
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+    return applied_now
+
+
+def migrate_all(db_names=None):
+    """
+    Migrate every configured database. Databases that cannot be reached or
+    fail to migrate are reported and skipped so the others still run.
+    Returns {db_name: versions applied or None on failure}.
+    """
+    results = {}
+    for db_name in db_names or MIGRATIONS:
+        try:
+            results[db_name] = migrate(db_name)
+        except Exception as e:
+            print(f"Error migrating schema for {db_name}: {e}")
+            results[db_name] = None
+    return results
+
+
+if __name__ == "__main__":
+    outcome = migrate_all(sys.argv[1:] or None)
+    sys.exit(1 if any(versions is None for versions in outcome.values()) else 0)
@@ -0,0 +1,184 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from functions import configfile, db_pool
+from functions.city_index import get_city_index
+
+FLIGHT_DB = "TransitGlobal"
+TRAIN_DB = "TrainDB"
+BUS_DB = "BUS_DATA"
+
+# global_flights stores timestamptz; journey dates are days in this zone
+FLIGHT_TZ = ZoneInfo(configfile.FLIGHT_TIMEZONE)
+
+FLIGHT_QUERY = """
+    SELECT flight_id, source_city, destination_city, departure_timestamp,
+        arrival_timestamp, fare, airline, fetched_at
+    FROM global_flights
+    WHERE source_city = %s AND destination_city = %s
+      AND departure_timestamp >= %s AND departure_timestamp < %s
+    ORDER BY departure_timestamp ASC
+    LIMIT 50;
+"""
+
+BUS_QUERY = """
+    SELECT id AS bus_id, source_city, destination_city, departure_time,
+        arrival_time, total_travel_time, fare, bus_type, fetched_at
+    FROM buses
+    WHERE source_city = %s AND destination_city = %s
+      AND departure_time >= %s AND departure_time < %s
+    ORDER BY departure_time ASC
+    LIMIT 50;
+"""
+
+TRAIN_QUERY = """
+    SELECT train_number, train_name, source_station_code, source_city,
+           destination_station_code, destination_city, departure_date, arrival_date,
+           departure_time::TEXT AS departure_time, departure_day,
+           arrival_time::TEXT AS arrival_time, arrival_day, travel_duration, ticket_prices,
+           fetched_at
+    FROM TrainDetails
+    WHERE source_station_code = %s
+      AND destination_station_code = %s
+      AND departure_date = %s
+"""
+
+# When a route's rows for one day were last fetched, per mode: (db, query)
+FETCHED_AT_QUERIES = {
+    "flight": (FLIGHT_DB, """
+        SELECT max(fetched_at) FROM global_flights
+        WHERE source_city = %s AND destination_city = %s
+          AND departure_timestamp >= %s AND departure_timestamp < %s
+    """),
+    "bus": (BUS_DB, """
+        SELECT max(fetched_at) FROM buses
+        WHERE source_city = %s AND destination_city = %s
+          AND departure_time >= %s AND departure_time < %s
+    """),
+    "train": (TRAIN_DB, """
+        SELECT max(fetched_at) FROM TrainDetails
+        WHERE source_station_code = %s
+          AND destination_station_code = %s
+          AND departure_date = %s
+    """),
+}
+
+
+def day_bounds(journey_date, tz=None):
+    """
+    Return the half-open [start, end) timestamp range covering a YYYY-MM-DD
+    date, in `tz` when given (for timestamptz columns). Filtering on the
+    bare column keeps route lookups on the (source, destination, departure)
+    indexes, which DATE(column) would not.
+    """
+    start = datetime.strptime(str(journey_date), "%Y-%m-%d").replace(tzinfo=tz)
+    return start, start + timedelta(days=1)
+
+
+def _fetch_dicts(db_name, query, params):
+    with db_pool.connection(db_name) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def attach_display_names(rows, source_key, destination_key, lookup):
+    """
+    Add `source_city_name` and `destination_city_name` to each row, resolved
+    from the stored codes through the precomputed code-to-city maps.
+    """
+    for row in rows:
+        row['source_city_name'] = lookup(row.get(source_key)) or row.get(source_key)
+        row['destination_city_name'] = lookup(row.get(destination_key)) or row.get(destination_key)
+    return rows
+
+
+def flight_display_names(rows):
+    return attach_display_names(rows, 'source_city', 'destination_city', get_city_index().city_for_airport)
+
+
+def train_display_names(rows):
+    city_index = get_city_index()
+    for row in rows:
+        row['source_city_name'] = city_index.city_for_station(row.get('source_station_code')) or row.get('source_city')
+        row['destination_city_name'] = city_index.city_for_station(row.get('destination_station_code')) or row.get('destination_city')
+    return rows
+
+
+def bus_display_names(rows):
+    # Bus rows already store provider city names rather than codes
+    for row in rows:
+        row['source_city_name'] = row.get('source_city')
+        row['destination_city_name'] = row.get('destination_city')
+    return rows
+
+
+def query_flights(source_code, destination_code, journey_date):
+    """
+    Flights from global_flights for an airport-code pair and date, earliest first.
+    """
+    rows = _fetch_dicts(FLIGHT_DB, FLIGHT_QUERY, (source_code, destination_code) + day_bounds(journey_date, FLIGHT_TZ))
+    return flight_display_names(rows)
+
+
+def query_buses(source_city, destination_city, journey_date):
+    """
+    Buses for a city pair and date, earliest first.
+    """
+    rows = _fetch_dicts(BUS_DB, BUS_QUERY, (source_city, destination_city) + day_bounds(journey_date))
+    return bus_display_names(rows)
+
+
+def query_trains(source_station_code, destination_station_code, travel_date):
+    """
+    Trains from TrainDetails for a station-code pair and date.
+    """
+    rows = _fetch_dicts(TRAIN_DB, TRAIN_QUERY, (source_station_code, destination_station_code, travel_date))
+    return train_display_names(rows)
+
+
+def route_params(mode, source, destination, journey_date):
+    """
+    Query parameters selecting one route and day of a mode's table.
+    """
+    if mode == "flight":
+        return (source, destination) + day_bounds(journey_date, FLIGHT_TZ)
+    if mode == "bus":
+        return (source, destination) + day_bounds(journey_date)
+    return (source, destination, journey_date)
+
+
+def last_fetched(mode, source, destination, journey_date):
+    """
+    When the rows stored for a route and day were last fetched from a
+    provider, or None if there are none.
+    """
+    db_name, query = FETCHED_AT_QUERIES[mode]
+    with db_pool.connection(db_name) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, route_params(mode, source, destination, journey_date))
+            row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Listing query per mode, keyed the same way as the result cache
+LISTING_QUERIES = {
+    "flight": query_flights,
+    "bus": query_buses,
+    "train": query_trains,
+}
+
+
+def route_for_mode(mode, source_match, destination_match):
+    """
+    Pick the identifiers a mode is stored under from two resolved CityMatch
+    objects: airport codes for flights, station codes for trains and
+    canonical city names for buses.
+    """
+    if mode == "flight":
+        return source_match.airport_code, destination_match.airport_code
+    if mode == "train":
+        return source_match.railway_station_code, destination_match.railway_station_code
+    return source_match.city, destination_match.city
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from functions import db_pool
+
+# Database used to hold cross-process advisory locks
+LOCK_DB = "TransitGlobal"
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+def advisory_lock_id(key):
+    """
+    Map an arbitrary key to the signed 64-bit integer Postgres advisory locks use.
+    """
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(key, timeout=30.0, db_name=LOCK_DB):
+    """
+    Hold a Postgres session-level advisory lock for `key` across processes.
+    Raises TimeoutError if the lock is not acquired within `timeout` seconds.
+    """
+    lock_id = advisory_lock_id(key)
+    with db_pool.connection(db_name) as conn:
+        conn.autocommit = True
+        try:
+            deadline = time.monotonic() + timeout
+            with conn.cursor() as cursor:
+                while True:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+                    if cursor.fetchone()[0]:
+                        break
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for advisory lock on {key!r}")
+                    time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+        finally:
+            conn.autocommit = False
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key so only one of them runs.
+
+    The first caller for a key executes the function; callers that arrive
+    while it is in flight wait for and share its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"executed": 0, "coalesced": 0, "skipped_by_recheck": 0}
+
+    def do(self, key, fn, timeout=None, cross_process=False, recheck=None, lock_timeout=30.0):
+        """
+        Run `fn` once per in-flight `key` and return (value, shared), where
+        `shared` is True when the value came from another caller's execution.
+
+        Args:
+            timeout (float): How long a waiting caller waits for the leader
+                before raising TimeoutError. None waits indefinitely.
+            cross_process (bool): Also serialize the leader across processes
+                with a Postgres advisory lock.
+            recheck (callable): Called by a cross-process leader once it holds
+                the lock; a truthy return value is used instead of running
+                `fn`, since another process may have done the work meanwhile.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            if cross_process:
+                with advisory_lock(key, timeout=lock_timeout):
+                    existing = recheck() if recheck else None
+                    if existing:
+                        with self._lock:
+                            self._stats["skipped_by_recheck"] += 1
+                        call.value = existing
+                    else:
+                        call.value = fn()
+            else:
+                call.value = fn()
+            with self._lock:
+                self._stats["executed"] += 1
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self):
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
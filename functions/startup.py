@@ -0,0 +1,66 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from functions import configfile
+
+
+class StartupTimer:
+    """
+    Record how long each phase of process startup takes, so cold start can
+    be checked against TRANSITGUIDE_STARTUP_BUDGET. The total is the sum of
+    the phases, so idle time between import and `start_app` (or before the
+    first request) is not counted. Work deferred to first use (adapters,
+    the LLM) is recorded separately as it happens.
+    """
+
+    def __init__(self, started=None, budget=None):
+        self.started = time.perf_counter() if started is None else started
+        self.budget = configfile.STARTUP_BUDGET_SECONDS if budget is None else budget
+        self.phases = {}
+        self.deferred = {}
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def record(self, name, started):
+        with self._lock:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def record_deferred(self, name, started):
+        with self._lock:
+            self.deferred[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def finish(self):
+        """
+        Mark startup complete, print a one-line summary and warn when the
+        total is over budget. Returns the report.
+        """
+        self.finished = time.perf_counter()
+        report = self.report()
+        phases = ", ".join(f"{name} {ms:.0f}ms" for name, ms in report["phases"].items())
+        print(f"Startup took {report['total_ms']:.0f}ms ({phases})")
+        if report["over_budget"]:
+            print(f"Warning: startup exceeded its {self.budget}s budget")
+        return report
+
+    def report(self):
+        with self._lock:
+            phases = dict(self.phases)
+            deferred = dict(self.deferred)
+        total_ms = round(sum(phases.values()), 1)
+        return {
+            "total_ms": total_ms,
+            "budget_ms": self.budget * 1000,
+            "over_budget": total_ms > self.budget * 1000,
+            "complete": self.finished is not None,
+            "phases": phases,
+            "deferred_ms": deferred,
+        }
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+from functions.chat_cache import ChatResponseCache, signature
+
+
+def make_cache():
+    return ChatResponseCache(ttl=60, maxsize=100, threshold=0.92)
+
+
+def test_reworded_question_is_a_semantic_hit():
+    cache = make_cache()
+    cache.store("best time to visit Goa", "October to March.")
+    assert cache.lookup("What is the best time to visit Goa?") == ("October to March.", "semantic")
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("How long is the road trip from Delhi to Manali?", "How long is the road trip from Manali to Delhi?"),
+    ("Which airlines fly from Delhi to Mumbai?", "Which airlines fly from Mumbai to Delhi?"),
+])
+def test_reversed_route_is_not_served(stored, asked):
+    cache = make_cache()
+    cache.store(stored, "answer for the first direction")
+    assert cache.lookup(asked) == (None, None)
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("best time to visit Goa", "best time to visit Goa in monsoon"),
+    ("best time to visit Goa in monsoon", "best time to visit Goa"),
+    ("flights from Delhi to Mumbai on 24 Dec", "flights from Delhi to Mumbai on 25 Dec"),
+])
+def test_extra_or_changed_qualifier_is_not_served(stored, asked):
+    cache = make_cache()
+    cache.store(stored, "answer for the stored question")
+    assert cache.lookup(asked) == (None, None)
+
+
+def test_signature_keeps_place_order():
+    places, _ = signature("road trip from Delhi to Manali")
+    reversed_places, _ = signature("road trip from Manali to Delhi")
+    assert places and places == tuple(reversed(reversed_places))
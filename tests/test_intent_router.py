@@ -0,0 +1,55 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+from functions.intent_router import FARE, LLM, OFF_TOPIC, SCHEDULE, InvalidDate, answer, classify, extract_date
+
+TODAY = date(2024, 12, 20)
+
+
+def no_rows(*args):
+    raise AssertionError("listing queried for a question without a valid date")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("flights on 24 dec", date(2024, 12, 24)),
+    ("trains on 2025-01-05", date(2025, 1, 5)),
+    ("bus on 3/1", date(2025, 1, 3)),
+    ("train tomorrow", date(2024, 12, 21)),
+    ("flights to goa", None),
+])
+def test_extract_date(text, expected):
+    assert extract_date(text, today=TODAY) == expected
+
+
+def test_extract_date_rejects_impossible_dates():
+    with pytest.raises(InvalidDate):
+        extract_date("flights on 31/2", today=TODAY)
+
+
+def test_invalid_date_asks_for_the_date():
+    intent = classify("flights from Delhi to Mumbai on 31/2")
+    assert intent.name == SCHEDULE
+    assert intent.journey_date is None
+    assert "date" in answer(intent, rows_for=no_rows)
+
+
+def test_route_with_fare_is_a_fare_question():
+    intent = classify("cheapest flight from Delhi to Mumbai on 24 Dec")
+    assert intent.name == FARE
+    assert (intent.source.city, intent.destination.city) == ("Delhi", "Mumbai")
+
+
+@pytest.mark.parametrize("message", [
+    "I want to fly to Goa",
+    "Is it safe to take a train to Goa at night?",
+    "What should I pack for a bus trip to Manali?",
+])
+def test_mode_without_route_goes_to_the_llm(message):
+    assert classify(message).name == LLM
+
+
+def test_unrelated_question_is_off_topic():
+    assert classify("write me a poem about cats").name == OFF_TOPIC
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from functions.scheduler import INTERACTIVE, PREFETCH, ProviderScheduler, QuotaExceeded, QuotaLedger
+
+
+class MemoryLedger(QuotaLedger):
+    """Ledger that never touches the database."""
+
+    def ensure_loaded(self, bucket, period):
+        pass
+
+
+def make_scheduler(quota=8, share=0.25):
+    return ProviderScheduler(
+        limits={"flights": {"bucket": "api", "concurrency": 2}},
+        buckets={"api": {"rate": 0, "burst": 1, "quota": quota, "quota_period": "day"}},
+        ledger=MemoryLedger(),
+        shares={PREFETCH: share},
+    )
+
+
+def test_prefetch_share_is_enforced_and_interactive_still_runs():
+    scheduler = make_scheduler(quota=8, share=0.25)
+    for _ in range(2):
+        assert scheduler.run("flights", lambda: "ok", priority=PREFETCH, timeout=1) == "ok"
+    assert not scheduler.share_left("flights", PREFETCH)
+    with pytest.raises(QuotaExceeded):
+        scheduler.run("flights", lambda: "ok", priority=PREFETCH, timeout=1)
+
+    assert scheduler.share_left("flights", INTERACTIVE)
+    assert scheduler.run("flights", lambda: "ok", priority=INTERACTIVE, timeout=1) == "ok"
+
+    bucket = scheduler.stats()["buckets"]["api"]
+    assert bucket["used"] == 3
+    assert bucket["shares"]["prefetch"] == {"allowed": 2, "used": 2}
+
+
+def test_bucket_quota_still_applies_to_every_priority():
+    scheduler = make_scheduler(quota=2, share=1.0)
+    scheduler.run("flights", lambda: None, priority=INTERACTIVE, timeout=1)
+    scheduler.run("flights", lambda: None, priority=INTERACTIVE, timeout=1)
+    with pytest.raises(QuotaExceeded):
+        scheduler.run("flights", lambda: None, priority=PREFETCH, timeout=1)
+    with pytest.raises(QuotaExceeded):
+        scheduler.run("flights", lambda: None, priority=INTERACTIVE, timeout=1)
+
+
+def test_unlimited_bucket_has_no_share():
+    scheduler = make_scheduler(quota=0)
+    for _ in range(5):
+        scheduler.run("flights", lambda: None, priority=PREFETCH, timeout=1)
+    assert scheduler.share_left("flights", PREFETCH)
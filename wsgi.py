@@ -0,0 +1,8 @@
+"""
+WSGI entry point: `gunicorn wsgi:app`. Runs the startup work (schema
+migrations, background jobs) once when the worker loads, before it takes
+requests.
+"""
+from app import app, start_app
+
+start_app()